@@ -33,8 +33,10 @@ class Account:
         self.__Storage: TypingStorage = importer.Storage(
             self.STORAGE_ROOT, 
             __file__, 
-            self._save_storage, 
-            self._open_storage
+            None, 
+            self._open_storage,
+            write_behind = 0.5,
+            codec = "json"
         )
         self.__user_data: Dict[str, Any] = self.__Storage.open(
             self.__user_storage_path, 
@@ -55,11 +57,6 @@ class Account:
             Log.Error(f"Unexpected error opening storage: {e}")
             return {}
 
-    @staticmethod
-    def _save_storage(data: Dict[str, Any]) -> str:
-        """Helper method to save storage data."""
-        return json.dumps(data)
-
     def save(self) -> None:
         """Save the user data to storage."""
         self.__permission.save(self.__user_pass)
@@ -180,4 +177,4 @@ class Account:
 
         Log.Info("Mot de passe changer.")
 # Version Globale: v00.00.00.pl
-# Version du fichier: v00.00.00.19
+# Version du fichier: v00.00.00.1b
@@ -23,9 +23,6 @@ def OpenStorage(data: str) -> dict:
         print(e)
         return {}
 
-def SaveStorage(data: dict) -> str:
-    return json.dumps(data)
-
 class Session:
     def __init__(self, account: Account, duration_minutes: int = 30, **attrs):
         self.__account      = account
@@ -60,7 +57,7 @@ class LoginManager:
         if not hasattr(importer, "Storage") or importer.Storage is None:
             raise ValueError("Storage is not available.")
 
-        self.__Storage: TypingStorage = importer.Storage("var/slazhe-users", __file__, SaveStorage, OpenStorage, True)
+        self.__Storage: TypingStorage = importer.Storage("var/slazhe-users", __file__, None, OpenStorage, True, codec = "json", zdict = True)
         self.__sessions_by_token: dict[str, Session] = {}
 
     def __hash_password(self, password: str) -> str:
@@ -104,9 +101,19 @@ class LoginManager:
 
             self.__Storage.save(Users, "users.slze")
 
+        password: str = account.hash_password
+
         account.save()
         account.close()
 
+        # The deferred saves still need the user's key, it is dropped once they are written
+        self.__Storage.flush()
+
+        from Slazhe.SlazheModules import importer as SlazheImporter
+
+        if getattr(SlazheImporter, "SlazheCrypto", False):
+            SlazheImporter.SlazheCrypto().forget_key(password)
+
         del self.__sessions_by_token[token]
 
     def get_account_from_token(self, token: str) -> Optional[Account]:
@@ -118,4 +125,4 @@ class LoginManager:
 
         return None
 # Version Globale: v00.00.00.pl
-# Version du fichier: v00.00.00.1c
+# Version du fichier: v00.00.00.1f
@@ -22,10 +22,6 @@ def _open_storage(data: str) -> Dict[str, Any]:
         Log.Error(f"Unexpected error opening storage: {e}")
         return {}
 
-def _save_storage(data: Dict[str, Any]) -> str:
-    """Helper method to save storage data."""
-    return json.dumps(data)
-
 class PermissionManager:
     def __init__(self, user_uuid: str, password: str):
         Log.Info(f"Utilisateur {user_uuid} a ouvert ses permissions.")
@@ -37,13 +33,15 @@ class PermissionManager:
 
         self.__user_uuid = user_uuid
 
-        self.__Storage: TypingStorage = importer.Storage("var/slazhe-users", __file__, _save_storage, _open_storage, True)
+        self.__Storage: TypingStorage = importer.Storage("var/slazhe-users", __file__, None, _open_storage, True, write_behind = 0.5, codec = "json", zdict = True)
         self.__permissions_info: dict[int, dict[str, str]] = self.__Storage.open("permission.slze", {})
 
-        self.__user_permission_ids: list[int] = self.__Storage.open(self.__user_permission_path, {}, password).get("permission", [])
+        # Keep the opened object, its dirty tracking lets save() skip the write when nothing changed
+        self.__user_permissions: dict[str, list[int]] = self.__Storage.open(self.__user_permission_path, {}, password)
+        self.__user_permission_ids: list[int] = self.__user_permissions.setdefault("permission", [])
 
     def save(self, password: str) -> None:
-        self.__Storage.save({"permission": self.__user_permission_ids}, self.__user_permission_path, password)
+        self.__Storage.save(self.__user_permissions, self.__user_permission_path, password)
 
     def has_permission(self, permission_id: str) -> bool:
         return permission_id in self.__user_permission_ids
@@ -111,4 +109,4 @@ def require_permission(*required_ids: str, callback_pm: Callable[[PermissionMana
         return wrapper
     return decorator
 # Version Globale: v00.00.00.pl
-# Version du fichier: v00.00.00.06
+# Version du fichier: v00.00.00.0a
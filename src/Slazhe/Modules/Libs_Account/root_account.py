@@ -19,9 +19,6 @@ def gen_string(length: int = 8) -> str:
 
     return result
 
-from typing import Dict, Any
-
-import json
 import hashlib
 import uuid
 
@@ -79,9 +76,6 @@ All_Permissions: dict[str, dict[str, str]] = {
     "49": {"name": "create_permission", "description": "Pour ajouter une nouvelle permission."}
 }
 
-def _save_storage(data: Dict[str, Any]) -> str:
-    return json.dumps(data)
-
 def root_account():
     if not hasattr(importer, "Storage") or importer.Storage is None:
         raise ValueError("Storage is not available.")
@@ -92,12 +86,12 @@ def root_account():
 
     path: str = "var/slazhe-users"
 
-    UserStorage: TypingStorage = importer.Storage(path, "login.py", _save_storage, encrypt = False)
+    UserStorage: TypingStorage = importer.Storage(path, "login.py", encrypt = False, codec = "json")
     UserStorage.save({
         "root": { "password_hash": root_password_hash, "uuid": root_uuid }
     }, "users.slze")
 
-    AccountStorage: TypingStorage = importer.Storage(path, "account.py", _save_storage, encrypt = False)
+    AccountStorage: TypingStorage = importer.Storage(path, "account.py", encrypt = False, codec = "json")
     AccountStorage.save({
         "name": "root",
         "id": "0",
@@ -108,8 +102,8 @@ def root_account():
 
     Log.Info("Le mot de passe root est: ", root_password)
 
-    Permissions: TypingStorage = importer.Storage(path, "permission.py", _save_storage, encrypt = False)
+    Permissions: TypingStorage = importer.Storage(path, "permission.py", encrypt = False, codec = "json")
     Permissions.save(All_Permissions, "permission.slze")
     Permissions.save({"permission": list(All_Permissions.keys())}, f"users-permission/{root_uuid}.slze", root_password_hash)
 # Version Globale: v00.00.00.pl
-# Version du fichier: v00.00.00.0o
+# Version du fichier: v00.00.00.0p
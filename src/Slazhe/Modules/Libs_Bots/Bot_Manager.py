@@ -21,9 +21,11 @@ class BotManager:
         if cls.__instance is None:
             cls.__instance = super().__new__(cls)
             cls.__Storage: TypingStorage = importer.Storage(f"var/Slazhe-Bots/", __file__,
-                cls.__save_storage,
+                None,
                 cls.__open_storage,
-                True
+                True,
+                write_behind = 0.5,
+                codec = "json"
                 )
             cls.__bots: dict[str, SlazheBot] = {}
 
@@ -75,7 +77,7 @@ class BotManager:
 
         bot_storage: TypingStorage = importer.Storage(
             f"var/Slazhe-Bots/{bot_uuid}/", bot_uuid,
-            self.__save_storage, self.__open_storage
+            None, self.__open_storage, codec = "json"
         )
 
         bot_storage.save({
@@ -102,8 +104,7 @@ class BotManager:
         
         if uuid in self.__bots:
             Bot: SlazheBot = self.__bots[uuid]
-            if Bot.started:
-                Bot.stop()
+            Bot.close()
 
             del self.__bots[uuid]
 
@@ -114,6 +115,8 @@ class BotManager:
             self.__Storage.save(Bots, 'managers.slze')
 
         path_bot: str = f"var/Slazhe-Bots/{uuid}/"
+        importer.Storage.release(path_bot)
+
         if importer.Storage.exists(path_bot):
             shutil.rmtree(path_bot)
 
@@ -122,10 +125,8 @@ class BotManager:
 
         if not bots.get(uuid, False):
             return
-        
-        bots[uuid] = { "start-at-boot": start }
 
-        self.__Storage.save(bots, 'managers.slze')
+        self.__Storage.patch('managers.slze', uuid, { "start-at-boot": start })
 
     @staticmethod
     def __open_storage(data: str) -> Dict[str, Any]:
@@ -139,10 +140,5 @@ class BotManager:
             Log.Error(f"Unexpected error opening storage: {e}")
             return {}
 
-    @staticmethod
-    def __save_storage(data: Dict[str, Any]) -> str:
-        """Helper method to save storage data."""
-        return json.dumps(data)
-
 # Version Globale: v00.00.00.pl
-# Version du fichier: v00.00.00.0t
+# Version du fichier: v00.00.00.10
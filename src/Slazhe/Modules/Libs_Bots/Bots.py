@@ -35,7 +35,7 @@ class SlazheBot:
         self.__uuid: str = uuid
         self.__Storage: TypingStorage = importer.Storage(
             f"var/Slazhe-Bots/{self.__uuid}/", self.__uuid,
-            self.__save_storage, self.__open_storage, True
+            None, self.__open_storage, True, codec = "json"
         )
 
         # Bot information
@@ -237,6 +237,13 @@ class SlazheBot:
 
         Log.Info(f"Bot {self.__uuid} stopping...")
 
+    def close(self) -> None:
+        """Stop the bot and release the files it keeps open (prefixes database)."""
+        if self.__started:
+            self.stop()
+
+        self.__bot_prefixes.close()
+
     # --- Event Listeners ---
     async def __on_ready(self) -> None:
         self.__is_ready = True
@@ -257,7 +264,7 @@ class SlazheBot:
             self.name = self.__discord_client.user.name
             self.id   = self.__discord_client.user.id
 
-            self.save()
+            await self.asave()
 
         self.__bot_cogloader.sync(self.__token)
         for guild in self.__discord_client.guilds:
@@ -279,14 +286,13 @@ class SlazheBot:
             Log.Error(f"Unexpected error opening storage: {e}")
             return {}
 
-    @staticmethod
-    def __save_storage(data: Dict[str, Any]) -> str:
-        Log.Debug("Saving storage data...")
-        return json.dumps(data)
-
     def save(self) -> bool:
         Log.Info("Saving bot data...")
         return self.__Storage.save(self.__information, "main.slze")
 
+    async def asave(self) -> bool:
+        Log.Info("Saving bot data...")
+        return await self.__Storage.asave(self.__information, "main.slze")
+
 # Version Globale: v00.00.00.pl
-# Version du fichier: v00.00.00.55
+# Version du fichier: v00.00.00.5a
@@ -0,0 +1,45 @@
+from typing import Iterable, Optional
+
+class PrefixMatcher:
+    """
+    Compiled set of prefixes answering "which is the longest prefix of this message".
+
+    Prefixes are bucketed by their first character, each bucket keeps one set
+    per prefix length and the lengths sorted longest first, so a lookup costs
+    one dict access plus one slice per distinct length in the bucket no matter
+    how many prefixes are active.
+    """
+
+    __slots__ = ("__buckets",)
+
+    def __init__(self, *scopes: Iterable[str]) -> None:
+        buckets: dict[str, dict[int, set[str]]] = {}
+
+        for scope in scopes:
+            for prefix in scope:
+                if not prefix:
+                    continue
+
+                buckets.setdefault(prefix[0], {}).setdefault(len(prefix), set()).add(prefix)
+
+        self.__buckets: dict[str, tuple[tuple[int, frozenset[str]], ...]] = {
+            first: tuple((length, frozenset(prefixes)) for length, prefixes in sorted(lengths.items(), reverse = True))
+            for first, lengths in buckets.items()
+        }
+
+    def match(self, content: str) -> Optional[str]:
+        bucket = self.__buckets.get(content[:1])
+
+        if bucket is None:
+            return None
+
+        for length, prefixes in bucket:
+            prefix: str = content[:length]
+
+            if prefix in prefixes:
+                return prefix
+
+        return None
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.01
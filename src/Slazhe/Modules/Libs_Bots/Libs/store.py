@@ -0,0 +1,100 @@
+from typing     import Any, Iterable, Optional
+from threading  import Lock
+
+import sqlite3
+import os
+
+Key = tuple[str, str]
+
+class PrefixStore:
+    """
+    Every prefix of a bot (client, guilds and users) in one SQLite database.
+
+    Rows are indexed by (scope, owner), the scope being "client", "guild" or
+    "user" and the owner the guild or user id ("" for the client). The
+    database runs in WAL mode so the bot thread can read while the CLI writes.
+    """
+
+    def __init__(self, path: str, name: str = "prefixes.db") -> None:
+        os.makedirs(path, 777, exist_ok = True)
+
+        self.path: str = os.path.join(path, name)
+
+        self.__lock: Lock = Lock()
+        self.__db: sqlite3.Connection = sqlite3.connect(self.path, check_same_thread = False, isolation_level = None)
+
+        with self.__lock:
+            self.__db.execute("PRAGMA journal_mode=WAL")
+            self.__db.execute("PRAGMA synchronous=NORMAL")
+            self.__db.execute(
+                "CREATE TABLE IF NOT EXISTS prefixes ("
+                "scope TEXT NOT NULL, owner TEXT NOT NULL, uuid TEXT NOT NULL, "
+                "prefix TEXT NOT NULL, active INTEGER NOT NULL, created_by TEXT, create_at TEXT, "
+                "PRIMARY KEY (scope, owner, uuid))"
+            )
+            self.__db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def keys(self) -> set[Key]:
+        with self.__lock:
+            return set(self.__db.execute("SELECT DISTINCT scope, owner FROM prefixes").fetchall())
+
+    def load(self, key: Key) -> dict[str, dict[str, Any]]:
+        with self.__lock:
+            rows = self.__db.execute(
+                "SELECT uuid, prefix, active, created_by, create_at FROM prefixes WHERE scope = ? AND owner = ?", key
+            ).fetchall()
+
+        return {
+            prefix_uuid: {
+                "created_by":   created_by,
+                "create_at":    create_at,
+                "prefix":       prefix,
+                "active":       bool(active)
+            }
+            for prefix_uuid, prefix, active, created_by, create_at in rows
+        }
+
+    def save(self, key: Key, prefixes: dict[str, dict[str, Any]]) -> bool:
+        return self.save_many([(key, prefixes)])
+
+    def save_many(self, items: Iterable[tuple[Key, dict[str, dict[str, Any]]]]) -> bool:
+        """Replace the prefixes of every given key in a single transaction."""
+        try:
+            with self.__lock:
+                self.__db.execute("BEGIN IMMEDIATE")
+                try:
+                    for key, prefixes in items:
+                        self.__db.execute("DELETE FROM prefixes WHERE scope = ? AND owner = ?", key)
+                        self.__db.executemany(
+                            "INSERT INTO prefixes (scope, owner, uuid, prefix, active, created_by, create_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            [
+                                (*key, prefix_uuid, value.get("prefix", ""), int(bool(value.get("active", False))), value.get("created_by"), value.get("create_at"))
+                                for prefix_uuid, value in prefixes.items()
+                            ]
+                        )
+                except Exception:
+                    self.__db.execute("ROLLBACK")
+                    raise
+                else:
+                    self.__db.execute("COMMIT")
+        except sqlite3.Error:
+            return False
+
+        return True
+
+    def get_meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        with self.__lock:
+            row = self.__db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+
+        return default if row is None else row[0]
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self.__lock:
+            self.__db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__db.close()
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.01
@@ -7,16 +7,20 @@ from Slazhe.Modules import importer
 if getattr(importer, 'Storages', None):
     from Slazhe.Modules.Storage import Storage as TypingStorage
 
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 import json
 import uuid
+import os
 
 from datetime import datetime
 
 from discord.ext import commands
 import discord
 
+from .Libs.matcher import PrefixMatcher
+from .Libs.store   import PrefixStore, Key
+
 class Prefixes:
     def __init__(self, client: Any):
         self.__Client: Any      = client
@@ -25,7 +29,24 @@ class Prefixes:
         if not hasattr(importer, "Storage") or importer.Storage is None:
             raise ValueError("Storage is not available.")
 
-        self.__Storage: TypingStorage = importer.Storage(f"var/Slazhe-Bots/{self.__Client_uuid}/Prefixes/", __file__, self.__save_storage, self.__open_storage)
+        self.__Storage: TypingStorage = importer.Storage(f"var/Slazhe-Bots/{self.__Client_uuid}/Prefixes/", __file__, None, self.__open_storage, backend = "file")
+        self.__Store: PrefixStore = PrefixStore(self.__Storage.path)
+
+        self.__migrate()
+
+        # key -> prefixes, and key -> active prefixes (read by run on every message)
+        self.__cache: dict[Key, dict[str, dict[str, Any]]] = {}
+        self.__active: dict[Key, list[str]] = {}
+
+        # Keys present in the store, anything else has no prefix without querying it
+        self.__keys: set[Key] = self.__Store.keys() | {("client", "")}
+
+        # key -> compiled matcher, a guild matcher also holds the client prefixes
+        self.__matchers: dict[Key, PrefixMatcher] = {}
+
+    def close(self) -> None:
+        """Close the prefix database, the bot folder can be removed afterwards."""
+        self.__Store.close()
 
     # ---------- Storage ----------
 
@@ -41,15 +62,94 @@ class Prefixes:
             Log.Error(f"Unexpected error opening storage: {e}")
             return {}
 
-    @staticmethod
-    def __save_storage(data: Dict[str, Any]) -> str:
-        """Helper method to save storage data."""
-        return json.dumps(data)
+    def __migrate(self) -> None:
+        """Move the legacy layout (client-prefixes.slze, Guilds/{id}.slze, Users/{id}.slze) into the store, once."""
+        if self.__Store.get_meta("migrated"):
+            return
+
+        legacy: list[str] = []
+        items: list[tuple[Key, dict[str, dict[str, Any]]]] = []
+
+        if self.__Storage.exists(os.path.join(self.__Storage.path, "client-prefixes.slze")):
+            legacy.append("client-prefixes.slze")
+            items.append((("client", ""), self.__Storage.open("client-prefixes.slze", {})))
+
+        for folder, scope in (("Guilds", "guild"), ("Users", "user")):
+            try:
+                with os.scandir(os.path.join(self.__Storage.path, folder)) as entries:
+                    names: list[str] = [entry.name for entry in entries if entry.is_file() and entry.name.endswith(".slze")]
+            except FileNotFoundError:
+                continue
+
+            legacy.append(folder)
+            items.extend(((scope, name[:-len(".slze")]), self.__Storage.open(f"{folder}/{name}", {})) for name in names)
+
+        if items and not self.__Store.save_many(items):
+            Log.Error(f"Failed to migrate the prefixes of {self.__Client_uuid}, keeping the legacy files.")
+            return
+
+        self.__Store.set_meta("migrated", str(datetime.now()))
+
+        for name in legacy:
+            try:
+                os.replace(os.path.join(self.__Storage.path, name), os.path.join(self.__Storage.path, f"{name}.migrated"))
+            except OSError as e:
+                Log.Warn(f"Unable to rename the legacy prefix path {name}: {e}")
+
+        if items:
+            Log.Info(f"Migrated {len(items)} prefix files of {self.__Client_uuid} to {self.__Store.path}.")
+
+    # ---------- Cache ----------
+
+    def __load(self, key: Key) -> dict[str, dict[str, Any]]:
+        prefixes: dict[str, dict[str, Any]] = self.__cache.get(key)
+
+        if prefixes is None:
+            prefixes = self.__cache[key] = self.__Store.load(key)
+            self.__index(key)
+
+        return prefixes
+
+    def __index(self, key: Key) -> None:
+        self.__active[key] = [
+            value.get("prefix") for value in self.__cache[key].values()
+            if value.get("active", False) and value.get("prefix", False)
+        ]
+
+    def __commit(self, key: Key, prefixes: dict[str, dict[str, Any]]) -> bool:
+        if not self.__Store.save(key, prefixes):
+            # The cached copy no longer matches the store, reload it on next access.
+            self.__cache.pop(key, None)
+            self.__active.pop(key, None)
+            return False
+
+        self.__keys.add(key)
+        self.__index(key)
+
+        if key[0] == "client":
+            self.__matchers.clear()
+        else:
+            self.__matchers.pop(key, None)
+
+        return True
+
+    def __matcher(self, key: Key) -> PrefixMatcher:
+        matcher: PrefixMatcher = self.__matchers.get(key)
+
+        if matcher is None:
+            if key[0] == "guild":
+                matcher = PrefixMatcher(self.__get_prefix(("client", "")), self.__get_prefix(key))
+            else:
+                matcher = PrefixMatcher(self.__get_prefix(key))
+
+            self.__matchers[key] = matcher
+
+        return matcher
 
     # ---------- Add ----------
 
-    def __add_prefix(self, file: str, prefix: str, create_at: str, created_by: str, active: bool) -> bool:
-        prefixes: dict[str, dict[str, Any]] = self.__Storage.open(file, {})
+    def __add_prefix(self, key: Key, prefix: str, create_at: str, created_by: str, active: bool) -> bool:
+        prefixes: dict[str, dict[str, Any]] = self.__load(key)
         default_prefixes: list[str] = [value.get("prefix", "") for value in prefixes.values()]
 
         if prefix in default_prefixes:
@@ -66,107 +166,141 @@ class Prefixes:
             "active":       active
         }
 
-        return self.__Storage.save(prefixes, file)
+        return self.__commit(key, prefixes)
     def client_add_prefix(self, prefix: str, create_at: str = str(datetime.now()), created_by: str = "None", active: bool = True) -> bool:
-        return self.__add_prefix("client-prefixes.slze", prefix, create_at, created_by, active)
+        return self.__add_prefix(("client", ""), prefix, create_at, created_by, active)
     def guild_add_prefix(self, id: str, prefix: str, create_at: str = str(datetime.now()), created_by: str = "None", active: bool = True) -> bool:
-        return self.__add_prefix(f"Guilds/{id}.slze", prefix, create_at, created_by, active)
+        return self.__add_prefix(("guild", str(id)), prefix, create_at, created_by, active)
     def user_add_prefix(self, id: str, prefix: str, create_at: str = str(datetime.now()), created_by: str = "None", active: bool = True) -> bool:
-        return self.__add_prefix(f"Users/{id}.slze", prefix, create_at, created_by, active)
+        return self.__add_prefix(("user", str(id)), prefix, create_at, created_by, active)
 
     # ---------- Get ----------
 
-    def __get_prefix(self, file: str) -> list[str]:
-        prefixes: dict[str, dict[str, Any]] = self.__Storage.open(file, {})
-        result: list[str] = []
+    def __get_prefix(self, key: Key) -> list[str]:
+        result: list[str] = self.__active.get(key)
+
+        if result is None:
+            if key not in self.__keys:
+                return []
 
-        for value in prefixes.values():
-            if value.get("active", False) and value.get("prefix", False):
-                result.append(value.get("prefix"))
+            self.__load(key)
+            result = self.__active[key]
 
         return result
     def client_get_prefix(self) -> list[str]:
-        return self.__get_prefix("client-prefixes.slze")
+        return list(self.__get_prefix(("client", "")))
     def guild_get_prefix(self, id: str) -> list[str]:
-        return self.__get_prefix(f"Guilds/{id}.slze")
+        return list(self.__get_prefix(("guild", str(id))))
     def user_get_prefix(self, id: str) -> list[str]:
-        return self.__get_prefix(f"Users/{id}.slze")
+        return list(self.__get_prefix(("user", str(id))))
 
     # ---------- Del ----------
 
-    def __del_prefix(self, file: str, prefix: str) -> bool:
-        prefixes: dict[str, dict[str, Any]] = self.__Storage.open(file, {})
+    def __del_prefix(self, key: Key, prefix: str) -> bool:
+        prefixes: dict[str, dict[str, Any]] = self.__load(key)
         default_prefixes: list[str] = [value.get("prefix", "") for value in prefixes.values()]
 
         if prefix not in default_prefixes:
             return True
 
-        for key, value in (prefixes.copy()).items():
+        for prefix_uuid, value in (prefixes.copy()).items():
             if value.get("prefix", "") == prefix:
-                del prefixes[key]
+                del prefixes[prefix_uuid]
 
-        return self.__Storage.save(prefixes, file)
+        return self.__commit(key, prefixes)
     def client_del_prefix(self, prefix: str) -> bool:
-        return self.__del_prefix("client-prefixes.slze", prefix)
+        return self.__del_prefix(("client", ""), prefix)
     def guild_del_prefix(self, id: str, prefix: str) -> bool:
-        return self.__del_prefix(f"Guilds/{id}.slze", prefix)
+        return self.__del_prefix(("guild", str(id)), prefix)
     def user_del_prefix(self, id: str, prefix: str) -> bool:
-        return self.__del_prefix(f"Users/{id}.slze", prefix)
+        return self.__del_prefix(("user", str(id)), prefix)
 
     # ---------- enable ----------
 
-    def __enable_prefix(self, file: str, prefix: str) -> bool:
-        prefixes: dict[str, dict[str, Any]] = self.__Storage.open(file, {})
+    def __enable_prefix(self, key: Key, prefix: str) -> bool:
+        prefixes: dict[str, dict[str, Any]] = self.__load(key)
         default_prefixes: list[str] = [value.get("prefix", "") for value in prefixes.values()]
 
         if prefix not in default_prefixes:
             return False
 
-        for key, value in (prefixes.copy()).items():
+        for prefix_uuid, value in (prefixes.copy()).items():
             if value.get("prefix", "") == prefix:
-                prefixes[key]["active"] = True
+                prefixes[prefix_uuid]["active"] = True
 
-        return self.__Storage.save(prefixes, file)
+        return self.__commit(key, prefixes)
     def client_enable_prefix(self, prefix: str) -> bool:
-        return self.__enable_prefix("client-prefixes.slze", prefix)
+        return self.__enable_prefix(("client", ""), prefix)
     def guild_enable_prefix(self, id: str, prefix: str) -> bool:
-        return self.__enable_prefix(f"Guilds/{id}.slze", prefix)
+        return self.__enable_prefix(("guild", str(id)), prefix)
     def user_enable_prefix(self, id: str, prefix: str) -> bool:
-        return self.__enable_prefix(f"Users/{id}.slze", prefix)
+        return self.__enable_prefix(("user", str(id)), prefix)
 
     # ---------- disable ----------
 
-    def __disable_prefix(self, file: str, prefix: str) -> bool:
-        prefixes: dict[str, dict[str, Any]] = self.__Storage.open(file, {})
+    def __disable_prefix(self, key: Key, prefix: str) -> bool:
+        prefixes: dict[str, dict[str, Any]] = self.__load(key)
         default_prefixes: list[str] = [value.get("prefix", "") for value in prefixes.values()]
 
         if prefix not in default_prefixes:
             return False
 
-        for key, value in (prefixes.copy()).items():
+        for prefix_uuid, value in (prefixes.copy()).items():
             if value.get("prefix", "") == prefix:
-                prefixes[key]["active"] = False
+                prefixes[prefix_uuid]["active"] = False
 
-        return self.__Storage.save(prefixes, file)
+        return self.__commit(key, prefixes)
     def client_disable_prefix(self, prefix: str) -> bool:
-        return self.__disable_prefix("client-prefixes.slze", prefix)
+        return self.__disable_prefix(("client", ""), prefix)
     def guild_disable_prefix(self, id: str, prefix: str) -> bool:
-        return self.__disable_prefix(f"Guilds/{id}.slze", prefix)
+        return self.__disable_prefix(("guild", str(id)), prefix)
     def user_disable_prefix(self, id: str, prefix: str) -> bool:
-        return self.__disable_prefix(f"Users/{id}.slze", prefix)
+        return self.__disable_prefix(("user", str(id)), prefix)
 
-    async def run(self, Client: commands.Bot, Message: discord.Message) -> list[str]:
-        Result: list[str] = []
-
-        Result.extend(self.client_get_prefix())
+    def __message_keys(self, Message: discord.Message) -> tuple[Key, Optional[Key]]:
+        """The guild key (or the client one) and the user key of a message, if they have prefixes."""
+        key: Key = ("client", "")
+        user_key: Optional[Key] = None
 
         if Message.guild and Message.guild.id:
-            Result.extend(self.guild_get_prefix(Message.guild.id))
+            guild_key: Key = ("guild", str(Message.guild.id))
+
+            if guild_key in self.__keys:
+                key = guild_key
 
         if Message.author and Message.author.id:
-            Result.extend(self.user_get_prefix(Message.author.id))
+            user_key = ("user", str(Message.author.id))
+
+            if user_key not in self.__keys:
+                user_key = None
+
+        return key, user_key
+
+    def __match(self, key: Key, user_key: Optional[Key], content: str) -> Optional[str]:
+        prefix: Optional[str] = self.__matcher(key).match(content)
+
+        if user_key is not None:
+            user_prefix: Optional[str] = self.__matcher(user_key).match(content)
+
+            if user_prefix and (prefix is None or len(user_prefix) > len(prefix)):
+                prefix = user_prefix
+
+        return prefix
+
+    def match(self, Message: discord.Message) -> Optional[str]:
+        """Return the longest client, guild or user prefix the message starts with."""
+        return self.__match(*self.__message_keys(Message), Message.content)
+
+    async def run(self, Client: commands.Bot, Message: discord.Message) -> list[str]:
+        key, user_key = self.__message_keys(Message)
+
+        if key in self.__matchers and (user_key is None or user_key in self.__matchers):
+            prefix: Optional[str] = self.__match(key, user_key, Message.content)
+        else:
+            # Scopes not cached yet are read from the store off the event loop.
+            prefix: Optional[str] = await self.__Storage.run_in_executor(self.__match, key, user_key, Message.content)
 
-        return Result
+        return [prefix] if prefix else []
 
 # Version Globale: v00.00.00.pl
-# Version du fichier: v00.00.00.0y
+# Version du fichier: v00.00.00.15
@@ -7,6 +7,7 @@ from .Question      import Page, PageManager, QuestionPage
 
 from .Page_ShowModules  import CliShowModules
 from .Page_Bots         import SlazheBots
+from .Page_Storage      import CliStorage
 
 from rich.table import Table
 
@@ -41,7 +42,8 @@ class SlazheLogin(SlazheCliModule):
             Page("Mon Profile", 2, self.profile),
             Page("Mes Bots", 3, SlazheBots, attrs={ "parent": self, "user_token": self.__UserToken, "login_manager": self.__Login_Manager }),
             Page("Page Admin", 4),
-            Page("Modules chargés", 5, CliShowModules, attrs={ "parent": self })
+            Page("Modules chargés", 5, CliShowModules, attrs={ "parent": self }),
+            Page("Stockage", 6, CliStorage, attrs={ "parent": self })
         ]
 
         page_manager = PageManager(pages, console=self.console, prompt=self.prompt, title=f"Bonjour {username}")
@@ -117,4 +119,4 @@ class SlazheLogin(SlazheCliModule):
         while not self.quit_edit_profile:
             page_manager.run()
 # Version Globale: v00.00.00.pl
-# Version du fichier: v00.00.00.13
+# Version du fichier: v00.00.00.14
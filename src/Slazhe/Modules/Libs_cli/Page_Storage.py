@@ -0,0 +1,135 @@
+from Slazhe import Logger
+
+Log = Logger(__package__)
+
+from .BaseCliModule import SlazheCliModule
+from .Question      import Page, PageManager, QuestionPage
+
+from rich.table import Table
+
+from Slazhe.Modules import importer
+
+if hasattr(importer, "Storage"):
+    from Slazhe.Modules.Storage import StorageMetrics
+
+class CliStorage(SlazheCliModule):
+    """
+    CLI module showing the storage metrics: hot files and slow stages.
+    """
+
+    def print_hot_files(self, count: str = "10") -> None:
+        """
+        Print the files read and written the most.
+
+        Args:
+            count (str): How many files to show.
+        """
+        table = Table(title="Fichiers les plus utilisés", width=self.console.width, title_style="")
+        table.add_column("Fichier", style="cyan", overflow="fold")
+
+        for column in ["Lectures", "Cache", "Écritures", "Lu", "Écrit", "Temps (ms)"]:
+            table.add_column(column, style="magenta", justify="right")
+
+        for File, values in StorageMetrics.hot(self.__count(count)):
+            table.add_row(
+                File, str(values["reads"]), str(values["cache_hits"]), str(values["writes"]),
+                self.__size(values["bytes_read"]), self.__size(values["bytes_written"]), f"{values['seconds'] * 1e3:.2f}"
+            )
+
+        self.console.print(table)
+
+    def print_slow_stages(self, count: str = "10") -> None:
+        """
+        Print the stages taking the most time.
+
+        Args:
+            count (str): How many stages to show.
+        """
+        table = Table(title="Étapes les plus lentes", width=self.console.width, title_style="")
+        table.add_column("Étape", style="cyan")
+
+        for column in ["Appels", "Octets", "Total (ms)", "Moyenne (µs)", "Max (ms)"]:
+            table.add_column(column, style="magenta", justify="right")
+
+        for stage, values in StorageMetrics.slowest(self.__count(count)):
+            table.add_row(
+                stage, str(values["calls"]), self.__size(values["bytes"]), f"{values['seconds'] * 1e3:.2f}",
+                f"{values['average'] * 1e6:.1f}", f"{values['slowest'] * 1e3:.2f}"
+            )
+
+        self.console.print(table)
+
+    def dump(self, file: str) -> None:
+        """
+        Write the metrics to a JSON file.
+
+        Args:
+            file (str): Where to write them.
+        """
+        try:
+            StorageMetrics.dump(file)
+        except OSError as e:
+            Log.Error(f"Unable to dump the storage metrics to {file}: {e}")
+            return self.parent.error(f"Impossible d'écrire {file}.")
+
+        Log.Info(f"Storage metrics dumped to {file}.")
+        self.console.print(f"[green]Métriques écrites dans {file}[/green]")
+
+    def reset(self) -> None:
+        """
+        Reset the metrics.
+        """
+        StorageMetrics.reset()
+        self.console.print("[green]Métriques remises à zéro[/green]")
+
+    def run(self) -> None:
+        """
+        Run the storage metrics loop.
+        """
+        if not hasattr(importer, "Storage"):
+            return self.parent.error("Le module Storage n'est pas chargé.")
+
+        self.quit = False
+
+        pages = [
+            Page("Menu", 1, self.parent_run),
+            Page("Fichiers les plus utilisés", 2, self.print_hot_files, [QuestionPage("Nombre de fichiers", "count", console=self.console, prompt=self.prompt)]),
+            Page("Étapes les plus lentes", 3, self.print_slow_stages, [QuestionPage("Nombre d'étapes", "count", console=self.console, prompt=self.prompt)]),
+            Page("Exporter les métriques (JSON)", 4, self.dump, [QuestionPage("Fichier", "file", console=self.console, prompt=self.prompt)]),
+            Page("Remettre à zéro", 5, self.reset)
+        ]
+
+        page_manager = PageManager(pages, console=self.console, prompt=self.prompt)
+
+        if not StorageMetrics.Enabled:
+            self.console.print("[yellow]Les métriques sont désactivées (SLAZHE_STORAGE_METRICS=0)[/yellow]")
+
+        self.print_slow_stages()
+        while not self.quit:
+            page_manager.run()
+
+    def parent_run(self) -> None:
+        """
+        Return to the parent CLI loop.
+        """
+        self.quit = True
+
+    @staticmethod
+    def __count(count: str) -> int:
+        try:
+            return max(1, int(count))
+        except ValueError:
+            return 10
+
+    @staticmethod
+    def __size(size: int) -> str:
+        for unit in ["o", "Ko", "Mo"]:
+            if size < 1024:
+                return f"{size:.0f} {unit}"
+
+            size /= 1024
+
+        return f"{size:.1f} Go"
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.01
@@ -1,37 +1,402 @@
-from typing import Callable, Any
+from typing import Callable, Any, Optional
+from collections.abc import MutableMapping, MutableSequence
+from weakref import WeakValueDictionary
+
+import hashlib, pickle, copy
 
 class EBase:
+    __slots__ = ()
+
     SlazheStorageFile: Callable
 
+# Sous-classes des types natifs, elles portent la donnée elle-même (pas de .value)
+# int, tuple et bytes refusent des __slots__ non vides, elles gardent un __dict__
+class EInt(int, EBase): pass
+class EFloat(float, EBase):         __slots__ = ("SlazheStorageFile",)
+class EComplex(complex, EBase):     __slots__ = ("SlazheStorageFile",)
+class ETuple(tuple, EBase): pass
+class EStr(str, EBase):             __slots__ = ("SlazheStorageFile",)
+class ESet(set, EBase):             __slots__ = ("SlazheStorageFile",)
+class EFrozenSet(frozenset, EBase): __slots__ = ("SlazheStorageFile",)
+class EBytes(bytes, EBase): pass
+class EByteArray(bytearray, EBase): __slots__ = ("SlazheStorageFile",)
+
+class ETracked(EBase):
+    """
+    EDict and EList: the dict or list decoded by Storage.open, held by
+    reference (value) and never copied to be handed out.
+
+    A payload shared with others (kept by ObjectCache, or the default given
+    to open) is copied on the first mutation only, copy on write: what the
+    cache holds never changes. A nested dict or list is handed out as an
+    EDict / EList over the very same object, its mutations mark the root
+    (the object returned by Storage.open) dirty. The root also keeps where it
+    was read or written last (its origin), it is only clean for that file,
+    storage key and password.
+
+    They are a MutableMapping / MutableSequence and not a dict / list
+    subclass (those can't wrap an existing object): type checks go through
+    collections.abc, the codecs and pickle store the object they wrap.
+    """
+
+    __slots__ = ("value", "SlazheStorageFile", "_root", "_shared", "_children", "_dirty", "_origin", "_digest", "__weakref__")
+
+    def __init__(self, value: Any, shared: bool = False) -> None:
+        self.value = value
+        self._root = None
+        self._shared = shared
+        self._children = None
+        self._dirty = False
+        self._origin = None
+        self._digest = None
+
+    def _track(self, value: Any) -> Any:
+        Tracker = _Trackers.get(type(value))
+        if Tracker is None:
+            return value
+
+        root = self if self._root is None else self._root
+
+        tracked = Tracker(value)
+        tracked._root = root
+
+        # Until the root is copied, its nested objects are the shared ones: they are moved along with it
+        if root._shared:
+            if root._children is None:
+                root._children = WeakValueDictionary()
+
+            root._children[id(tracked)] = tracked
+
+        return tracked
+
+    def _write(self) -> Any:
+        """The payload, ready to be modified: the root is copied if it is shared and marked dirty."""
+        root = self if self._root is None else self._root
+
+        if root._shared:
+            root._detach()
+
+        root._dirty = True
+        return self.value
+
+    def _detach(self) -> None:
+        children: list[ETracked] = list(self._children.values()) if self._children is not None else []
+
+        if children:
+            moved: dict[int, Any] = {}
+            self.value = _copy(self.value, moved)
+
+            for child in children:
+                child.value = moved[id(child.value)] if id(child.value) in moved else _copy(child.value, {})
+
+        else:
+            try:
+                self.value = pickle.loads(pickle.dumps(self.value, protocol = pickle.HIGHEST_PROTOCOL))
+            except Exception:
+                self.value = _copy(self.value, {})
+
+        self._shared = False
+        self._children = None
+
+    def __eq__(self, other: Any) -> bool:
+        return self.value == _payload(other)
+
+    def __ne__(self, other: Any) -> bool:
+        return self.value != _payload(other)
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return repr(self.value)
+
+    def __deepcopy__(self, memo: dict) -> Any:
+        return copy.deepcopy(self.value, memo)
+
+class EDict(ETracked, MutableMapping):
+    __slots__ = ()
+
+    def __init__(self, value: Optional[dict] = None, shared: bool = False) -> None:
+        super().__init__({} if value is None else value, shared)
+
+    def __getitem__(self, key: Any) -> Any:
+        return self._track(self.value[key])
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        self._write()[key] = _plain(value)
+
+    def __delitem__(self, key: Any) -> None:
+        del self._write()[key]
+
+    def __iter__(self):
+        return iter(self.value)
+
+    def __reversed__(self):
+        return reversed(self.value)
+
+    def __len__(self) -> int:
+        return len(self.value)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self.value
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        return self._track(self.value[key]) if key in self.value else default
+
+    def keys(self):
+        return self.value.keys()
+
+    def copy(self) -> dict:
+        # A shallow copy, its nested values are still those of this object
+        return dict(self)
+
+    __copy__ = copy
+
+    def __reduce__(self) -> tuple:
+        return (dict, (self.value,))
+
+    def setdefault(self, key: Any, default: Any = None) -> Any:
+        if key not in self.value:
+            self[key] = default
+
+        return self[key]
+
+    def pop(self, *args) -> Any:
+        return self._write().pop(*args)
+
+    def popitem(self) -> tuple:
+        return self._write().popitem()
+
+    def clear(self) -> None:
+        self._write().clear()
+
+    def update(self, *args, **kwargs) -> None:
+        items: dict = dict(*args, **kwargs)
+        self._write().update((key, _plain(value)) for key, value in items.items())
+
+    def __or__(self, other: Any) -> dict:
+        return {**self, **other}
+
+    def __ror__(self, other: Any) -> dict:
+        return {**other, **self}
+
+    def __ior__(self, other: Any):
+        self.update(other)
+        return self
+
+class EList(ETracked, MutableSequence):
+    __slots__ = ()
+
+    def __init__(self, value: Optional[list] = None, shared: bool = False) -> None:
+        super().__init__([] if value is None else value, shared)
+
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, slice):
+            return [self._track(value) for value in self.value[index]]
+
+        return self._track(self.value[index])
+
+    def __setitem__(self, index: Any, value: Any) -> None:
+        if isinstance(index, slice):
+            value = [_plain(item) for item in value]
+        else:
+            value = _plain(value)
+
+        self._write()[index] = value
+
+    def __delitem__(self, index: Any) -> None:
+        del self._write()[index]
+
+    def __iter__(self):
+        # By index and not over value: a copy on write during the loop has to be followed
+        index: int = 0
+
+        while index < len(self.value):
+            yield self._track(self.value[index])
+            index += 1
+
+    def __reversed__(self):
+        for index in range(len(self.value) - 1, -1, -1):
+            if index < len(self.value):
+                yield self._track(self.value[index])
+
+    def __len__(self) -> int:
+        return len(self.value)
+
+    def __contains__(self, value: Any) -> bool:
+        return _payload(value) in self.value
+
+    def __lt__(self, other: Any) -> bool:
+        return self.value < _payload(other)
+
+    def __le__(self, other: Any) -> bool:
+        return self.value <= _payload(other)
+
+    def __gt__(self, other: Any) -> bool:
+        return self.value > _payload(other)
+
+    def __ge__(self, other: Any) -> bool:
+        return self.value >= _payload(other)
+
+    def __add__(self, other: Any) -> list:
+        return list(self) + list(other)
+
+    def __radd__(self, other: Any) -> list:
+        return list(other) + list(self)
+
+    def __mul__(self, count: int) -> list:
+        return list(self) * count
+
+    __rmul__ = __mul__
+
+    def __iadd__(self, other: Any):
+        self.extend(other)
+        return self
+
+    def __imul__(self, count: int):
+        value: list = self._write()
+        value *= count
+        return self
+
+    def index(self, value: Any, *args) -> int:
+        return self.value.index(_payload(value), *args)
+
+    def count(self, value: Any) -> int:
+        return self.value.count(_payload(value))
+
+    def copy(self) -> list:
+        return list(self)
+
+    __copy__ = copy
+
+    def __reduce__(self) -> tuple:
+        return (list, (self.value,))
+
+    def append(self, value: Any) -> None:
+        self._write().append(_plain(value))
+
+    def extend(self, values: Any) -> None:
+        values = [_plain(value) for value in values]
+        self._write().extend(values)
+
+    def insert(self, index: int, value: Any) -> None:
+        self._write().insert(index, _plain(value))
+
+    def pop(self, *args) -> Any:
+        return self._write().pop(*args)
+
+    def remove(self, value: Any) -> None:
+        self._write().remove(_payload(value))
+
+    def clear(self) -> None:
+        self._write().clear()
+
+    def sort(self, *args, **kwargs) -> None:
+        self._write().sort(*args, **kwargs)
+
+    def reverse(self) -> None:
+        self._write().reverse()
+
+_Trackers: dict[type, Callable[[Any], ETracked]] = { dict: EDict, list: EList }
+
+# Never modified in place, a copy on write can share them
+_Immutable: tuple[type, ...] = (str, int, float, bool, type(None), bytes, complex)
+
+def _copy(value: Any, moved: dict[int, Any]) -> Any:
+    """Copy of a payload, moved maps the id of every dict and list copied to its copy."""
+    if type(value) is dict or type(value) is list:
+        if id(value) in moved:
+            return moved[id(value)]
+
+        if type(value) is dict:
+            copied: Any = {key: _copy(item, moved) for key, item in value.items()}
+        else:
+            copied: Any = [_copy(item, moved) for item in value]
+
+        moved[id(value)] = copied
+        return copied
+
+    if type(value) in _Immutable:
+        return value
+
+    return copy.deepcopy(value)
+
+def _payload(value: Any) -> Any:
+    """What a tracked object wraps, anything else as is (to compare with)."""
+    return value.value if isinstance(value, ETracked) else value
+
+def _plain(value: Any) -> Any:
+    """What is stored when value is put in a tracked object: the object it wraps, copied if it is shared."""
+    if not isinstance(value, ETracked):
+        return value
+
+    root = value if value._root is None else value._root
+    return _copy(value.value, {}) if root._shared else value.value
+
+def origin(storage: Any, File: str, password: Optional[str]) -> bytes:
+    """Digest of what an object read from or written to File is bound to: the file, the storage key and the password."""
+    key: Any = getattr(storage, 'slazhe_crypto_password', None) if getattr(getattr(storage, 'slazhe_crypto', None), 'SCrypto', None) is not None else None
+    return hashlib.blake2b(repr((File, key, password)).encode(), digest_size = 16).digest()
+
+def content_digest(data: bytes) -> bytes:
+    """Digest of an object as it is serialized, to tell whether it changed behind the tracking."""
+    return hashlib.blake2b(data, digest_size = 16).digest()
+
+def is_dirty(data: Any, origin: Optional[bytes] = None, digest: Optional[bytes] = None) -> bool:
+    """
+    Objects without tracking are always considered dirty, so are those with
+    another origin (and nested objects). Given the digest of what data
+    serializes to now, a clean object must also still match what was read or
+    written: changes made through .value or through a reference kept aside
+    aren't seen by the tracking.
+    """
+    if not isinstance(data, ETracked) or data._root is not None:
+        return True
+
+    if data._dirty or (origin is not None and data._origin != origin):
+        return True
+
+    return digest is not None and data._digest != digest
+
+def mark_clean(data: Any, clean: bool = True, origin: Optional[bytes] = None, digest: Optional[bytes] = None) -> None:
+    if isinstance(data, ETracked) and data._root is None:
+        data._dirty = not clean
+
+        if origin is not None:
+            data._origin = origin
+
+        data._digest = digest
+
+# Types qui ne peuvent pas être sous-classés, la valeur est référencée sans copie
+class EValue(EBase):
+    __slots__ = ("value", "SlazheStorageFile")
+
     def __init__(self, value: Any):
         self.value = value
 
     def __repr__(self):
         return f"{self.__class__.__name__}({self.value})"
 
-# Sous-classes des types natifs
-class EDict(dict, EBase): pass
-class EInt(int, EBase): pass
-class EFloat(float, EBase): pass
-class EComplex(complex, EBase): pass
-class EList(list, EBase): pass
-class ETuple(tuple, EBase): pass
-class ERange(EBase):
+class ERange(EValue):
+    __slots__ = ()
+
     def __init__(self, value: range):
         super().__init__(value)
 
-class EStr(str, EBase): pass
-class ESet(set, EBase): pass
-class EFrozenSet(frozenset, EBase): pass
-class EBytes(bytes, EBase): pass
-class EByteArray(bytearray, EBase): pass
-class EMemoryView(EBase):
-        def __init__(self, value: memoryview):
-            super().__init__(value)
-class EBool(EBase):
-        def __init__(self, value: bool):
-            super().__init__(value)
-class ENoneType(EBase):
+class EMemoryView(EValue):
+    __slots__ = ()
+
+    def __init__(self, value: memoryview):
+        super().__init__(value)
+
+class EBool(EValue):
+    __slots__ = ()
+
+    def __init__(self, value: bool):
+        super().__init__(value)
+
+class ENoneType(EValue):
+    __slots__ = ()
+
     def __init__(self, value=None):
         super().__init__(value)
 
@@ -53,11 +418,23 @@ CustomTyping: dict[str, Callable[[Any], EBase]] = {
     "set":  ESet,
 }
 
-def to_extended(data) -> EBase:
+def to_extended(data, shared: bool = False) -> EBase:
+    """
+    data in its extended type. A dict or a list is wrapped as it is, shared
+    tells it is kept elsewhere too (cache, default value): it is then copied
+    on its first mutation.
+    """
+    if isinstance(data, EBase):
+        return data
+
     T = type(data).__name__  # Récupère le nom du type en tant que chaîne
     if T not in CustomTyping:
         raise ValueError(f"Type '{T}' non pris en charge.")
+
+    if T in ("dict", "list"):
+        return CustomTyping[T](data, shared)
+
     return CustomTyping[T](data)
 
 # Version Globale: v00.00.00.pl
-# Version du fichier: v00.00.00.01
+# Version du fichier: v00.00.00.06
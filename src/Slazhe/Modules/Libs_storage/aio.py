@@ -0,0 +1,51 @@
+from typing             import Optional, Any
+from concurrent.futures import ThreadPoolExecutor
+from threading          import Lock
+from .CustomTypes       import EBase
+
+import asyncio
+import functools
+
+class StorageAsync:
+    """
+    Coroutine counterparts of open/save.
+
+    The file I/O, zlib and SlazheCrypto work run on a thread pool shared by
+    every Storage, so a bot's event loop keeps serving the gateway meanwhile.
+    """
+
+    Workers: int = 4
+
+    _executor: Optional[ThreadPoolExecutor] = None
+    _executor_lock: Lock = Lock()
+
+    @classmethod
+    def executor(cls) -> ThreadPoolExecutor:
+        with StorageAsync._executor_lock:
+            if StorageAsync._executor is None:
+                StorageAsync._executor = ThreadPoolExecutor(max_workers = StorageAsync.Workers, thread_name_prefix = "Slazhe-Storage")
+
+            return StorageAsync._executor
+
+    @classmethod
+    def set_workers(cls, workers: int) -> None:
+        """Resize the pool, running jobs finish on the previous one."""
+        with StorageAsync._executor_lock:
+            StorageAsync.Workers = max(1, workers)
+
+            if StorageAsync._executor is not None:
+                StorageAsync._executor.shutdown(wait = False)
+                StorageAsync._executor = None
+
+    async def run_in_executor(self, func: Any, *args: Any, **kwargs: Any) -> Any:
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor(), functools.partial(func, *args, **kwargs))
+
+    async def aopen(self, file: str, default: Optional[Any] = None, password: Optional[str] = None) -> EBase:
+        return await self.run_in_executor(self.open, file, default, password)
+
+    async def asave(self, data: EBase, file: Optional[str] = None, password: Optional[str] = None) -> bool:
+        return await self.run_in_executor(self.save, data, file, password)
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.01
@@ -0,0 +1,501 @@
+from Slazhe import Logger
+
+Log = Logger(__package__)
+
+from typing     import Optional
+from threading  import Lock
+from .writebehind import WriteBehind
+from .packed      import Pack
+from .header      import Header
+from typing       import Iterable
+
+import sqlite3, threading, mmap, zlib
+import os, time
+
+# (version, size), version being the mtime for files and a write stamp for rows
+Stat = tuple[int, int]
+
+class Backend:
+    """
+    Where a Storage keeps its encoded files.
+
+    Files are named by their absolute path (self.path + the storage's file
+    name), the same name the caches use. Missing files give None, failing
+    writes raise OSError.
+    """
+
+    name: str
+
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+
+    def stat(self, File: str) -> Optional[Stat]:
+        raise NotImplementedError
+
+    def read(self, File: str) -> Optional[tuple[bytes, Stat]]:
+        raise NotImplementedError
+
+    def head(self, File: str, size: int) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def map(self, File: str) -> Optional[tuple[memoryview, Stat]]:
+        """A read-only view of File without reading it in memory, None when the backend can't (read() then)."""
+        return None
+
+    def write(self, File: str, Data: bytes, fsync: str = 'batch') -> None:
+        raise NotImplementedError
+
+    def write_stream(self, File: str, FileHeader: Header, Chunks: Iterable[bytes], fsync: str = 'batch') -> int:
+        """
+        Writes FileHeader then the body given in chunks, the header's crc32
+        being the body's. Returns the size written. Backends that can't write
+        as the chunks come gather them and write() the whole.
+        """
+        Data: bytes = FileHeader.pack(b"".join(Chunks))
+        self.write(File, Data, fsync)
+
+        return len(Data)
+
+    def append(self, File: str, Data: bytes, fsync: str = 'batch') -> int:
+        """Appends Data to File (created if missing) and returns its new size."""
+        raise NotImplementedError
+
+    def write_file(self, File: str, Source: str, fsync: str = 'batch') -> None:
+        """
+        Puts the file Source in place of File, Source is consumed. Backends
+        that can't take a file as is read it whole and write() it.
+        """
+        with open(Source, 'rb') as IOFile:
+            self.write(File, IOFile.read(), fsync)
+
+        os.remove(Source)
+
+    def delete(self, File: str) -> None:
+        raise NotImplementedError
+
+    def exists(self, File: str) -> bool:
+        return self.stat(File) is not None
+
+    def names(self) -> list[str]:
+        """Every file stored under the storage's path, by absolute path."""
+        raise NotImplementedError
+
+class FileBackend(Backend):
+    """One file on disk per storage file, replaced atomically on write."""
+
+    name: str = "file"
+
+    def stat(self, File: str) -> Optional[Stat]:
+        try:
+            Result: os.stat_result = os.stat(File)
+        except FileNotFoundError:
+            return None
+
+        return Result.st_mtime_ns, Result.st_size
+
+    def read(self, File: str) -> Optional[tuple[bytes, Stat]]:
+        try:
+            IOFile = open(File, 'rb')
+        except FileNotFoundError:
+            return None
+
+        # The stat of the open handle matches the content we read, even if the file is replaced meanwhile
+        with IOFile:
+            Result: os.stat_result = os.fstat(IOFile.fileno())
+            return IOFile.read(), (Result.st_mtime_ns, Result.st_size)
+
+    def map(self, File: str) -> Optional[tuple[memoryview, Stat]]:
+        try:
+            IOFile = open(File, 'rb')
+        except FileNotFoundError:
+            return None
+
+        with IOFile:
+            Result: os.stat_result = os.fstat(IOFile.fileno())
+
+            if not Result.st_size:
+                return None
+
+            # The map outlives the handle and is unmapped with the last view on it
+            Map: mmap.mmap = mmap.mmap(IOFile.fileno(), 0, access = mmap.ACCESS_READ)
+
+        return memoryview(Map), (Result.st_mtime_ns, Result.st_size)
+
+    def head(self, File: str, size: int) -> Optional[bytes]:
+        try:
+            with open(File, 'rb') as IOFile:
+                return IOFile.read(size)
+        except FileNotFoundError:
+            return None
+
+    def write(self, File: str, Data: bytes, fsync: str = 'batch') -> None:
+        Path: str = os.path.dirname(File)
+
+        os.makedirs(Path, 777, exist_ok = True)
+
+        # Write beside the target then rename over it, a reader sees the old file or the new one, never a torn one
+        TempFile: str = f'{File}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+        try:
+            with open(TempFile, 'wb') as IOFile:
+                IOFile.write(Data)
+                IOFile.flush()
+
+                if fsync == 'always':
+                    os.fsync(IOFile.fileno())
+
+            os.replace(TempFile, File)
+        except OSError:
+            try:
+                os.remove(TempFile)
+            except OSError:
+                pass
+
+            raise
+
+        if fsync == 'always':
+            WriteBehind.fsync_directory(Path)
+        elif fsync == 'batch':
+            WriteBehind.sync_file(File)
+
+    def write_stream(self, File: str, FileHeader: Header, Chunks: Iterable[bytes], fsync: str = 'batch') -> int:
+        Path: str = os.path.dirname(File)
+
+        os.makedirs(Path, 777, exist_ok = True)
+
+        TempFile: str = f'{File}.{os.getpid()}.{threading.get_ident()}.tmp'
+        Crc: int = 0
+
+        try:
+            with open(TempFile, 'wb') as IOFile:
+                # The crc32 is only known at the end, the header is written again then
+                IOFile.write(FileHeader.head(0))
+
+                for Chunk in Chunks:
+                    IOFile.write(Chunk)
+                    Crc = zlib.crc32(Chunk, Crc)
+
+                Size: int = IOFile.tell()
+
+                IOFile.seek(0)
+                IOFile.write(FileHeader.head(Crc))
+                IOFile.flush()
+
+                if fsync == 'always':
+                    os.fsync(IOFile.fileno())
+
+            os.replace(TempFile, File)
+        except BaseException:
+            try:
+                os.remove(TempFile)
+            except OSError:
+                pass
+
+            raise
+
+        if fsync == 'always':
+            WriteBehind.fsync_directory(Path)
+        elif fsync == 'batch':
+            WriteBehind.sync_file(File)
+
+        return Size
+
+    def append(self, File: str, Data: bytes, fsync: str = 'batch') -> int:
+        os.makedirs(os.path.dirname(File), 777, exist_ok = True)
+
+        with open(File, 'ab') as IOFile:
+            IOFile.write(Data)
+            IOFile.flush()
+
+            if fsync == 'always':
+                os.fsync(IOFile.fileno())
+            elif fsync == 'batch':
+                WriteBehind.sync_file(File)
+
+            return IOFile.tell()
+
+    def write_file(self, File: str, Source: str, fsync: str = 'batch') -> None:
+        Path: str = os.path.dirname(File)
+
+        os.makedirs(Path, 777, exist_ok = True)
+
+        if fsync == 'always':
+            WriteBehind.fsync_file(Source)
+
+        # Renamed when it is on the same disk, never read
+        try:
+            os.replace(Source, File)
+        except OSError:
+            return super().write_file(File, Source, fsync)
+
+        if fsync == 'always':
+            WriteBehind.fsync_directory(Path)
+        elif fsync == 'batch':
+            WriteBehind.sync_file(File)
+
+    def names(self) -> list[str]:
+        root: str = os.path.abspath(self.path)
+        return [os.path.join(folder, name) for folder, folders, names in os.walk(root) for name in names]
+
+    def delete(self, File: str) -> None:
+        try:
+            os.remove(File)
+        except FileNotFoundError:
+            pass
+
+class SQLiteBackend(Backend):
+    """
+    Every file of a storage as a row of one SQLite database (<path>/storage.db).
+
+    The rows hold the same bytes a file would, header, compression and
+    encryption included. The database runs in WAL mode and is shared by all
+    the storages opened on the same path.
+    """
+
+    name: str = "sqlite"
+
+    Database: str = "storage.db"
+
+    _databases: dict[str, tuple[sqlite3.Connection, Lock]] = {}
+    _lock: Lock = Lock()
+
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+
+        self.__root: str = os.path.abspath(path)
+        self.__db, self.__lock = self.connect(os.path.join(self.__root, self.Database))
+
+    @classmethod
+    def connect(cls, database: str) -> tuple[sqlite3.Connection, Lock]:
+        with cls._lock:
+            if database not in cls._databases:
+                os.makedirs(os.path.dirname(database), 777, exist_ok = True)
+
+                db: sqlite3.Connection = sqlite3.connect(database, check_same_thread = False, isolation_level = None)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("PRAGMA synchronous=NORMAL")
+                db.execute("CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, data BLOB NOT NULL, version INTEGER NOT NULL)")
+
+                cls._databases[database] = (db, Lock())
+
+            return cls._databases[database]
+
+    @classmethod
+    def close(cls, path: Optional[str] = None) -> None:
+        """Close the databases under path (all of them without one), before removing a folder."""
+        root: Optional[str] = os.path.abspath(path) if path is not None else None
+
+        with cls._lock:
+            for database in list(cls._databases):
+                if root is None or os.path.commonpath([root, database]) == root:
+                    db, lock = cls._databases.pop(database)
+
+                    with lock:
+                        db.close()
+
+    def stat(self, File: str) -> Optional[Stat]:
+        with self.__lock:
+            row = self.__db.execute("SELECT version, length(data) FROM files WHERE name = ?", (self.__name(File),)).fetchone()
+
+        return tuple(row) if row else None
+
+    def read(self, File: str) -> Optional[tuple[bytes, Stat]]:
+        with self.__lock:
+            row = self.__db.execute("SELECT data, version FROM files WHERE name = ?", (self.__name(File),)).fetchone()
+
+        if row is None:
+            return None
+
+        return bytes(row[0]), (row[1], len(row[0]))
+
+    def head(self, File: str, size: int) -> Optional[bytes]:
+        with self.__lock:
+            row = self.__db.execute("SELECT substr(data, 1, ?) FROM files WHERE name = ?", (size, self.__name(File))).fetchone()
+
+        return bytes(row[0]) if row else None
+
+    def write(self, File: str, Data: bytes, fsync: str = 'batch') -> None:
+        self.__execute(
+            "INSERT INTO files (name, data, version) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET data = excluded.data, version = excluded.version",
+            (self.__name(File), Data, time.time_ns()), fsync
+        )
+
+    def write_many(self, items: list[tuple[str, bytes]]) -> None:
+        """Writes several files in a single transaction (used by the migration)."""
+        version: int = time.time_ns()
+
+        with self.__lock:
+            # The migration may remove the source files, its commit must be durable
+            self.__db.execute("PRAGMA synchronous=FULL")
+            self.__db.execute("BEGIN IMMEDIATE")
+            try:
+                self.__db.executemany(
+                    "INSERT INTO files (name, data, version) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET data = excluded.data, version = excluded.version",
+                    [(self.__name(File), Data, version) for File, Data in items]
+                )
+            except Exception:
+                self.__db.execute("ROLLBACK")
+                raise
+            else:
+                self.__db.execute("COMMIT")
+            finally:
+                self.__db.execute("PRAGMA synchronous=NORMAL")
+
+    def append(self, File: str, Data: bytes, fsync: str = 'batch') -> int:
+        self.__execute(
+            "INSERT INTO files (name, data, version) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET data = CAST(data || excluded.data AS BLOB), version = excluded.version",
+            (self.__name(File), Data, time.time_ns()), fsync
+        )
+
+        return self.stat(File)[1]
+
+    def delete(self, File: str) -> None:
+        self.__execute("DELETE FROM files WHERE name = ?", (self.__name(File),))
+
+    def names(self) -> list[str]:
+        with self.__lock:
+            rows = self.__db.execute("SELECT name FROM files").fetchall()
+
+        return [os.path.join(self.__root, *row[0].split("/")) for row in rows]
+
+    def __name(self, File: str) -> str:
+        return os.path.relpath(File, self.__root).replace(os.sep, "/")
+
+    def __execute(self, query: str, params: tuple, fsync: str = 'batch') -> None:
+        try:
+            with self.__lock:
+                # synchronous=NORMAL only syncs the WAL at checkpoints, "always" asks for every commit
+                if fsync == 'always':
+                    self.__db.execute("PRAGMA synchronous=FULL")
+
+                try:
+                    self.__db.execute(query, params)
+                finally:
+                    if fsync == 'always':
+                        self.__db.execute("PRAGMA synchronous=NORMAL")
+        except sqlite3.Error as e:
+            raise OSError(f"{self.__db_name()}: {e}") from e
+
+    def __db_name(self) -> str:
+        return os.path.join(self.__root, self.Database)
+
+class PackedBackend(Backend):
+    """
+    Every file of a storage as a blob of the segment files of <path>/segments.
+
+    Small files cost a record in a shared append-only segment instead of an
+    inode and an open/close. The pack is shared by all the storages opened
+    on the same path and compacts itself in the background. A pack closed
+    (close) is opened again by the next call.
+    """
+
+    name: str = "packed"
+
+    Folder: str = "segments"
+
+    _packs: dict[str, Pack] = {}
+    _lock: Lock = Lock()
+
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+
+        self.__root: str = os.path.abspath(path)
+        self.__folder: str = os.path.join(self.__root, self.Folder)
+        self.__opened: Pack = self.connect(self.__folder)
+
+    @property
+    def __pack(self) -> Pack:
+        if self.__opened.closed:
+            self.__opened = self.connect(self.__folder)
+
+        return self.__opened
+
+    @classmethod
+    def connect(cls, folder: str) -> Pack:
+        with cls._lock:
+            if folder not in cls._packs or cls._packs[folder].closed:
+                cls._packs[folder] = Pack(folder)
+
+            return cls._packs[folder]
+
+    @classmethod
+    def close(cls, path: Optional[str] = None) -> None:
+        """Close the packs under path (all of them without one), before removing a folder."""
+        root: Optional[str] = os.path.abspath(path) if path is not None else None
+
+        with cls._lock:
+            for folder in list(cls._packs):
+                if root is None or os.path.commonpath([root, folder]) == root:
+                    cls._packs.pop(folder).close()
+
+    def stat(self, File: str) -> Optional[Stat]:
+        return self.__pack.stat(self.__name(File))
+
+    def read(self, File: str) -> Optional[tuple[bytes, Stat]]:
+        return self.__pack.get(self.__name(File))
+
+    def head(self, File: str, size: int) -> Optional[bytes]:
+        Read = self.__pack.get(self.__name(File), size)
+        return Read[0] if Read is not None else None
+
+    def write(self, File: str, Data: bytes, fsync: str = 'batch') -> None:
+        self.__put(File, Data, fsync)
+
+    def append(self, File: str, Data: bytes, fsync: str = 'batch') -> int:
+        # Blobs are immutable, the record is rewritten with the new tail (delta logs stay small)
+        Read = self.__pack.get(self.__name(File))
+        Data = (Read[0] if Read is not None else b"") + Data
+
+        self.__put(File, Data, fsync)
+        return len(Data)
+
+    def delete(self, File: str) -> None:
+        self.__pack.delete(self.__name(File))
+
+    def names(self) -> list[str]:
+        return [os.path.join(self.__root, *name.split("/")) for name in self.__pack.names()]
+
+    def __put(self, File: str, Data: bytes, fsync: str) -> None:
+        Segment: str = self.__pack.put(self.__name(File), Data, fsync == 'always')
+
+        if fsync == 'batch':
+            WriteBehind.sync_file(Segment)
+
+    def __name(self, File: str) -> str:
+        return os.path.relpath(File, self.__root).replace(os.sep, "/")
+
+class Backends:
+    _backends: dict[str, type[Backend]] = {}
+
+    # Backend of the storages that don't ask for one, SLAZHE_STORAGE_BACKEND=sqlite switches the whole bot
+    Default: str = os.environ.get("SLAZHE_STORAGE_BACKEND", "file")
+
+    @classmethod
+    def register(cls, backend: type[Backend]) -> None:
+        cls._backends[backend.name] = backend
+
+    @classmethod
+    def close(cls, path: Optional[str] = None) -> None:
+        """Let go of what the backends keep open under path."""
+        for backend in cls._backends.values():
+            if hasattr(backend, 'close'):
+                backend.close(path)
+
+    @classmethod
+    def get(cls, name: Optional[str] = None) -> type[Backend]:
+        name = name or cls.Default
+
+        if name not in cls._backends:
+            raise ValueError(f"Unknown storage backend {name!r}, available: {', '.join(cls._backends)}")
+
+        return cls._backends[name]
+
+Backends.register(FileBackend)
+Backends.register(SQLiteBackend)
+Backends.register(PackedBackend)
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.08
@@ -0,0 +1,251 @@
+from Slazhe import Logger
+
+Log = Logger(__package__)
+
+from typing         import Optional, Iterator, BinaryIO
+from .cache         import MissingFiles, ObjectCache
+from .writebehind   import WriteBehind
+from .compression   import StreamReader
+from .metrics       import StorageMetrics
+from .zdict         import ZDicts
+from time           import perf_counter
+from contextlib     import contextmanager
+
+import os, io, struct, threading, tempfile, sqlite3
+
+class StorageBackup:
+    """
+    export() writes every file of a storage, as stored (header, compression
+    and encryption included), into one archive, restore() puts them back.
+
+        archive: magic(4), then per file: name length(2) size(8) name data
+
+    The archive is a CryptoStream under the storage key, or under password.
+    The files inside stay encrypted under the storage key, which derives
+    from this machine (secure_key): an archive is restored on the machine
+    that wrote it (or one with the same SLAZHE_CRYPTO_SECRET), the password
+    only protects the archive itself. SQLite databases found among the files
+    are archived as a consistent snapshot (sqlite backup, to a temporary
+    file) instead of their bytes, their -wal and -shm files are left out.
+    Files are read, encrypted and written a chunk at a time, memory doesn't
+    grow with the storage (restore puts the files back as they were staged,
+    the backends keeping rows read one file at a time).
+    """
+
+    MAGIC: bytes = b"SLZA"
+    SQLITE: bytes = b"SQLite format 3\x00"
+
+    # Held by the database itself, its snapshot covers them
+    SQLiteFiles: tuple[str, ...] = ("-wal", "-shm", "-journal")
+
+    __entry: struct.Struct = struct.Struct("<HQ")
+
+    def export(self, target: str, password: Optional[str] = None) -> int:
+        """Writes the files of this storage to the archive target, returns how many. -1 when it fails."""
+        WriteBehind.flush()
+
+        root: str = os.path.abspath(self.path)
+        Files: list[str] = sorted(File for File in self.backend.names() if not File.endswith((".tmp", *self.SQLiteFiles)))
+        Count: list[int] = [0]
+
+        if getattr(getattr(self, 'slazhe_crypto', None), 'SCrypto', None) is None:
+            Log.Warn(f"No crypto backend, the archive of {root} is written unencrypted.")
+
+        Start: float = perf_counter()
+        TempFile: str = f'{os.path.abspath(target)}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok = True)
+
+            with open(TempFile, 'wb') as IOFile:
+                for Chunk in self.__encrypt(self.__archive(root, Files, Count), password):
+                    IOFile.write(Chunk)
+
+                Size: int = IOFile.tell()
+
+            os.replace(TempFile, target)
+        except Exception as e:
+            try:
+                os.remove(TempFile)
+            except OSError:
+                pass
+
+            Log.Error(f"Unable to export {root} to {target}: {e}")
+            return -1
+
+        StorageMetrics.stage("backup.export", Size, perf_counter() - Start)
+        Log.Info(f"{Count[0]} files of {root} exported to {target} ({Size} bytes).")
+
+        return Count[0]
+
+    def restore(self, source: str, password: Optional[str] = None) -> int:
+        """
+        Puts back the files of an archive written by export(), replacing
+        those with the same name. Returns how many, -1 when it fails. The
+        archive is read (and authenticated) whole into a temporary folder
+        first, an archive that fails midway leaves the storage as it was.
+        The databases restored must not be open (Storage.release).
+        """
+        WriteBehind.flush()
+
+        root: str = os.path.abspath(self.path)
+        Chunk: int = getattr(self, 'StreamChunk', 1 << 20)
+        Count: int = 0
+        Start: float = perf_counter()
+
+        def chunks() -> Iterator[bytes]:
+            with open(source, 'rb') as IOFile:
+                while Block := IOFile.read(Chunk):
+                    yield Block
+
+        try:
+            os.makedirs(os.path.dirname(root), exist_ok = True)
+
+            # Next to the storage, on the same disk
+            with tempfile.TemporaryDirectory(prefix = ".restore-", dir = os.path.dirname(root)) as Staging:
+                Staged: list[tuple[str, str]] = []
+
+                with io.BufferedReader(StreamReader(self.__decrypt(chunks(), password)), Chunk) as Archive:
+                    if Archive.read(len(self.MAGIC)) != self.MAGIC:
+                        raise ValueError("not a storage archive")
+
+                    while Entry := Archive.read(self.__entry.size):
+                        NameSize, Size = self.__entry.unpack(self.__exact(Entry, self.__entry.size))
+                        Name: str = self.__exact(Archive.read(NameSize), NameSize).decode("UTF-8")
+
+                        File: str = os.path.abspath(os.path.join(root, *Name.split("/")))
+
+                        if os.path.commonpath([root, File]) != root:
+                            raise ValueError(f"{Name} is outside of the storage")
+
+                        Staged.append((File, os.path.join(Staging, str(len(Staged)))))
+
+                        with open(Staged[-1][1], 'wb') as IOFile:
+                            self.__copy(Archive, IOFile, Size, Chunk)
+
+                # The whole archive is there and its last frame checked, the files can replace the current ones
+                for File, StagedFile in Staged:
+                    with open(StagedFile, 'rb') as IOFile:
+                        Head: bytes = IOFile.read(len(self.SQLITE))
+
+                    if Head == self.SQLITE:
+                        # A WAL left by the replaced database would be replayed onto this one
+                        for Suffix in self.SQLiteFiles:
+                            self.backend.delete(File + Suffix)
+
+                    self.backend.write_file(File, StagedFile, getattr(self, 'fsync', 'batch'))
+                    ObjectCache.invalidate(File)
+                    Count += 1
+
+        except Exception as e:
+            Log.Error(f"Unable to restore {root} from {source}: {e}")
+            Count = -1
+
+        # The dictionaries and their pointers may have been replaced too, files missing before may be there now
+        ZDicts.forget(root)
+        MissingFiles.forget(root)
+
+        if Count >= 0:
+            StorageMetrics.stage("backup.restore", os.path.getsize(source), perf_counter() - Start)
+            Log.Info(f"{Count} files of {root} restored from {source}.")
+
+        return Count
+
+    def __archive(self, root: str, Files: list[str], Count: list[int]) -> Iterator[bytes]:
+        Chunk: int = getattr(self, 'StreamChunk', 1 << 20)
+
+        yield self.MAGIC
+
+        for File in Files:
+            Name: bytes = os.path.relpath(File, root).replace(os.sep, "/").encode("UTF-8")
+
+            # A database in use may be ahead in its WAL, or midway through a write: its snapshot is archived instead
+            if os.path.isfile(File) and self.backend.head(File, len(self.SQLITE)) == self.SQLITE:
+                with self.__sqlite_snapshot(File) as Snapshot:
+                    yield self.__entry.pack(len(Name), os.fstat(Snapshot.fileno()).st_size) + Name
+
+                    while Block := Snapshot.read(Chunk):
+                        yield Block
+
+                Count[0] += 1
+                continue
+
+            Read = self.backend.map(File) or self.backend.read(File)
+
+            # Removed since it was listed
+            if Read is None:
+                continue
+
+            Data: memoryview = memoryview(Read[0])
+
+            yield self.__entry.pack(len(Name), len(Data)) + Name
+
+            for i in range(0, len(Data), Chunk):
+                yield Data[i:i + Chunk]
+
+            Count[0] += 1
+
+    @staticmethod
+    @contextmanager
+    def __sqlite_snapshot(File: str) -> Iterator[BinaryIO]:
+        """A copy of the database File (sqlite backup) in a temporary file, opened for reading."""
+        Descriptor, Snapshot = tempfile.mkstemp(suffix = ".db")
+        os.close(Descriptor)
+
+        try:
+            Source: sqlite3.Connection = sqlite3.connect(f"file:{File}?mode=ro", uri = True)
+
+            try:
+                Target: sqlite3.Connection = sqlite3.connect(Snapshot)
+
+                try:
+                    Source.backup(Target)
+                finally:
+                    Target.close()
+            finally:
+                Source.close()
+
+            with open(Snapshot, 'rb') as IOFile:
+                yield IOFile
+        finally:
+            os.remove(Snapshot)
+
+    @classmethod
+    def __copy(cls, Source: io.BufferedReader, Target: io.BufferedWriter, Size: int, Chunk: int) -> None:
+        while Size > 0:
+            Block: bytes = Source.read(min(Size, Chunk))
+
+            if not Block:
+                raise ValueError("the archive is truncated")
+
+            Target.write(Block)
+            Size -= len(Block)
+
+    def __key(self, password: Optional[str]) -> list[int]:
+        if password:
+            return self.slazhe_crypto.get_secure_password(password)
+
+        return self.slazhe_crypto_password
+
+    def __encrypt(self, Chunks: Iterator[bytes], password: Optional[str]) -> Iterator[bytes]:
+        if not hasattr(self, 'slazhe_crypto'):
+            return Chunks
+
+        # The frames are sealed a few at a time on the crypto workers
+        return self.slazhe_crypto.encrypt_stream(Chunks, self.__key(password), getattr(self, 'StreamChunk', None), self.slazhe_crypto.Workers)
+
+    def __decrypt(self, Chunks: Iterator[bytes], password: Optional[str]) -> Iterator[bytes]:
+        if not hasattr(self, 'slazhe_crypto'):
+            return Chunks
+
+        return self.slazhe_crypto.decrypt_stream(Chunks, self.__key(password))
+
+    @staticmethod
+    def __exact(Data: bytes, size: int) -> bytes:
+        if len(Data) != size:
+            raise ValueError("the archive is truncated")
+
+        return Data
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.05
@@ -0,0 +1,172 @@
+from collections    import OrderedDict
+from threading      import Lock
+from typing         import Any, Hashable, Optional
+
+import os, time
+
+class MissingFiles:
+    """
+    Bounded record of the absolute paths that were found missing on disk.
+
+    Shared by every Storage instance: StorageOpen skips the filesystem for a
+    recorded path and StorageSave forgets a path as soon as it writes it.
+    A path is kept TTL seconds at most, a file created by another process
+    is found again after that. Whatever replaces the files of a folder
+    (restore, migrations) forgets the paths under it.
+    """
+
+    Limit: int = 4096
+    TTL: float = 30.0
+
+    _files: 'OrderedDict[str, float]' = OrderedDict()      # path -> expiry (time.monotonic)
+    _lock: Lock = Lock()
+
+    @classmethod
+    def has(cls, file: str) -> bool:
+        with cls._lock:
+            Expires: Optional[float] = cls._files.get(file)
+
+            if Expires is None:
+                return False
+
+            if Expires <= time.monotonic():
+                del cls._files[file]
+                return False
+
+            cls._files.move_to_end(file)
+            return True
+
+    @classmethod
+    def add(cls, file: str) -> None:
+        with cls._lock:
+            cls._files[file] = time.monotonic() + cls.TTL
+            cls._files.move_to_end(file)
+
+            while len(cls._files) > cls.Limit:
+                cls._files.popitem(last = False)
+
+    @classmethod
+    def discard(cls, file: str) -> None:
+        with cls._lock:
+            cls._files.pop(file, None)
+
+    @classmethod
+    def forget(cls, root: str) -> None:
+        """Forget the paths under the folder root."""
+        root = os.path.join(os.path.abspath(root), "")
+
+        with cls._lock:
+            for file in [file for file in cls._files if file.startswith(root)]:
+                del cls._files[file]
+
+    @classmethod
+    def clear(cls) -> None:
+        with cls._lock:
+            cls._files.clear()
+
+class ObjectCache:
+    """
+    Process wide LRU of the decoded content of storage files.
+
+    Keys start with the absolute path and carry the file's mtime and size, so
+    a file changed on disk is never served from the cache. Values are shared,
+    not copied: what get returns must not be modified, StorageOpen hands it
+    out through to_extended(value, shared = True) which copies it on the
+    first mutation only. The memory limit is an estimate based on the size
+    of the serialized payloads.
+    """
+
+    Limit: int      = 32 * 1024 * 1024
+    Entries: int    = 1024
+
+    _objects: 'OrderedDict[tuple, tuple[Any, int]]' = OrderedDict()
+    _paths: dict[str, set[tuple]] = {}
+    _lock: Lock = Lock()
+
+    _size: int      = 0
+    _hits: int      = 0
+    _misses: int    = 0
+
+    @classmethod
+    def configure(cls, limit: Optional[int] = None, entries: Optional[int] = None) -> None:
+        with cls._lock:
+            if limit is not None:
+                cls.Limit = limit
+
+            if entries is not None:
+                cls.Entries = entries
+
+            cls.__evict()
+
+    @classmethod
+    def get(cls, key: tuple[str, Hashable]) -> tuple[bool, Any]:
+        with cls._lock:
+            if key not in cls._objects:
+                cls._misses += 1
+                return False, None
+
+            cls._hits += 1
+            cls._objects.move_to_end(key)
+            return True, cls._objects[key][0]
+
+    @classmethod
+    def put(cls, key: tuple[str, Hashable], value: Any, size: int) -> bool:
+        """Keep value (size: of its serialized payload), False when it is too large to be cached."""
+        if size > cls.Limit:
+            return False
+
+        with cls._lock:
+            cls.__remove(key)
+
+            cls._objects[key] = (value, size)
+            cls._paths.setdefault(key[0], set()).add(key)
+            cls._size += size
+
+            cls.__evict()
+
+        return True
+
+    @classmethod
+    def invalidate(cls, path: str) -> None:
+        with cls._lock:
+            for key in cls._paths.get(path, set()).copy():
+                cls.__remove(key)
+
+    @classmethod
+    def clear(cls) -> None:
+        with cls._lock:
+            cls._objects.clear()
+            cls._paths.clear()
+            cls._size = 0
+
+    @classmethod
+    def stats(cls) -> dict[str, int]:
+        with cls._lock:
+            return {
+                "entries":  len(cls._objects),
+                "size":     cls._size,
+                "hits":     cls._hits,
+                "misses":   cls._misses
+            }
+
+    @classmethod
+    def __remove(cls, key: tuple) -> None:
+        if key not in cls._objects:
+            return
+
+        _, size = cls._objects.pop(key)
+        cls._size -= size
+
+        keys: set[tuple] = cls._paths[key[0]]
+        keys.discard(key)
+
+        if not keys:
+            del cls._paths[key[0]]
+
+    @classmethod
+    def __evict(cls) -> None:
+        while cls._objects and (cls._size > cls.Limit or len(cls._objects) > cls.Entries):
+            cls.__remove(next(iter(cls._objects)))
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.06
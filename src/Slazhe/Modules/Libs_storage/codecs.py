@@ -0,0 +1,206 @@
+from typing         import Any, Union, BinaryIO
+from .CustomTypes   import EBase, ETracked
+
+import json, pickle
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+def native(data: Any) -> Any:
+    """Unwrap an extended type, its SlazheStorageFile can't be serialized."""
+    if not isinstance(data, EBase):
+        return data
+
+    for base in type(data).__mro__[1:]:
+        if base.__module__ == "builtins" and base is not object:
+            return base(data)
+
+    return data.value
+
+def unwrap(data: Any) -> Any:
+    """default of the encoders: a tracked object put in a plain dict or list is encoded as what it wraps."""
+    if isinstance(data, ETracked):
+        return data.value
+
+    raise TypeError(f"Object of type {type(data).__name__} is not serializable")
+
+class Codec:
+    """
+    Turns the data of a Storage into bytes and back.
+
+    The id is written in the file header, it must never change once files
+    were written with it.
+    """
+
+    id: int
+    name: str
+
+    def encode(self, data: Any) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, data: bytes) -> Any:
+        raise NotImplementedError
+
+    def load(self, file: BinaryIO) -> Any:
+        """decode() from a file, for the large files open() streams."""
+        return self.decode(file.read())
+
+    def dump(self, data: Any, file: BinaryIO) -> None:
+        """encode() into a file, as it goes when the codec can: save() never holds the whole output."""
+        file.write(self.encode(data))
+
+class JsonCodec(Codec):
+    id: int     = 2
+    name: str   = "json"
+
+    # Containers with more items than that are dumped item by item, written Buffer bytes at a time
+    Items: int  = 256
+    Depth: int  = 4
+    Buffer: int = 1 << 16
+
+    def encode(self, data: Any) -> bytes:
+        return self.__dumps(native(data))
+
+    def dump(self, data: Any, file: BinaryIO) -> None:
+        # Neither orjson nor the C encoder write as they go, the large containers are split instead: the output is the same
+        buffer: bytearray = bytearray()
+
+        self.__dump(native(data), file, buffer, 0)
+        file.write(buffer)
+
+    def __split(self, data: Any, depth: int) -> bool:
+        if depth >= self.Depth or not isinstance(data, (dict, list)) or len(data) <= self.Items:
+            return False
+
+        # Other keys are converted (json) or refused (orjson) by the encoder, it gets the whole dict
+        return isinstance(data, list) or all(type(key) is str for key in data)
+
+    def __dump(self, data: Any, file: BinaryIO, buffer: bytearray, depth: int) -> None:
+        if isinstance(data, ETracked):
+            data = data.value
+
+        if not self.__split(data, depth):
+            buffer += self.__dumps(data)
+            return
+
+        mapping: bool = isinstance(data, dict)
+        items = data.items() if mapping else data
+        batch: list = []
+        first: bool = True
+
+        def flush() -> None:
+            nonlocal first
+
+            # The items of a slice, dumped at once without its brackets
+            buffer.extend(b"" if first else b",")
+            buffer.extend(self.__dumps(dict(batch) if mapping else batch)[1:-1])
+            batch.clear()
+            first = False
+
+            if len(buffer) >= self.Buffer:
+                file.write(buffer)
+                buffer.clear()
+
+        buffer += b"{" if mapping else b"["
+
+        for item in items:
+            value: Any = item[1] if mapping else item
+
+            if isinstance(value, ETracked) or (isinstance(value, (dict, list)) and len(value) > self.Items and self.__split(value, depth + 1)):
+                if batch:
+                    flush()
+
+                buffer.extend(b"" if first else b",")
+                buffer.extend(self.__dumps(item[0]) + b":" if mapping else b"")
+                first = False
+
+                self.__dump(value, file, buffer, depth + 1)
+                continue
+
+            batch.append(item)
+
+            if len(batch) >= self.Items:
+                flush()
+
+        if batch:
+            flush()
+
+        buffer += b"}" if mapping else b"]"
+
+    @staticmethod
+    def __dumps(data: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(data, default = unwrap)
+
+        return json.dumps(data, separators = (",", ":"), default = unwrap).encode("utf-8")
+
+    def decode(self, data: bytes) -> Any:
+        if orjson is not None:
+            return orjson.loads(data)
+
+        return json.loads(data)
+
+class MsgpackCodec(Codec):
+    id: int     = 3
+    name: str   = "msgpack"
+
+    def encode(self, data: Any) -> bytes:
+        return msgpack.packb(native(data), use_bin_type = True, default = unwrap)
+
+    def decode(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, raw = False, strict_map_key = False)
+
+    def load(self, file: BinaryIO) -> Any:
+        return msgpack.Unpacker(file, raw = False, strict_map_key = False).unpack()
+
+class PickleCodec(Codec):
+    id: int     = 4
+    name: str   = "pickle"
+
+    def encode(self, data: Any) -> bytes:
+        # Tracked objects pickle as the dict or list they wrap
+        return pickle.dumps(native(data), protocol = pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, data: bytes) -> Any:
+        return pickle.loads(data)
+
+    def load(self, file: BinaryIO) -> Any:
+        return pickle.load(file)
+
+    def dump(self, data: Any, file: BinaryIO) -> None:
+        pickle.dump(native(data), file, protocol = pickle.HIGHEST_PROTOCOL)
+
+class Codecs:
+    _codecs: dict[Union[int, str], Codec] = {}
+
+    @classmethod
+    def register(cls, codec: Codec) -> None:
+        cls._codecs[codec.id]   = codec
+        cls._codecs[codec.name] = codec
+
+    @classmethod
+    def get(cls, codec: Union[int, str]) -> Codec:
+        if codec not in cls._codecs:
+            raise ValueError(f"Unknown codec {codec!r}, available: {', '.join(cls.names())}")
+
+        return cls._codecs[codec]
+
+    @classmethod
+    def names(cls) -> list[str]:
+        return [name for name in cls._codecs if isinstance(name, str)]
+
+Codecs.register(JsonCodec())
+Codecs.register(PickleCodec())
+
+if msgpack is not None:
+    Codecs.register(MsgpackCodec())
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.06
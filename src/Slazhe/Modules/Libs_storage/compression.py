@@ -0,0 +1,421 @@
+from typing         import Optional, Union, Iterator, Iterable
+from threading      import Lock
+from collections    import OrderedDict
+
+import zlib, lzma, bz2
+import math, time, io
+
+class Compressor:
+    """
+    Compresses the encoded data of a Storage.
+
+    The id is written in the file header, it must never change once files
+    were written with it. Only zlib knows about preset dictionaries, the
+    others ignore zdict.
+    """
+
+    id: int
+    name: str
+    level: Optional[int] = None
+    zdict: bool = False
+
+    def compress(self, data: bytes, level: Optional[int] = None, zdict: Optional[bytes] = None) -> bytes:
+        raise NotImplementedError
+
+    def decompress(self, data: bytes, zdict: Optional[bytes] = None) -> bytes:
+        raise NotImplementedError
+
+    def stream(self, chunks: Iterable[bytes], zdict: Optional[bytes] = None, size: int = 1 << 20) -> Iterator[bytes]:
+        """Decompresses chunks as they come, yielding blocks of at most size bytes."""
+        raise NotImplementedError
+
+    def compressor(self, level: Optional[int] = None, zdict: Optional[bytes] = None):
+        """An incremental compressor (compress() then flush()), to compress a payload as it is written."""
+        raise NotImplementedError
+
+    @staticmethod
+    def _stream(decompressor, chunks: Iterable[bytes], size: int) -> Iterator[bytes]:
+        # lzma and bz2 decompressors share this interface
+        for chunk in chunks:
+            yield decompressor.decompress(chunk, size)
+
+            while not decompressor.needs_input and not decompressor.eof:
+                yield decompressor.decompress(b"", size)
+
+        if not decompressor.eof:
+            raise ValueError("compressed data ended before the end-of-stream marker")
+
+class NoCompressor(Compressor):
+    id: int     = 0
+    name: str   = "none"
+
+    def compress(self, data: bytes, level: Optional[int] = None, zdict: Optional[bytes] = None) -> bytes:
+        return data
+
+    def decompress(self, data: bytes, zdict: Optional[bytes] = None) -> bytes:
+        return data
+
+    def stream(self, chunks: Iterable[bytes], zdict: Optional[bytes] = None, size: int = 1 << 20) -> Iterator[bytes]:
+        return iter(chunks)
+
+    def compressor(self, level: Optional[int] = None, zdict: Optional[bytes] = None):
+        return _Identity()
+
+class _Identity:
+    def compress(self, data: bytes) -> bytes:
+        return bytes(data)
+
+    def flush(self) -> bytes:
+        return b""
+
+class ZlibCompressor(Compressor):
+    id: int     = 1
+    name: str   = "zlib"
+    level: int  = zlib.Z_DEFAULT_COMPRESSION
+    zdict: bool = True
+
+    def compress(self, data: bytes, level: Optional[int] = None, zdict: Optional[bytes] = None) -> bytes:
+        level = self.level if level is None else level
+
+        if zdict:
+            ZlibCompressor: zlib._Compress = zlib.compressobj(level, zdict = zdict)
+        else:
+            ZlibCompressor: zlib._Compress = zlib.compressobj(level)
+
+        return ZlibCompressor.compress(data) + ZlibCompressor.flush()
+
+    def decompress(self, data: bytes, zdict: Optional[bytes] = None) -> bytes:
+        if not zdict:
+            return zlib.decompress(data)
+
+        ZlibDecompressor: zlib._Decompress = zlib.decompressobj(zdict = zdict)
+        return ZlibDecompressor.decompress(data) + ZlibDecompressor.flush()
+
+    def stream(self, chunks: Iterable[bytes], zdict: Optional[bytes] = None, size: int = 1 << 20) -> Iterator[bytes]:
+        ZlibDecompressor: zlib._Decompress = zlib.decompressobj(zdict = zdict) if zdict else zlib.decompressobj()
+
+        for chunk in chunks:
+            while chunk:
+                yield ZlibDecompressor.decompress(chunk, size)
+                chunk = ZlibDecompressor.unconsumed_tail
+
+        yield ZlibDecompressor.flush()
+
+        if not ZlibDecompressor.eof:
+            raise ValueError("compressed data ended before the end-of-stream marker")
+
+    def compressor(self, level: Optional[int] = None, zdict: Optional[bytes] = None):
+        level = self.level if level is None else level
+        return zlib.compressobj(level, zdict = zdict) if zdict else zlib.compressobj(level)
+
+class LzmaCompressor(Compressor):
+    id: int     = 2
+    name: str   = "lzma"
+    level: int  = 6
+
+    def compress(self, data: bytes, level: Optional[int] = None, zdict: Optional[bytes] = None) -> bytes:
+        return lzma.compress(data, preset = self.level if level is None else level)
+
+    def decompress(self, data: bytes, zdict: Optional[bytes] = None) -> bytes:
+        return lzma.decompress(data)
+
+    def stream(self, chunks: Iterable[bytes], zdict: Optional[bytes] = None, size: int = 1 << 20) -> Iterator[bytes]:
+        return self._stream(lzma.LZMADecompressor(), chunks, size)
+
+    def compressor(self, level: Optional[int] = None, zdict: Optional[bytes] = None):
+        return lzma.LZMACompressor(preset = self.level if level is None else level)
+
+class Bz2Compressor(Compressor):
+    id: int     = 3
+    name: str   = "bz2"
+    level: int  = 9
+
+    def compress(self, data: bytes, level: Optional[int] = None, zdict: Optional[bytes] = None) -> bytes:
+        return bz2.compress(data, self.level if level is None else level)
+
+    def decompress(self, data: bytes, zdict: Optional[bytes] = None) -> bytes:
+        return bz2.decompress(data)
+
+    def stream(self, chunks: Iterable[bytes], zdict: Optional[bytes] = None, size: int = 1 << 20) -> Iterator[bytes]:
+        return self._stream(bz2.BZ2Decompressor(), chunks, size)
+
+    def compressor(self, level: Optional[int] = None, zdict: Optional[bytes] = None):
+        return bz2.BZ2Compressor(self.level if level is None else level)
+
+class StreamReader(io.RawIOBase):
+    """
+    Read-only file over an iterator of blocks (see Compressions.stream),
+    for the deserializers that can read from a file. size counts the bytes
+    read so far.
+    """
+
+    def __init__(self, blocks: Iterator[bytes]) -> None:
+        super().__init__()
+
+        self.size: int = 0
+        self.__blocks: Iterator[bytes] = blocks
+        self.__block: memoryview = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self.__block:
+            block: Optional[bytes] = next(self.__blocks, None)
+
+            if block is None:
+                return 0
+
+            self.__block = memoryview(block)
+
+        length: int = min(len(buffer), len(self.__block))
+        buffer[:length] = self.__block[:length]
+
+        self.__block = self.__block[length:]
+        self.size += length
+        return length
+
+class Compressions:
+    """
+    The compressors a Storage can use, and how long they take.
+
+    compression = "adaptive" picks a compressor per payload: the candidates
+    are tried from the cheapest to the most expensive and the first one
+    reaching the target ratio (compressed / original size) wins. High
+    entropy payloads (already compressed or encrypted) aren't compressed at
+    all. The choice is remembered per file and only revisited once it stops
+    meeting the target.
+    """
+
+    _compressors: dict[Union[int, str], Compressor] = {}
+
+    # (compressor, level), cheapest first
+    Adaptive: list[tuple[str, Optional[int]]] = [("zlib", 1), ("zlib", 6), ("bz2", 9), ("lzma", 6)]
+    Sample: int     = 64 * 1024     # Bytes the candidates are tried on
+    Entropy: float  = 7.5           # Bits per byte above which nothing is worth trying
+    Choices: int    = 4096
+
+    _choices: OrderedDict[str, tuple[str, Optional[int]]] = OrderedDict()
+    # name -> operation -> [calls, bytes in, bytes out, seconds]
+    _timings: dict[str, dict[str, list]] = {}
+    _lock: Lock = Lock()
+
+    @classmethod
+    def register(cls, compressor: Compressor) -> None:
+        cls._compressors[compressor.id]   = compressor
+        cls._compressors[compressor.name] = compressor
+
+    @classmethod
+    def get(cls, compressor: Union[int, str]) -> Compressor:
+        if compressor not in cls._compressors:
+            raise ValueError(f"Unknown compression {compressor!r}, available: {', '.join(cls.names())}")
+
+        return cls._compressors[compressor]
+
+    @classmethod
+    def names(cls) -> list[str]:
+        return [name for name in cls._compressors if isinstance(name, str)]
+
+    @classmethod
+    def compress(cls, compressor: Compressor, data: bytes, level: Optional[int] = None, zdict: Optional[bytes] = None) -> bytes:
+        start: float = time.perf_counter()
+        result: bytes = compressor.compress(data, level, zdict)
+        cls.__record(compressor.name, "compress", len(data), len(result), time.perf_counter() - start)
+
+        return result
+
+    @classmethod
+    def decompress(cls, compressor: Union[int, str], data: bytes, zdict: Optional[bytes] = None) -> bytes:
+        Decompressor: Compressor = cls.get(compressor)
+
+        start: float = time.perf_counter()
+        result: bytes = Decompressor.decompress(data, zdict)
+        cls.__record(Decompressor.name, "decompress", len(data), len(result), time.perf_counter() - start)
+
+        return result
+
+    @classmethod
+    def stream(cls, compressor: Union[int, str], chunks: Iterable[bytes], zdict: Optional[bytes] = None, size: int = 1 << 20) -> Iterator[bytes]:
+        """Compressor.stream, timed like decompress (only the time spent decompressing counts)."""
+        Decompressor: Compressor = cls.get(compressor)
+        bytes_in: list[int] = [0]
+
+        def counted() -> Iterator[bytes]:
+            for chunk in chunks:
+                bytes_in[0] += len(chunk)
+                yield chunk
+
+        blocks: Iterator[bytes] = Decompressor.stream(counted(), zdict, size)
+        bytes_out: int = 0
+        seconds: float = 0.0
+
+        while True:
+            start: float = time.perf_counter()
+            block: Optional[bytes] = next(blocks, None)
+            seconds += time.perf_counter() - start
+
+            if block is None:
+                break
+
+            bytes_out += len(block)
+            yield block
+
+        cls.__record(Decompressor.name, "decompress", bytes_in[0], bytes_out, seconds)
+
+    @classmethod
+    def compress_stream(cls, compressor: Compressor, chunks: Iterable[bytes], level: Optional[int] = None, zdict: Optional[bytes] = None) -> Iterator[bytes]:
+        """Compresses chunks as they come, timed like compress (only the time spent compressing counts)."""
+        Incremental = compressor.compressor(level, zdict)
+        bytes_in: int = 0
+        bytes_out: int = 0
+        seconds: float = 0.0
+
+        for chunk in chunks:
+            start: float = time.perf_counter()
+            block: bytes = Incremental.compress(chunk)
+            seconds += time.perf_counter() - start
+
+            bytes_in += len(chunk)
+            bytes_out += len(block)
+
+            if block:
+                yield block
+
+        start: float = time.perf_counter()
+        block: bytes = Incremental.flush()
+        seconds += time.perf_counter() - start
+
+        cls.__record(compressor.name, "compress", bytes_in, bytes_out + len(block), seconds)
+        yield block
+
+    @classmethod
+    def adaptive(cls, data: bytes, target: float = 0.5, zdict: Optional[bytes] = None, key: Optional[str] = None) -> tuple[Compressor, bytes]:
+        """Compresses data with the cheapest compressor meeting target, gives it back with what it produced."""
+        if key is not None:
+            with cls._lock:
+                choice: Optional[tuple[str, Optional[int]]] = cls._choices.get(key)
+
+            if choice is not None:
+                compressor: Compressor = cls.get(choice[0])
+                result: bytes = cls.compress(compressor, data, choice[1], zdict)
+
+                if len(result) <= len(data) * target:
+                    return compressor, result
+
+        sample: bytes = data[:cls.Sample]
+        choice, result = cls.__trial(sample, target, zdict)
+
+        return cls.__choose(key, choice, data, result if len(sample) == len(data) else None, zdict)
+
+    @classmethod
+    def choose(cls, sample: bytes, target: float = 0.5, zdict: Optional[bytes] = None, key: Optional[str] = None) -> tuple[Compressor, Optional[int]]:
+        """
+        The compressor (and level) adaptive would use, for a payload only
+        known by its first bytes: the streamed ones are compressed as they
+        are written.
+        """
+        if key is not None:
+            with cls._lock:
+                choice: Optional[tuple[str, Optional[int]]] = cls._choices.get(key)
+
+            if choice is not None and len(cls.compress(cls.get(choice[0]), sample, choice[1], zdict)) <= len(sample) * target:
+                return cls.get(choice[0]), choice[1]
+
+        choice, result = cls.__trial(sample[:cls.Sample], target, zdict)
+        cls.__remember(key, choice)
+
+        return cls.get(choice[0]), choice[1]
+
+    @classmethod
+    def __trial(cls, sample: bytes, target: float, zdict: Optional[bytes]) -> tuple[tuple[str, Optional[int]], Optional[bytes]]:
+        """The choice for sample, with what it compressed sample to when it reached target."""
+        if cls.entropy(sample) > cls.Entropy:
+            return ("none", None), None
+
+        best: Optional[tuple[int, str, Optional[int]]] = None
+
+        for name, level in cls.Adaptive:
+            compressor: Compressor = cls.get(name)
+            result: bytes = cls.compress(compressor, sample, level, zdict)
+
+            if len(result) <= len(sample) * target:
+                return (name, level), result
+
+            if best is None or len(result) < best[0]:
+                best = (len(result), name, level)
+
+        # Nothing reaches the target, the best ratio is still better than nothing
+        if best[0] < len(sample):
+            return best[1:], None
+
+        return ("none", None), None
+
+    @staticmethod
+    def entropy(data: bytes) -> float:
+        """Shannon entropy of data, in bits per byte (8 for random bytes)."""
+        if not data:
+            return 0.0
+
+        total: int = len(data)
+        return max(0.0, -sum(count / total * math.log2(count / total) for count in (data.count(byte) for byte in set(data))))
+
+    @classmethod
+    def stats(cls) -> dict[str, dict[str, dict[str, float]]]:
+        """Calls, bytes, ratio, seconds and MB/s of each compressor, per operation."""
+        with cls._lock:
+            timings: dict[str, dict[str, list]] = {name: {operation: list(values) for operation, values in operations.items()} for name, operations in cls._timings.items()}
+
+        return {
+            name: {
+                operation: {
+                    "calls": calls,
+                    "bytes_in": bytes_in,
+                    "bytes_out": bytes_out,
+                    "ratio": bytes_out / bytes_in if bytes_in else 0.0,
+                    "seconds": seconds,
+                    "MB/s": bytes_in / seconds / 1e6 if seconds else 0.0
+                }
+                for operation, (calls, bytes_in, bytes_out, seconds) in operations.items()
+            }
+            for name, operations in timings.items()
+        }
+
+    @classmethod
+    def __choose(cls, key: Optional[str], choice: tuple[str, Optional[int]], data: bytes, result: Optional[bytes] = None, zdict: Optional[bytes] = None) -> tuple[Compressor, bytes]:
+        cls.__remember(key, choice)
+        compressor: Compressor = cls.get(choice[0])
+
+        if result is None:
+            result = cls.compress(compressor, data, choice[1], zdict)
+
+        return compressor, result
+
+    @classmethod
+    def __remember(cls, key: Optional[str], choice: tuple[str, Optional[int]]) -> None:
+        if key is None:
+            return
+
+        with cls._lock:
+            cls._choices[key] = choice
+            cls._choices.move_to_end(key)
+
+            while len(cls._choices) > cls.Choices:
+                cls._choices.popitem(last = False)
+
+    @classmethod
+    def __record(cls, name: str, operation: str, bytes_in: int, bytes_out: int, seconds: float) -> None:
+        with cls._lock:
+            values: list = cls._timings.setdefault(name, {}).setdefault(operation, [0, 0, 0, 0.0])
+
+            values[0] += 1
+            values[1] += bytes_in
+            values[2] += bytes_out
+            values[3] += seconds
+
+Compressions.register(NoCompressor())
+Compressions.register(ZlibCompressor())
+Compressions.register(LzmaCompressor())
+Compressions.register(Bz2Compressor())
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.03
@@ -0,0 +1,194 @@
+from Slazhe import Logger
+
+Log = Logger(__package__)
+
+from typing     import Any, Iterator, Optional
+from collections.abc import MutableMapping, MutableSequence
+from .cache     import MissingFiles
+from threading  import Lock
+
+import struct, zlib
+
+class DeltaLog:
+    """
+    Append-only log of field updates kept beside a storage file (<file>.delta).
+
+        header: magic(4) crc32 of the base file body(4)
+        record: length(4) crc32(4) flags(1) codec(1) body(length)
+
+    The base CRC ties the log to one version of the base file, a log left
+    behind by an interrupted compaction is ignored instead of being replayed
+    on top of the new file. Reading stops at the first torn or corrupted
+    record, the next append truncates it. The end of the valid records of a
+    log is kept once known (_tails), an append then only checks the log is
+    still as it was left (its stat) and appends: the log is read again only
+    when something else changed it.
+    """
+
+    MAGIC: bytes = b"SLZD"
+
+    # Size above which patch() rewrites the base file and drops the log
+    Limit: int = 64 * 1024
+
+    SET: int    = 0
+    DELETE: int = 1
+
+    _lock: Lock = Lock()
+
+    # Log -> (base crc, end of the valid records, stat) once read or appended to
+    _tails: dict[str, tuple[int, int, Any]] = {}
+
+    __header: struct.Struct = struct.Struct("<4sI")
+    __record: struct.Struct = struct.Struct("<IIBB")
+
+    @staticmethod
+    def path(File: str) -> str:
+        return f"{File}.delta"
+
+    @classmethod
+    def stat(cls, backend: Any, File: str) -> Optional[tuple[int, int]]:
+        Delta: str = cls.path(File)
+
+        if MissingFiles.has(Delta):
+            return None
+
+        Stat: Optional[tuple[int, int]] = backend.stat(Delta)
+
+        if Stat is None:
+            MissingFiles.add(Delta)
+
+        return Stat
+
+    @classmethod
+    def records(cls, backend: Any, File: str, base_crc: int) -> Iterator[tuple[int, int, bytes]]:
+        """Yields (flags, codec, body) for every valid record of the log of File."""
+        if cls.stat(backend, File) is None:
+            return
+
+        Read: Optional[tuple[bytes, Any]] = backend.read(cls.path(File))
+
+        if Read is None or cls.__base(Read[0]) != base_crc:
+            return
+
+        End: int = cls.__header.size
+
+        for flags, codec, body, End in cls.__scan(Read[0]):
+            yield flags, codec, body
+
+        if End == len(Read[0]):
+            with cls._lock:
+                cls._tails[cls.path(File)] = (base_crc, End, Read[1])
+
+    @classmethod
+    def append(cls, backend: Any, File: str, base_crc: int, flags: int, codec: int, body: bytes, fsync: str = 'batch') -> int:
+        """Appends a record and returns the new size of the log."""
+        with cls._lock:
+            return cls.__append(backend, File, base_crc, flags, codec, body, fsync)
+
+    @classmethod
+    def __append(cls, backend: Any, File: str, base_crc: int, flags: int, codec: int, body: bytes, fsync: str) -> int:
+        Delta: str = cls.path(File)
+        Record: bytes = cls.__record.pack(len(body), zlib.crc32(bytes((flags, codec)) + body), flags, codec) + body
+
+        Tail: Optional[tuple[int, int, Any]] = cls._tails.pop(Delta, None)
+
+        if Tail is not None and Tail[0] == base_crc and backend.stat(Delta) == Tail[2]:
+            Size: int = backend.append(Delta, Record, fsync)
+        else:
+            Size: int = cls.__rewrite(backend, Delta, base_crc, Record, fsync)
+
+        cls._tails[Delta] = (base_crc, Size, backend.stat(Delta))
+        MissingFiles.discard(Delta)
+        return Size
+
+    @classmethod
+    def __rewrite(cls, backend: Any, Delta: str, base_crc: int, Record: bytes, fsync: str) -> int:
+        Read: Optional[tuple[bytes, Any]] = backend.read(Delta)
+        Data: bytes = Read[0] if Read is not None else b""
+
+        # A log of another base is stale, a torn tail is cut before appending after it
+        if cls.__base(Data) != base_crc:
+            Data = cls.__header.pack(cls.MAGIC, base_crc) + Record
+        else:
+            End: int = cls.__header.size
+
+            for *_, end in cls.__scan(Data):
+                End = end
+
+            Data = Data[:End] + Record if End < len(Data) else None
+
+        if Data is None:
+            return backend.append(Delta, Record, fsync)
+
+        backend.write(Delta, Data, fsync)
+        return len(Data)
+
+    @classmethod
+    def discard(cls, backend: Any, File: str) -> None:
+        if cls.stat(backend, File) is None:
+            return
+
+        with cls._lock:
+            backend.delete(cls.path(File))
+            cls._tails.pop(cls.path(File), None)
+            MissingFiles.add(cls.path(File))
+
+    @classmethod
+    def apply(cls, data: Any, op: int, path: list, value: Any = None) -> None:
+        """Replays one update on data (plain, or an EDict / EList), path is the list of keys leading to the field."""
+        if not path:
+            raise ValueError("empty path")
+
+        for key in path[:-1]:
+            if isinstance(data, MutableMapping):
+                if not isinstance(data.get(key), (MutableMapping, MutableSequence)):
+                    if op == cls.DELETE:
+                        return
+
+                    data[key] = {}
+
+                data = data[key]
+
+            elif isinstance(data, MutableSequence):
+                data = data[key]
+
+            else:
+                raise TypeError(f"can't go through {type(data).__name__} at {key!r}")
+
+        if op == cls.SET:
+            data[path[-1]] = value
+
+        elif op == cls.DELETE:
+            if isinstance(data, MutableMapping):
+                data.pop(path[-1], None)
+            elif isinstance(data, MutableSequence) and -len(data) <= path[-1] < len(data):
+                del data[path[-1]]
+
+        else:
+            raise ValueError(f"unknown operation {op}")
+
+    @classmethod
+    def __base(cls, Data: bytes) -> Optional[int]:
+        if len(Data) < cls.__header.size:
+            return None
+
+        magic, base_crc = cls.__header.unpack_from(Data)
+        return base_crc if magic == cls.MAGIC else None
+
+    @classmethod
+    def __scan(cls, Data: bytes) -> Iterator[tuple[int, int, bytes, int]]:
+        Offset: int = cls.__header.size
+
+        while Offset + cls.__record.size <= len(Data):
+            length, crc, flags, codec = cls.__record.unpack_from(Data, Offset)
+            Start: int = Offset + cls.__record.size
+            End: int = Start + length
+
+            if End > len(Data) or zlib.crc32(Data[Start - 2:End]) != crc:
+                return
+
+            yield flags, codec, Data[Start:End], End
+            Offset = End
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.04
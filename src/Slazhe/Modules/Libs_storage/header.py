@@ -0,0 +1,92 @@
+from typing import Optional, Self, Any
+
+import struct, zlib
+
+class Header:
+    """
+    Small header written in front of every .slze file.
+
+    It tells open() which pipeline produced the file so it doesn't have to
+    guess, and carries a CRC32 of the body to catch corrupted files.
+
+        v1: magic(4) version(1) serializer(1) compression(1) flags(1) crc32(4)
+        v2: magic(4) version(1) serializer(1) compression(1) flags(1) zdict(4) crc32(4)
+
+    zdict is the id of the preset dictionary the body was compressed with
+    (see zdict.py), 0 for none. v1 files are still read, only v2 is written.
+    """
+
+    MAGIC: bytes    = b"SLZE"
+    VERSION: int    = 2
+
+    __struct_v1: struct.Struct = struct.Struct("<4sBBBBI")
+    __struct: struct.Struct = struct.Struct("<4sBBBBII")
+    # Enough to read the header of any version
+    SIZE: int = __struct.size
+
+    # Serializers, the output of a savefunc (raw bytes or pickled). Higher ids are the codecs (see codecs.py)
+    RAW: int        = 0
+    PICKLE: int     = 1
+
+    # Compressions (see compression.py)
+    NONE: int       = 0
+    ZLIB: int       = 1
+    LZMA: int       = 2
+    BZ2: int        = 3
+
+    # Flags
+    ENCRYPTED: int  = 1 << 0    # Storage key (slazhe_crypto_password)
+    PASSWORD: int   = 1 << 1    # User password
+    STREAM: int     = 1 << 2    # ENCRYPTED as a CryptoStream (chunk by chunk) rather than in one call
+
+    __slots__ = ("version", "serializer", "compression", "flags", "zdict", "crc")
+
+    def __init__(self, serializer: int, compression: int, flags: int = 0, crc: int = 0, version: int = VERSION, zdict: int = 0) -> None:
+        self.version: int       = version
+        self.serializer: int    = serializer
+        self.compression: int   = compression
+        self.flags: int         = flags
+        self.zdict: int         = zdict
+        self.crc: int           = crc
+
+    @property
+    def size(self) -> int:
+        """Length of this header in the file, the body starts right after."""
+        return self.__struct_v1.size if self.version == 1 else self.__struct.size
+
+    def pack(self, body: bytes) -> bytes:
+        return self.head(zlib.crc32(body)) + body
+
+    def head(self, crc: int) -> bytes:
+        """The header alone, for a body written apart whose crc32 is crc."""
+        return self.__struct.pack(self.MAGIC, self.VERSION, self.serializer, self.compression, self.flags, self.zdict, crc)
+
+    def check(self, body: bytes) -> bool:
+        return zlib.crc32(body) == self.crc
+
+    @classmethod
+    def read(cls, backend: Any, File: str) -> Optional[Self]:
+        """Header of a stored file, None if it is missing or headerless."""
+        return cls.unpack(backend.head(File, cls.SIZE) or b"")
+
+    @classmethod
+    def unpack(cls, data: bytes) -> Optional[Self]:
+        """Returns the header of data, or None for a legacy headerless file."""
+        # data may be a memoryview of a mapped file
+        if len(data) < cls.__struct_v1.size or bytes(data[:4]) != cls.MAGIC:
+            return None
+
+        version: int = data[4]
+
+        if version == 1:
+            magic, version, serializer, compression, flags, crc = cls.__struct_v1.unpack_from(data)
+            return cls(serializer, compression, flags, crc, version)
+
+        if version > cls.VERSION or len(data) < cls.__struct.size:
+            return None
+
+        magic, version, serializer, compression, flags, zdict, crc = cls.__struct.unpack_from(data)
+        return cls(serializer, compression, flags, crc, version, zdict)
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.08
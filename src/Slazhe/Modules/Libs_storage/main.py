@@ -1,15 +1,42 @@
 from .save import StorageSave
 from .open import StorageOpen
+from .aio  import StorageAsync
+from .patch import StoragePatch
+from .zdict import StorageDictionary
+from .backup import StorageBackup
+from .codecs import Codec, Codecs
+from .compression import Compressions
+from .backends import Backend, Backends
+from .writebehind import WriteBehind
+from .zdict import ZDicts
 
 import os
 
-from typing import Callable, Optional, Any, Union
+from typing import Callable, Optional, Any, Union, Literal
 
-class Storage(StorageSave, StorageOpen):
-    def __init__(self, path: str, KeyOrUser: Union[list[int], Any], savefunc: Optional[Callable] = False, openfunc: Optional[Callable] = False, compression: Optional[bool] = False, encrypt: Optional[bool] = False) -> None:
+class Storage(StorageSave, StorageOpen, StorageAsync, StoragePatch, StorageDictionary, StorageBackup):
+    def __init__(self, path: str, KeyOrUser: Union[list[int], Any], savefunc: Optional[Callable] = False, openfunc: Optional[Callable] = False, compression: Union[bool, str] = False, encrypt: Optional[bool] = False, write_behind: float = 0, fsync: Literal['none', 'batch', 'always'] = 'batch', codec: Optional[str] = None, backend: Optional[str] = None, zdict: bool = False, compress_min: int = 64, compress_level: Optional[int] = None, compress_target: float = 0.5) -> None:
         self.path: str  = path
-        self.compression: bool  = compression
+
+        # True (zlib), "zlib", "lzma", "bz2", "none" or "adaptive" (the cheapest one compressing under compress_target)
+        if compression and compression is not True and compression != "adaptive":
+            Compressions.get(compression)
+
+        self.compression: Union[bool, str] = compression
+        self.compress_level: Optional[int] = compress_level
+        self.compress_target: float        = compress_target
+        # zdict: compress with the dictionary trained on this path, payloads under compress_min bytes stay as they are
+        self.zdict: bool         = zdict
+        self.compress_min: int   = compress_min
         self.encrypt: bool      = encrypt
+        self.write_behind: float = write_behind
+        self.fsync: str          = fsync
+
+        # With a codec the data is encoded directly, savefunc is then unused and openfunc only reads the legacy files
+        self.codec: Optional[Codec] = Codecs.get(codec) if codec else None
+
+        # "file", "sqlite" or "packed", Backends.Default when not given
+        self.backend: Backend = Backends.get(backend)(path)
 
 
         if savefunc:
@@ -24,8 +51,19 @@ class Storage(StorageSave, StorageOpen):
             self.slazhe_crypto          = SlazheImporter.SlazheCrypto()
             self.slazhe_crypto_password = SlazheImporter.SlazheCrypto.GSP(str(KeyOrUser)) if not isinstance(KeyOrUser, list) else KeyOrUser
 
+    def has(self, file: str) -> bool:
+        File: str = os.path.abspath(f'{self.path}/{file}')
+        return WriteBehind.pending(File) or self.backend.exists(File)
+
     @classmethod
     def exists(cls, path: str) -> bool:
         return os.path.exists(path)
+
+    @classmethod
+    def release(cls, path: str) -> None:
+        """Let go of the databases kept open under path, to call before removing it."""
+        WriteBehind.flush()
+        Backends.close(path)
+        ZDicts.forget(os.path.abspath(path))
 # Version Globale: v00.00.00.pl
-# Version du fichier: v00.00.00.04
+# Version du fichier: v00.00.00.0e
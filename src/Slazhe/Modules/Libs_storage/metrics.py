@@ -0,0 +1,139 @@
+from typing     import Optional, Any
+from threading  import Lock
+
+import os, json, time, atexit
+
+class StorageMetrics:
+    """
+    What the storages read and write, and where the time goes.
+
+    Per file: reads (cache hits apart), writes, bytes and seconds. Per stage
+    (open.disk, open.crypto, open.decompress, open.deserialize, save.compress,
+    ...): calls, bytes, seconds and the slowest call. Only counters are kept,
+    recording costs a lock and a few additions. SLAZHE_STORAGE_METRICS=0
+    turns it off, SLAZHE_STORAGE_METRICS_DUMP=<file> writes them to file at exit.
+    """
+
+    Enabled: bool   = os.environ.get("SLAZHE_STORAGE_METRICS", "1") != "0"
+    # Files tracked at most, the least used half is dropped past it
+    Paths: int      = 4096
+
+    # File -> [reads, cache hits, writes, bytes read, bytes written, seconds]
+    _paths: dict[str, list] = {}
+    # Stage -> [calls, bytes, seconds, slowest]
+    _stages: dict[str, list] = {}
+    _since: float = time.time()
+    _lock: Lock = Lock()
+
+    @classmethod
+    def stage(cls, stage: str, size: int, seconds: float) -> None:
+        if not cls.Enabled:
+            return
+
+        with cls._lock:
+            values: list = cls._stages.get(stage)
+
+            if values is None:
+                values = cls._stages[stage] = [0, 0, 0.0, 0.0]
+
+            values[0] += 1
+            values[1] += size
+            values[2] += seconds
+
+            if seconds > values[3]:
+                values[3] = seconds
+
+    @classmethod
+    def read(cls, File: str, size: int, seconds: float, cached: bool = False) -> None:
+        if not cls.Enabled:
+            return
+
+        with cls._lock:
+            values: list = cls.__path(File)
+
+            values[0] += 1
+            values[1] += cached
+            values[3] += size
+            values[5] += seconds
+
+    @classmethod
+    def write(cls, File: str, size: int, seconds: float) -> None:
+        if not cls.Enabled:
+            return
+
+        with cls._lock:
+            values: list = cls.__path(File)
+
+            values[2] += 1
+            values[4] += size
+            values[5] += seconds
+
+    @classmethod
+    def hot(cls, count: int = 10) -> list[tuple[str, dict[str, Any]]]:
+        """The count files read and written the most."""
+        with cls._lock:
+            paths: list[tuple[str, list]] = sorted(cls._paths.items(), key = lambda item: item[1][0] + item[1][2], reverse = True)[:count]
+
+            return [(File, cls.__path_dict(values)) for File, values in paths]
+
+    @classmethod
+    def slowest(cls, count: int = 10) -> list[tuple[str, dict[str, Any]]]:
+        """The count stages taking the most time overall."""
+        with cls._lock:
+            stages: list[tuple[str, list]] = sorted(cls._stages.items(), key = lambda item: item[1][2], reverse = True)[:count]
+
+            return [(stage, cls.__stage_dict(values)) for stage, values in stages]
+
+    @classmethod
+    def dump(cls, file: Optional[str] = None, count: int = 50) -> dict[str, Any]:
+        """Snapshot of the metrics (count hottest files), written as JSON to file when given."""
+        snapshot: dict[str, Any] = {
+            "since": cls._since,
+            "at": time.time(),
+            "files": dict(cls.hot(count)),
+            "stages": dict(cls.slowest(len(cls._stages)))
+        }
+
+        if file is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(file)), exist_ok = True)
+
+            with open(file, "w", encoding = "utf-8") as IOFile:
+                json.dump(snapshot, IOFile, indent = 4)
+
+        return snapshot
+
+    @classmethod
+    def reset(cls) -> None:
+        with cls._lock:
+            cls._paths.clear()
+            cls._stages.clear()
+            cls._since = time.time()
+
+    @classmethod
+    def __path(cls, File: str) -> list:
+        values: Optional[list] = cls._paths.get(File)
+
+        if values is None:
+            if len(cls._paths) >= cls.Paths:
+                for Cold in sorted(cls._paths, key = lambda File: cls._paths[File][0] + cls._paths[File][2])[:cls.Paths // 2]:
+                    del cls._paths[Cold]
+
+            values = cls._paths[File] = [0, 0, 0, 0, 0, 0.0]
+
+        return values
+
+    @staticmethod
+    def __path_dict(values: list) -> dict[str, Any]:
+        reads, hits, writes, bytes_read, bytes_written, seconds = values
+        return {"reads": reads, "cache_hits": hits, "writes": writes, "bytes_read": bytes_read, "bytes_written": bytes_written, "seconds": seconds}
+
+    @staticmethod
+    def __stage_dict(values: list) -> dict[str, Any]:
+        calls, size, seconds, slowest = values
+        return {"calls": calls, "bytes": size, "seconds": seconds, "average": seconds / calls if calls else 0.0, "slowest": slowest}
+
+if os.environ.get("SLAZHE_STORAGE_METRICS_DUMP"):
+    atexit.register(StorageMetrics.dump, os.environ["SLAZHE_STORAGE_METRICS_DUMP"])
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.01
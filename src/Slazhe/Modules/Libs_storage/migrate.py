@@ -0,0 +1,83 @@
+from Slazhe import Logger
+
+Log = Logger(__package__)
+
+from typing             import Optional
+from concurrent.futures import ThreadPoolExecutor
+from .backends          import Backend, Backends, FileBackend, SQLiteBackend
+from .cache             import MissingFiles
+
+import os
+
+# Only the storage files, their delta logs and the zlib dictionaries are moved, databases and leftovers stay where they are
+Suffixes: tuple[str, ...] = (".slze", ".slze.delta", ".zd")
+
+def slazhe_namespaces(root: str = "var") -> list[str]:
+    """Storage paths used by Slazhe: the users, the bot manager and every bot."""
+    namespaces: list[str] = [os.path.join(root, "slazhe-users"), os.path.join(root, "Slazhe-Bots")]
+
+    try:
+        with os.scandir(namespaces[1]) as entries:
+            namespaces.extend(entry.path for entry in entries if entry.is_dir())
+    except FileNotFoundError:
+        pass
+
+    return namespaces
+
+def migrate_storage(namespaces: list[str], backend: str = "sqlite", workers: int = 4, remove: bool = False, skip: tuple[str, ...] = ("Prefixes",)) -> dict[str, Optional[int]]:
+    """
+    Copy the files of each storage path (namespace) into another backend.
+
+    The bytes are copied as they are, headers, compression and encryption
+    included, so nothing has to be decoded nor any key known. Namespaces run
+    in parallel, a folder that is itself a namespace is left to its own job
+    and the folders named in skip (the legacy prefix files, read from disk by
+    their own migration) are not touched.
+    Returns the number of files copied per namespace, None for a failure.
+    """
+    roots: set[str] = {os.path.abspath(namespace) for namespace in namespaces}
+
+    with ThreadPoolExecutor(max_workers = workers, thread_name_prefix = "Slazhe-Migrate") as executor:
+        results = executor.map(lambda namespace: _migrate(namespace, roots, backend, remove, skip), namespaces)
+        return dict(zip(namespaces, results))
+
+def _migrate(namespace: str, roots: set[str], backend: str, remove: bool, skip: tuple[str, ...]) -> Optional[int]:
+    root: str = os.path.abspath(namespace)
+    files: list[str] = []
+
+    for folder, folders, names in os.walk(root):
+        folders[:] = [name for name in folders if name not in skip and os.path.join(folder, name) not in roots]
+        files.extend(os.path.join(folder, name) for name in names if name.endswith(Suffixes))
+
+    if not files:
+        return 0
+
+    target: Backend = Backends.get(backend)(namespace)
+    source: FileBackend = FileBackend(namespace)
+
+    try:
+        items: list[tuple[str, bytes]] = [(File, source.read(File)[0]) for File in files]
+
+        if isinstance(target, SQLiteBackend):
+            target.write_many(items)
+        else:
+            for File, Data in items:
+                target.write(File, Data)
+
+    except Exception as e:
+        Log.Error(f"Unable to migrate {namespace} to {backend}: {e}")
+        return None
+
+    finally:
+        # What was missing from the files may be in the other backend now
+        MissingFiles.forget(root)
+
+    if remove and not isinstance(target, FileBackend):
+        for File in files:
+            source.delete(File)
+
+    Log.Info(f"{len(files)} files of {namespace} migrated to {backend}.")
+    return len(files)
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.03
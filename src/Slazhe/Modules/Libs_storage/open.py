@@ -2,13 +2,25 @@ from Slazhe import Logger
 
 Log = Logger(__package__)
 
-from typing         import Optional, Any, Callable
-from .CustomTypes   import EBase, to_extended
+from typing         import Optional, Any, Callable, Union, Iterator
+from .CustomTypes   import EBase, to_extended, mark_clean, origin, content_digest
+from .cache         import MissingFiles, ObjectCache
+from .writebehind   import WriteBehind
+from .header        import Header
+from .codecs        import Codecs
+from .compression   import Compressions, StreamReader
+from .metrics       import StorageMetrics
+from time           import perf_counter
+from .delta         import DeltaLog
 
 import pickle
-import os, zlib
+import os, io, zlib, hashlib
 
 class StorageOpen:
+    # Files from this size on are mapped and decompressed as they are deserialized instead of in one go
+    StreamMin: int   = 1 << 20
+    StreamChunk: int = 1 << 20
+
     def GDB(self, value: Any) -> Callable:
         def decorator() -> Any:
             return value
@@ -16,67 +28,300 @@ class StorageOpen:
 
     def open(self, file: str, default: Optional[Any] = None, password: Optional[str] = None) -> EBase:
         File: str = os.path.abspath(f'{self.path}/{file}')
-        Path: str = os.path.dirname(File)
+        Start: float = perf_counter()
 
-        os.makedirs(Path, 777, exist_ok = True)
+        # A deferred save of this file must land before we read it back
+        if WriteBehind.pending(File):
+            WriteBehind.flush(File)
 
-        try:
-            IOFile = open(File, 'rb')
-        except FileNotFoundError:
-            result = to_extended(default)
+        if MissingFiles.has(File):
+            result = to_extended(default, shared = True)
             result.SlazheStorageFile = self.GDB(file)
+            mark_clean(result, False)
             return result
 
+        try:
+            Stat = self.backend.stat(File)
+
+            if Stat is not None:
+                Cached, Entry = ObjectCache.get(self.__cache_key(File, Stat, password))
+
+                if not Cached:
+                    Stage: float = perf_counter()
+                    Read = (self.backend.map(File) if Stat[1] >= self.StreamMin else None) or self.backend.read(File)
+                    Stat = Read[1] if Read is not None else None
+
+                    StorageMetrics.stage("open.disk", Stat[1] if Stat is not None else 0, perf_counter() - Stage)
+
         except Exception as e:
-            result = to_extended(default)
+            Log.Error(f"Unable to read {File}: {e}")
+
+            result = to_extended(default, shared = True)
             result.SlazheStorageFile = self.GDB(file)
+            mark_clean(result, False)
             return result
 
-        CompressedData: bytes = IOFile.read()
-        IOFile.close()
+        if Stat is None:
+            MissingFiles.add(File)
 
-        slazhe_crypto_enable = hasattr(self, 'slazhe_crypto')
+            result = to_extended(default, shared = True)
+            result.SlazheStorageFile = self.GDB(file)
+            mark_clean(result, False)
+            return result
 
-        if slazhe_crypto_enable:
+        # The cached payload is handed out as is, it is copied on its first mutation
+        if Cached:
+            result = to_extended(Entry[0], shared = True)
+            result.SlazheStorageFile = self.GDB(file)
+            mark_clean(result, origin = origin(self, File, password), digest = Entry[1])
+
+            StorageMetrics.read(File, 0, perf_counter() - Start, cached = True)
+            return result
+
+        # bytes, or a memoryview of the mapped file
+        RawData: Union[bytes, memoryview] = Read[0]
+        CacheKey: tuple = self.__cache_key(File, Stat, password)
+
+        FileHeader: Optional[Header] = Header.unpack(RawData)
+
+        if FileHeader is None:
+            Data, Size = self.__decode_legacy(File, bytes(RawData), password)
+            Digest: Optional[bytes] = None
+
+        else:
             try:
-                DecryptedData: bytes = self.slazhe_crypto.secure_decrypt(CompressedData, self.slazhe_crypto_password)
-            except Exception:
-                DecryptedData: bytes = CompressedData
+                Data, Size, Digest = self.__decode(File, FileHeader, RawData[FileHeader.size:], password)
+            except Exception as e:
+                Log.Error(f"Unable to read {File}: {e}")
 
-            if DecryptedData == "":
-                DecryptedData: bytes = CompressedData
+                result = to_extended(default, shared = True)
+                result.SlazheStorageFile = self.GDB(file)
+                mark_clean(result, False)
+                return result
 
+        # Codecs give back the data itself, only the savefunc pipeline needs the openfunc
+        if FileHeader is None or FileHeader.serializer in (Header.RAW, Header.PICKLE):
+            FormatedData: Any = getattr(self, 'OpenFunctionFormat', lambda data: data)(Data)
         else:
-            DecryptedData: bytes = CompressedData
+            FormatedData: Any = Data
+
+        if FileHeader is not None:
+            Stage: float = perf_counter()
+            self.__replay(File, FileHeader.crc, FormatedData, password)
+            StorageMetrics.stage("open.replay", 0, perf_counter() - Stage)
+
+        # Digest of the body as save() serializes it, a replayed log makes it differ and the next save compacts
+        Cached = ObjectCache.put(CacheKey, (FormatedData, Digest), Size)
+
+        result = to_extended(FormatedData, shared = Cached)
+        result.SlazheStorageFile = self.GDB(file)
+        mark_clean(result, origin = origin(self, File, password), digest = Digest)
+
+        StorageMetrics.read(File, Stat[1], perf_counter() - Start)
+        return result
+
+    def __replay(self, File: str, base_crc: int, data: Any, password: Optional[str] = None) -> None:
+        for flags, codec, body in DeltaLog.records(self.backend, File, base_crc):
+            try:
+                if flags & Header.ENCRYPTED:
+                    body = self.slazhe_crypto.secure_decrypt(body, self.slazhe_crypto_password, File)
+
+                if flags & Header.PASSWORD:
+                    if not password:
+                        raise ValueError("the patch is protected by a password")
+
+                    body = self.slazhe_crypto.secure_decrypt(body, self.slazhe_crypto.get_secure_password(password), File)
+
+                DeltaLog.apply(data, *Codecs.get(codec).decode(body))
+            except Exception as e:
+                Log.Error(f"Unable to replay a patch of {File}: {e}")
+                return
+
+    def __cache_key(self, File: str, Stat: tuple[int, int], password: Optional[str]) -> tuple:
+        return (File, Stat, DeltaLog.stat(self.backend, File), password, self.__cache_scope(), getattr(self, 'OpenFunctionFormat', None))
+
+    def __cache_scope(self) -> tuple:
+        # Storages opening a file with another key must not share what it decodes to
+        if getattr(getattr(self, 'slazhe_crypto', None), 'SCrypto', None) is None:
+            return ()
+
+        return tuple(self.slazhe_crypto_password)
+
+    def sample(self, file: str) -> Optional[bytes]:
+        """
+        The serialized content of file, as the compressor saw it. None when
+        it is missing, unreadable or protected by a password (used to train
+        the dictionaries).
+        """
+        File: str = os.path.abspath(f'{self.path}/{file}')
 
-        ZlibDecompressor: zlib._Decompress = zlib.decompressobj()
         try:
-            DecompressedData: bytes = ZlibDecompressor.decompress(DecryptedData)
+            Read = self.backend.read(File)
+            FileHeader: Optional[Header] = Header.unpack(Read[0]) if Read is not None else None
+
+            if FileHeader is None or FileHeader.flags & Header.PASSWORD:
+                return None
+
+            return self.__unwrap(File, FileHeader, Read[0][FileHeader.size:])
         except Exception:
-            DecompressedData: bytes = DecryptedData
+            return None
+
+    def __unwrap(self, File: str, FileHeader: Header, Body: bytes) -> bytes:
+        if not FileHeader.check(Body):
+            raise ValueError("checksum mismatch, the file is corrupted")
+
+        if FileHeader.flags & Header.ENCRYPTED:
+            Stage: float = perf_counter()
+
+            if FileHeader.flags & Header.STREAM:
+                Body = b"".join(self.slazhe_crypto.decrypt_stream([Body], self.slazhe_crypto_password))
+            else:
+                Body = self.slazhe_crypto.secure_decrypt(Body, self.slazhe_crypto_password, File)
 
-        if password and slazhe_crypto_enable:
-            result = ""
+            StorageMetrics.stage("open.crypto", len(Body), perf_counter() - Stage)
+
+        if FileHeader.compression != Header.NONE:
+            Stage: float = perf_counter()
+            Body = Compressions.decompress(FileHeader.compression, Body, self.__zdict(FileHeader))
+            StorageMetrics.stage("open.decompress", len(Body), perf_counter() - Stage)
+
+        return Body
+
+    def __zdict(self, FileHeader: Header) -> Optional[bytes]:
+        if not FileHeader.zdict:
+            return None
+
+        Dictionary: Optional[tuple[int, bytes]] = self.dictionary(FileHeader.zdict)
+
+        if Dictionary is None:
+            raise ValueError(f"missing dictionary {FileHeader.zdict:08x}")
+
+        return Dictionary[1]
+
+    @staticmethod
+    def __hashed(Blocks: Iterator[bytes], Hash: Any) -> Iterator[bytes]:
+        for Block in Blocks:
+            Hash.update(Block)
+            yield Block
+
+    def __stream(self, FileHeader: Header, Body: memoryview) -> tuple[Any, int, Optional[bytes]]:
+        """
+        __decode for the large files: the body is decrypted (a CryptoStream)
+        and decompressed chunk by chunk while the deserializer reads it, the
+        payload is never in memory as a whole.
+        """
+        if not FileHeader.check(Body):
+            raise ValueError("checksum mismatch, the file is corrupted")
+
+        Chunks = (Body[i:i + self.StreamChunk] for i in range(0, len(Body), self.StreamChunk))
+
+        if FileHeader.flags & Header.ENCRYPTED:
+            Chunks = self.slazhe_crypto.decrypt_stream(Chunks, self.slazhe_crypto_password)
+        Hash = hashlib.blake2b(digest_size = 16)
+        Reader: StreamReader = StreamReader(self.__hashed(Compressions.stream(FileHeader.compression, Chunks, self.__zdict(FileHeader), self.StreamChunk), Hash))
+
+        Stage: float = perf_counter()
+
+        with io.BufferedReader(Reader, self.StreamChunk) as Buffered:
+            if FileHeader.serializer == Header.PICKLE:
+                Data: Any = pickle.load(Buffered, encoding="utf-8", errors="replace")
+            elif FileHeader.serializer == Header.RAW:
+                Data: Any = Buffered.read().decode("utf-8", "replace")
+            else:
+                Data: Any = Codecs.get(FileHeader.serializer).load(Buffered)
+
+        # Decompression and deserialization are interleaved here
+        StorageMetrics.stage("open.stream", Reader.size, perf_counter() - Stage)
+        # Should the deserializer stop before the end, the digest won't match and the next save writes
+        return Data, Reader.size, Hash.digest()
+
+    def __decode(self, File: str, FileHeader: Header, Body: Union[bytes, memoryview], password: Optional[str] = None) -> tuple[Any, int, Optional[bytes]]:
+        # Files encrypted in one call (and those protected by a password) can only be decrypted whole
+        Whole: bool = FileHeader.flags & Header.PASSWORD or (FileHeader.flags & Header.ENCRYPTED and not FileHeader.flags & Header.STREAM)
+
+        if len(Body) >= self.StreamMin and not Whole:
+            return self.__stream(FileHeader, memoryview(Body))
+
+        Body = self.__unwrap(File, FileHeader, bytes(Body))
+
+        if FileHeader.flags & Header.PASSWORD:
+            if not password:
+                raise ValueError("the file is protected by a password")
+
+            Stage: float = perf_counter()
+            Body = self.slazhe_crypto.secure_decrypt(Body, self.slazhe_crypto.get_secure_password(password), File)
+            StorageMetrics.stage("open.crypto", len(Body), perf_counter() - Stage)
+
+        Stage: float = perf_counter()
+
+        if FileHeader.serializer == Header.PICKLE:
+            Data: Any = pickle.loads(Body, encoding="utf-8", errors="replace")
+        elif FileHeader.serializer == Header.RAW:
+            Data: Any = Body.decode("utf-8", "replace")
+        else:
+            Data: Any = Codecs.get(FileHeader.serializer).decode(Body)
+
+        StorageMetrics.stage("open.deserialize", len(Body), perf_counter() - Stage)
+        return Data, len(Body), content_digest(Body)
+
+    def __decode_legacy(self, File: str, CompressedData: bytes, password: Optional[str] = None) -> tuple[Any, int]:
+        # Files written before the header, the pipeline has to be guessed. They get a header on their next save
+        slazhe_crypto_enable = getattr(getattr(self, 'slazhe_crypto', None), 'SCrypto', None) is not None
+
+        # Random data passes the CBC padding check once in 4096, decrypting is only tried on what can't be read as is
+        DecryptedData: bytes = CompressedData
+
+        if slazhe_crypto_enable and getattr(self, "encrypt", True) and self.__legacy_zlib(CompressedData) is None and not self.__legacy_plain(CompressedData):
+            try:
+                DecryptedData = self.slazhe_crypto.secure_decrypt(CompressedData, self.slazhe_crypto_password, File) or CompressedData
+            except Exception:
+                pass
+
+        DecompressedData: bytes = self.__legacy_zlib(DecryptedData)
+
+        if DecompressedData is None:
+            DecompressedData = DecryptedData
+
+        if password and slazhe_crypto_enable and not self.__legacy_plain(DecompressedData):
             try:
-                result = self.slazhe_crypto.secure_decrypt(DecompressedData, self.slazhe_crypto.get_secure_password(password))
+                DecompressedData = self.slazhe_crypto.secure_decrypt(DecompressedData, self.slazhe_crypto.get_secure_password(password), File) or DecompressedData
             except Exception:
                 pass
 
-            if result != "":
-                DecompressedData = result
+        try:
+            return pickle.loads(DecompressedData, encoding="utf-8", errors="replace"), len(DecompressedData)
+        except Exception:
+            return DecompressedData.decode("utf-8", "replace"), len(DecompressedData)
+
+    @staticmethod
+    def __legacy_zlib(Data: bytes) -> Optional[bytes]:
+        """Data decompressed, None unless it is a whole zlib stream (its checksum included)."""
+        ZlibDecompressor: zlib._Decompress = zlib.decompressobj()
 
         try:
-            Data = pickle.loads(DecompressedData, encoding="utf-8", errors="replace")
-        except pickle.UnpicklingError:
-            Data = DecompressedData.decode("utf-8", "replace")
+            DecompressedData: bytes = ZlibDecompressor.decompress(Data)
+        except zlib.error:
+            return None
 
-        FormatedData: Any = getattr(self, 'OpenFunctionFormat', lambda data: data)(Data)
+        if not ZlibDecompressor.eof or ZlibDecompressor.unused_data:
+            return None
 
-        result = to_extended(FormatedData)
-        result.SlazheStorageFile = self.GDB(file)
+        return DecompressedData
 
+    @staticmethod
+    def __legacy_plain(Data: bytes) -> bool:
+        """True when Data reads as a pickle or as UTF-8 text, what a legacy file holds once decrypted."""
+        try:
+            pickle.loads(Data)
+            return True
+        except Exception:
+            pass
 
-        return result
+        try:
+            Data.decode("utf-8")
+            return True
+        except UnicodeDecodeError:
+            return False
 
 # Version Globale: v00.00.00.pl
-# Version du fichier: v00.00.00.03
+# Version du fichier: v00.00.00.0p
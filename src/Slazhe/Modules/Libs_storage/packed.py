@@ -0,0 +1,348 @@
+from Slazhe import Logger
+
+Log = Logger(__package__)
+
+from typing     import BinaryIO, Optional
+from threading  import RLock, Thread
+
+import struct, zlib
+import os
+
+class Pack:
+    """
+    Append-only segment files holding many small named blobs.
+
+        segment: magic(4) base(4) record*
+        record:  op(1) name length(2) data length(4) crc32(4) name data
+
+    Every write appends a record to the active segment and moves the
+    in-memory index entry of its name, a delete appends a tombstone. The
+    index is rebuilt at startup by scanning the segments in order, a torn
+    record ends a segment and is cut from the active one.
+
+    Compaction copies the live blobs to new segments, then writes in the
+    first one's header the last segment it replaces (its base): segments up
+    to the base are ignored (and removed) even if a crash left them behind.
+    The copies are made blob by blob next to the segments (.compact files)
+    without the lock, writes go on meanwhile and are carried over when the
+    copies are swapped in. A closed pack (closed) can't be used anymore.
+    """
+
+    MAGIC: bytes = b"SLZP"
+
+    # Size of a segment before a new one is started
+    SegmentLimit: int = 4 * 1024 * 1024
+
+    # Compaction starts once the pack is that big and less than half of it is live
+    CompactMin: int = 1024 * 1024
+    CompactRatio: float = 0.5
+
+    PUT: int    = 0
+    DELETE: int = 1
+
+    __header: struct.Struct = struct.Struct("<4sI")
+    __record: struct.Struct = struct.Struct("<BHII")
+
+    def __init__(self, folder: str) -> None:
+        os.makedirs(folder, 777, exist_ok = True)
+
+        self.folder: str = folder
+
+        self.__lock: RLock = RLock()
+        self.__index: dict[str, tuple[int, int, int]] = {}    # name -> (segment, offset of the data, length)
+        self.__files: dict[int, BinaryIO] = {}
+        self.__active: int = 0
+
+        self.__total: int = 0
+        self.__live: int = 0
+        self.__compacting: bool = False
+        self.closed: bool = False
+
+        self.__load()
+
+    def names(self) -> list[str]:
+        with self.__lock:
+            return list(self.__index)
+
+    def stat(self, name: str) -> Optional[tuple[int, int]]:
+        with self.__lock:
+            entry = self.__index.get(name)
+
+        if entry is None:
+            return None
+
+        segment, offset, length = entry
+        return (segment << 40) | offset, length
+
+    def get(self, name: str, size: Optional[int] = None) -> Optional[tuple[bytes, tuple[int, int]]]:
+        with self.__lock:
+            entry = self.__index.get(name)
+
+            if entry is None:
+                return None
+
+            segment, offset, length = entry
+
+            IOFile: BinaryIO = self.__files[segment]
+            IOFile.seek(offset)
+            Data: bytes = IOFile.read(length if size is None else min(size, length))
+
+        return Data, ((segment << 40) | offset, length)
+
+    def put(self, name: str, data: bytes, fsync: bool = False) -> str:
+        """Write the blob of name, returns the segment file it went to (to fsync it later)."""
+        with self.__lock:
+            self.__append(self.PUT, name, data, fsync)
+            segment: str = self.__path(self.__active)
+
+        self.__maybe_compact()
+        return segment
+
+    def delete(self, name: str, fsync: bool = False) -> None:
+        with self.__lock:
+            if name not in self.__index:
+                return
+
+            self.__append(self.DELETE, name, b"", fsync)
+
+        self.__maybe_compact()
+
+    def compact(self) -> None:
+        with self.__lock:
+            if self.__compacting or self.closed:
+                return
+
+            self.__compacting = True
+
+        self.__compact()
+
+    def close(self) -> None:
+        with self.__lock:
+            for IOFile in self.__files.values():
+                IOFile.close()
+
+            self.__files.clear()
+            self.__index.clear()
+            self.closed = True
+
+    def __path(self, segment: int) -> str:
+        return os.path.join(self.folder, f"{segment:08d}.seg")
+
+    def __copy_path(self, copy: int) -> str:
+        return os.path.join(self.folder, f"{copy:08d}.compact")
+
+    def __load(self) -> None:
+        # Copies of a compaction that didn't reach its swap
+        for name in os.listdir(self.folder):
+            if name.endswith(".compact"):
+                os.remove(os.path.join(self.folder, name))
+
+        segments: list[int] = sorted(int(name[:-4]) for name in os.listdir(self.folder) if name.endswith(".seg") and name[:-4].isdigit())
+
+        base: int = 0
+        for segment in segments:
+            with open(self.__path(segment), 'rb') as IOFile:
+                header: bytes = IOFile.read(self.__header.size)
+
+            if len(header) == self.__header.size and header[:4] == self.MAGIC:
+                base = max(base, self.__header.unpack(header)[1])
+
+        for segment in segments:
+            if segment <= base:
+                os.remove(self.__path(segment))
+                continue
+
+            self.__scan(segment)
+
+        if self.__active == 0:
+            self.__open_segment(base + 1, base)
+
+    def __scan(self, segment: int) -> None:
+        IOFile: BinaryIO = open(self.__path(segment), 'r+b')
+        Data: bytes = IOFile.read()
+
+        if len(Data) < self.__header.size or Data[:4] != self.MAGIC:
+            IOFile.seek(0)
+            IOFile.truncate()
+            IOFile.write(self.__header.pack(self.MAGIC, 0))
+            Data = Data[:0]
+
+        Offset: int = self.__header.size
+
+        while Offset + self.__record.size <= len(Data):
+            op, name_length, data_length, crc = self.__record.unpack_from(Data, Offset)
+            Start: int = Offset + self.__record.size
+            End: int = Start + name_length + data_length
+
+            if End > len(Data) or zlib.crc32(Data[Start:End], op) != crc:
+                break
+
+            name: str = Data[Start:Start + name_length].decode("utf-8")
+            self.__index_record(op, name, segment, Start + name_length, data_length)
+            self.__total += End - Offset
+            Offset = End
+
+        # A torn record can only be at the end of the last segment, the next ones start after it
+        if Offset < len(Data):
+            Log.Warn(f"Dropping {len(Data) - Offset} torn bytes at the end of {self.__path(segment)}")
+            IOFile.truncate(Offset)
+
+        self.__files[segment] = IOFile
+        self.__active = segment
+
+    def __index_record(self, op: int, name: str, segment: int, offset: int, length: int) -> None:
+        previous = self.__index.pop(name, None)
+
+        if previous is not None:
+            self.__live -= previous[2]
+
+        if op == self.PUT:
+            self.__index[name] = (segment, offset, length)
+            self.__live += length
+
+    def __open_segment(self, segment: int, base: int) -> None:
+        IOFile: BinaryIO = open(self.__path(segment), 'w+b')
+        IOFile.write(self.__header.pack(self.MAGIC, base))
+
+        self.__files[segment] = IOFile
+        self.__active = segment
+
+    def __pack_record(self, op: int, name: str, data: bytes) -> tuple[bytes, int]:
+        Name: bytes = name.encode("utf-8")
+        return self.__record.pack(op, len(Name), len(data), zlib.crc32(Name + data, op)) + Name + data, self.__record.size + len(Name)
+
+    def __append(self, op: int, name: str, data: bytes, fsync: bool) -> None:
+        Record, Start = self.__pack_record(op, name, data)
+
+        IOFile: BinaryIO = self.__files[self.__active]
+        IOFile.seek(0, os.SEEK_END)
+
+        if IOFile.tell() + len(Record) > self.SegmentLimit and IOFile.tell() > self.__header.size:
+            self.__open_segment(self.__active + 1, 0)
+            IOFile = self.__files[self.__active]
+
+        Offset: int = IOFile.tell()
+        IOFile.write(Record)
+        IOFile.flush()
+
+        if fsync:
+            os.fsync(IOFile.fileno())
+
+        self.__index_record(op, name, self.__active, Offset + Start, len(data))
+        self.__total += len(Record)
+
+    def __maybe_compact(self) -> None:
+        with self.__lock:
+            if self.__compacting or self.closed or self.__total < self.CompactMin or self.__live >= self.__total * self.CompactRatio:
+                return
+
+            self.__compacting = True
+
+        Thread(target = self.__compact, name = "Slazhe-Pack-Compaction", daemon = True).start()
+
+    def __compact(self) -> None:
+        Copies: list[BinaryIO] = []
+
+        try:
+            with self.__lock:
+                live: dict[str, tuple[int, int, int]] = dict(self.__index)
+                sources: dict[int, str] = {segment: self.__path(segment) for segment in self.__files}
+
+            # Records are never rewritten in place, the live ones are read on handles of their own
+            Index: dict[str, tuple[int, int, int]] = self.__copy(Copies, live, sources)
+
+            with self.__lock:
+                if not self.closed:
+                    self.__swap(Copies, live, Index)
+        finally:
+            for Copy in range(len(Copies)):
+                Copies[Copy].close()
+
+                if os.path.exists(self.__copy_path(Copy)):
+                    os.remove(self.__copy_path(Copy))
+
+            self.__compacting = False
+
+    def __copy(self, Copies: list[BinaryIO], live: dict[str, tuple[int, int, int]], sources: dict[int, str]) -> dict[str, tuple[int, int, int]]:
+        Index: dict[str, tuple[int, int, int]] = {}
+        Readers: dict[int, BinaryIO] = {}
+
+        try:
+            for name, (segment, offset, length) in live.items():
+                if segment not in Readers:
+                    Readers[segment] = open(sources[segment], 'rb')
+
+                Readers[segment].seek(offset)
+                Index[name] = self.__write_copy(Copies, self.PUT, name, Readers[segment].read(length))
+        finally:
+            for IOFile in Readers.values():
+                IOFile.close()
+
+        return Index
+
+    def __write_copy(self, Copies: list[BinaryIO], op: int, name: str, data: bytes) -> tuple[int, int, int]:
+        Record, Start = self.__pack_record(op, name, data)
+
+        if not Copies or (Copies[-1].tell() + len(Record) > self.SegmentLimit and Copies[-1].tell() > self.__header.size):
+            self.__new_copy(Copies)
+
+        Offset: int = Copies[-1].tell()
+        Copies[-1].write(Record)
+
+        return len(Copies) - 1, Offset + Start, len(data)
+
+    def __new_copy(self, Copies: list[BinaryIO]) -> None:
+        Copies.append(open(self.__copy_path(len(Copies)), 'w+b'))
+        Copies[-1].write(self.__header.pack(self.MAGIC, 0))
+
+    def __swap(self, Copies: list[BinaryIO], live: dict[str, tuple[int, int, int]], Index: dict[str, tuple[int, int, int]]) -> None:
+        # What was written or deleted since the copy started, as it is now
+        for name in live.keys() | self.__index.keys():
+            entry: Optional[tuple[int, int, int]] = self.__index.get(name)
+
+            if entry == live.get(name):
+                continue
+
+            if entry is None:
+                self.__write_copy(Copies, self.DELETE, name, b"")
+                Index.pop(name, None)
+                continue
+
+            IOFile: BinaryIO = self.__files[entry[0]]
+            IOFile.seek(entry[1])
+            Index[name] = self.__write_copy(Copies, self.PUT, name, IOFile.read(entry[2]))
+
+        # Nothing live left, an empty segment still carries the base
+        if not Copies:
+            self.__new_copy(Copies)
+
+        replaced: list[int] = sorted(self.__files)
+        first: int = replaced[-1] + 1
+
+        # Only once the copies are durable the first one may supersede the old segments
+        Copies[0].seek(0)
+        Copies[0].write(self.__header.pack(self.MAGIC, replaced[-1]))
+
+        for IOFile in Copies:
+            IOFile.flush()
+            os.fsync(IOFile.fileno())
+            IOFile.close()
+
+        # The first one last: until it is there, the copies only repeat what the old segments hold
+        for Copy in reversed(range(len(Copies))):
+            os.replace(self.__copy_path(Copy), self.__path(first + Copy))
+
+        for segment in replaced:
+            self.__files.pop(segment).close()
+            os.remove(self.__path(segment))
+
+        for Copy in range(len(Copies)):
+            self.__files[first + Copy] = open(self.__path(first + Copy), 'r+b')
+
+        self.__active = first + len(Copies) - 1
+        self.__index = {name: (first + Copy, offset, length) for name, (Copy, offset, length) in Index.items()}
+        self.__live = sum(length for segment, offset, length in self.__index.values())
+        self.__total = sum(os.path.getsize(self.__path(first + Copy)) - self.__header.size for Copy in range(len(Copies)))
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.03
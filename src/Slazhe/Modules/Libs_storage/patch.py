@@ -0,0 +1,95 @@
+from Slazhe import Logger
+
+Log = Logger(__package__)
+
+from typing     import Optional, Any, Union
+from .delta     import DeltaLog
+from .header    import Header
+from .codecs    import Codec, Codecs
+from .cache     import ObjectCache
+from .writebehind import WriteBehind
+from .CustomTypes import mark_clean
+
+import os
+
+Path = Union[str, int, list, tuple]
+
+class StoragePatch:
+    """
+    Field level updates of a storage file.
+
+    patch() and delete_key() append a small record to the file's delta log
+    instead of rewriting the whole document, open() replays the log. Once the
+    log outgrows DeltaLog.Limit (or the file itself) it is folded back into
+    the file by compact().
+    """
+
+    def patch(self, file: str, path: Path, value: Any, password: Optional[str] = None) -> bool:
+        """Set the field at path (a key or a list of keys) of file to value."""
+        return self.__append(file, DeltaLog.SET, path, value, password)
+
+    def delete_key(self, file: str, path: Path, password: Optional[str] = None) -> bool:
+        """Remove the field at path (a key or a list of keys) of file."""
+        return self.__append(file, DeltaLog.DELETE, path, None, password)
+
+    def compact(self, file: str, password: Optional[str] = None) -> bool:
+        """Rewrite file with its delta log applied, the log is removed by the write."""
+        data = self.open(file, {}, password)
+        mark_clean(data, False)
+
+        return self.save(data, file, password) and self.flush(file)
+
+    def __append(self, file: str, op: int, path: Path, value: Any, password: Optional[str]) -> bool:
+        keys: list = list(path) if isinstance(path, (list, tuple)) else [path]
+        File: str = os.path.abspath(f'{self.path}/{file}')
+
+        # A pending full write must land first, it replaces the log of the current file
+        WriteBehind.flush(File)
+
+        FileHeader: Optional[Header] = Header.read(self.backend, File)
+
+        # Missing and headerless files have nothing to attach a log to, they are written whole (and upgraded)
+        if FileHeader is None:
+            data = self.open(file, {}, password)
+
+            try:
+                DeltaLog.apply(data, op, keys, value)
+            except Exception as e:
+                Log.Error(f"Unable to patch {file} at {keys}: {e}")
+                return False
+
+            return self.save(data, file, password)
+
+        codec: Codec = getattr(self, 'codec', None) or Codecs.get("pickle")
+        Body: bytes = codec.encode([op, keys, value])
+        Flags: int = 0
+
+        slazhe_crypto_enable = getattr(getattr(self, 'slazhe_crypto', None), 'SCrypto', None) is not None
+
+        if password and slazhe_crypto_enable:
+            Body = self.slazhe_crypto.secure_encrypt(Body, self.slazhe_crypto.get_secure_password(password), File)
+            Flags |= Header.PASSWORD
+
+        if slazhe_crypto_enable and getattr(self, "encrypt", True):
+            Body = self.slazhe_crypto.secure_encrypt(Body, self.slazhe_crypto_password, File)
+            Flags |= Header.ENCRYPTED
+
+        if not Body:
+            Log.Error(f"Unable to encrypt the patch of {file}.")
+            return False
+
+        try:
+            Size: int = DeltaLog.append(self.backend, File, FileHeader.crc, Flags, codec.id, Body, getattr(self, 'fsync', 'batch'))
+        except OSError as e:
+            Log.Error(f"Unable to patch {file}: {e}")
+            return False
+
+        ObjectCache.invalidate(File)
+
+        if Size > max(DeltaLog.Limit, self.backend.stat(File)[1]):
+            return self.compact(file, password)
+
+        return True
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.03
@@ -2,14 +2,75 @@ from Slazhe import Logger
 
 Log = Logger(__package__)
 
-from typing     import Optional, Any
-from .CustomTypes import EBase
+from typing     import Optional, Any, Union, Iterator
+from .CustomTypes import EBase, is_dirty, mark_clean, origin
+from .cache import MissingFiles, ObjectCache
+from .writebehind import WriteBehind
+from .header import Header
+from .codecs import Codec
+from .compression import Compressor, Compressions
+from .metrics import StorageMetrics
+from time import perf_counter
+from .delta import DeltaLog
 
-import pickle
-import os, zlib
+import pickle, hashlib, tempfile
+import os
+
+class Spool:
+    """
+    Where save() serializes to: in memory up to max_size bytes, in a
+    temporary file past that. Keeps the size and the digest (content_digest)
+    of what was written.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.size: int = 0
+
+        self.__hash = hashlib.blake2b(digest_size = 16)
+        self.__file = tempfile.SpooledTemporaryFile(max_size)
+
+    def write(self, data: bytes) -> int:
+        self.__hash.update(data)
+        self.size += len(data)
+
+        return self.__file.write(data)
+
+    def digest(self) -> bytes:
+        return self.__hash.digest()
+
+    def read(self, size: int = -1) -> bytes:
+        """The first size bytes (all of them by default)."""
+        self.__file.seek(0)
+        return self.__file.read(size)
+
+    def chunks(self, size: int) -> Iterator[bytes]:
+        self.__file.seek(0)
+
+        while Block := self.__file.read(size):
+            yield Block
+
+    def close(self) -> None:
+        self.__file.close()
 
 class StorageSave:
+    # Saves skipped because the object didn't change since it was opened
+    SkippedWrites: int = 0
+
+    # Serialized bodies from this size on are kept in a temporary file, then compressed,
+    # encrypted (a CryptoStream) and written chunk by chunk: memory doesn't grow with them
+    StreamEncryptMin: int = 1 << 20
+
     def save(self, data: EBase, file: Optional[str] = None, password: Optional[str] = None) -> bool:
+        """
+        Write data to file (by default the file it was opened from).
+
+        Nothing is written when data didn't change since it was opened or last
+        saved under the same key and password. What open() returns tracks its
+        changes, and the serialized content is compared with its digest from
+        the last read or write when nothing was tracked (changes made through
+        .value, or to objects kept aside). Only objects without tracking (the
+        str, int, set... wrappers) are always written.
+        """
         if isinstance(data, EBase) and getattr(data, 'SlazheStorageFile', None):
             file = getattr(data, 'SlazheStorageFile', None)()
 
@@ -17,53 +78,199 @@ class StorageSave:
             Log.Warn(f"No file name specified for {data.__class__.__name__}")
             return False
 
-        slazhe_crypto_enable = hasattr(self, 'slazhe_crypto')
+        File: str = os.path.abspath(f'{self.path}/{file}')
+        # Clean only counts for where the object was read from, under another key or password it has to be written
+        Origin: bytes = origin(self, File, password)
+
+        codec: Optional[Codec] = getattr(self, 'codec', None)
+        Body: Spool = Spool(self.StreamEncryptMin)
+        Stage: float = perf_counter()
+
+        try:
+            if codec is not None:
+                codec.dump(data, Body)
+                Serializer: int = codec.id
+
+            else:
+                FormatedData: Any = getattr(self, 'SaveFunctionFormat', lambda data: data)(data)
+                Serializer: int = Header.RAW
+
+                if isinstance(FormatedData, bytes):
+                    Body.write(FormatedData)
+                else:
+                    pickle.dump(FormatedData, Body)
+                    Serializer = Header.PICKLE
+        except BaseException:
+            Body.close()
+            raise
+
+        StorageMetrics.stage("save.serialize", Body.size, perf_counter() - Stage)
+
+        Digest: bytes = Body.digest()
+
+        if not is_dirty(data, Origin, Digest) and (WriteBehind.pending(File) or self.backend.exists(File)):
+            Body.close()
+            StorageSave.SkippedWrites += 1
+            return True
+
+        # The data is serialized now, so later changes to it don't leak into a deferred write
+        window: float = getattr(self, 'write_behind', 0)
+        if window:
+            def job() -> bool:
+                if self.__write(File, Body, Serializer, password):
+                    return True
+
+                mark_clean(data, False)
+                return False
+
+            mark_clean(data, origin = Origin, digest = Digest)
+            WriteBehind.schedule(File, window, job)
+            return True
+
+        if not self.__write(File, Body, Serializer, password):
+            return False
+
+        mark_clean(data, origin = Origin, digest = Digest)
+        return True
+
+    def flush(self, file: Optional[str] = None) -> bool:
+        """Write now the deferred saves of this storage (or of one of its files)."""
+        if file is not None:
+            return WriteBehind.flush(os.path.abspath(f'{self.path}/{file}'))
 
-        FormatedData: Any = getattr(self, 'SaveFunctionFormat', lambda data: data)(data)
+        return WriteBehind.flush()
 
-        if not isinstance(FormatedData, bytes):
-            FormatedData = pickle.dumps(FormatedData)
+    def __write(self, File: str, Body: Spool, Serializer: int, password: Optional[str] = None) -> bool:
+        try:
+            return self.__write_body(File, Body, Serializer, password)
+        finally:
+            Body.close()
+
+    def __write_body(self, File: str, Body: Spool, Serializer: int, password: Optional[str] = None) -> bool:
+        # Without the DLL secure_encrypt hands the data back as is, the header must not claim it's encrypted
+        slazhe_crypto_enable = getattr(getattr(self, 'slazhe_crypto', None), 'SCrypto', None) is not None
+        FileHeader: Header = Header(Serializer, Header.NONE)
+        Start: float = perf_counter()
+
+        # A password protects the body in one call, only the others can be streamed
+        if Body.size >= self.StreamEncryptMin and not (password and slazhe_crypto_enable):
+            return self.__write_stream(File, FileHeader, Body, Start)
+
+        FormatedData: bytes = Body.read()
 
         if password and slazhe_crypto_enable:
-            result = ""
+            Stage: float = perf_counter()
+
             try:
-                result = self.slazhe_crypto.secure_encrypt(FormatedData, self.slazhe_crypto.get_secure_password(password))
+                FormatedData = self.slazhe_crypto.secure_encrypt(FormatedData, self.slazhe_crypto.get_secure_password(password), File)
             except Exception as e:
-                print(e)
-                pass
+                Log.Error(f"Unable to encrypt {File} with its password: {e}")
+                return False
+
+            if not FormatedData:
+                Log.Error(f"Unable to encrypt {File} with its password.")
+                return False
 
-            if result != "":
-                FormatedData = result
+            FileHeader.flags |= Header.PASSWORD
+            StorageMetrics.stage("save.crypto", len(FormatedData), perf_counter() - Stage)
 
-        if getattr(self, 'compression', True):
-            ZlibCompressor: zlib._Compress = zlib.compressobj()
-            CompressedData: bytes = ZlibCompressor.compress(FormatedData) + ZlibCompressor.flush()
+        CompressedData: bytes = FormatedData
+        Compression: Union[bool, str] = getattr(self, 'compression', True)
 
-        else:
-            CompressedData: bytes = FormatedData
+        # Under compress_min the compressor's own overhead outweighs what it saves
+        if Compression and Compression != "none" and len(FormatedData) >= getattr(self, 'compress_min', 0):
+            Dictionary: Optional[tuple[int, bytes]] = self.dictionary() if getattr(self, 'zdict', False) else None
+            zdict: Optional[bytes] = Dictionary[1] if Dictionary is not None else None
+            Stage: float = perf_counter()
+
+            if Compression == "adaptive":
+                Used, Compressed = Compressions.adaptive(FormatedData, getattr(self, 'compress_target', 0.5), zdict, File)
+            else:
+                Used: Compressor = Compressions.get("zlib" if Compression is True else Compression)
+                Compressed: bytes = Compressions.compress(Used, FormatedData, getattr(self, 'compress_level', None), zdict)
+
+            if Used.id != Header.NONE and len(Compressed) < len(FormatedData):
+                CompressedData = Compressed
+                FileHeader.compression = Used.id
+                FileHeader.zdict = Dictionary[0] if Dictionary is not None and Used.zdict else 0
+
+            StorageMetrics.stage("save.compress", len(FormatedData), perf_counter() - Stage)
 
         if slazhe_crypto_enable and getattr(self, "encrypt", True):
-            CompressedData: bytes = self.slazhe_crypto.secure_encrypt(CompressedData, self.slazhe_crypto_password)
+            Stage: float = perf_counter()
+            CompressedData: bytes = self.slazhe_crypto.secure_encrypt(CompressedData, self.slazhe_crypto_password, File)
 
-        File: str = os.path.abspath(f'{self.path}/{file}')
-        Path: str = os.path.dirname(File)
+            if not CompressedData:
+                Log.Error(f"Unable to encrypt {File}.")
+                return False
+
+            FileHeader.flags |= Header.ENCRYPTED
+            StorageMetrics.stage("save.crypto", len(CompressedData), perf_counter() - Stage)
+
+        CompressedData = FileHeader.pack(CompressedData)
+        Stage: float = perf_counter()
+
+        try:
+            self.backend.write(File, CompressedData, getattr(self, 'fsync', 'batch'))
+        except OSError as e:
+            Log.Error(f"Unable to write {File}: {e}")
+            return False
+
+        StorageMetrics.stage("save.disk", len(CompressedData), perf_counter() - Stage)
+        StorageMetrics.write(File, len(CompressedData), perf_counter() - Start)
+
+        MissingFiles.discard(File)
+        DeltaLog.discard(self.backend, File)
+        ObjectCache.invalidate(File)
 
-        os.makedirs(Path, 777, exist_ok = True)
+        return True
+
+    def __write_stream(self, File: str, FileHeader: Header, Body: Spool, Start: float) -> bool:
+        """
+        __write for the large bodies: read back from the spool, compressed,
+        encrypted and written a chunk at a time. The compressor is chosen on
+        the first bytes, neither the body nor what it becomes is ever in
+        memory as a whole.
+        """
+        Chunk: int = getattr(self, 'StreamChunk', 1 << 20)
+        Chunks: Iterator[bytes] = Body.chunks(Chunk)
+        Stage: float = perf_counter()
 
         try:
-            IOFile = open(File, 'wb+')
+            Compression: Union[bool, str] = getattr(self, 'compression', True)
+
+            if Compression and Compression != "none":
+                Dictionary: Optional[tuple[int, bytes]] = self.dictionary() if getattr(self, 'zdict', False) else None
+                zdict: Optional[bytes] = Dictionary[1] if Dictionary is not None else None
+
+                if Compression == "adaptive":
+                    Used, Level = Compressions.choose(Body.read(Compressions.Sample), getattr(self, 'compress_target', 0.5), zdict, File)
+                else:
+                    Used, Level = Compressions.get("zlib" if Compression is True else Compression), getattr(self, 'compress_level', None)
+
+                if Used.id != Header.NONE:
+                    Chunks = Compressions.compress_stream(Used, Chunks, Level, zdict)
+                    FileHeader.compression = Used.id
+                    FileHeader.zdict = Dictionary[0] if Dictionary is not None and Used.zdict else 0
+
+            if getattr(getattr(self, 'slazhe_crypto', None), 'SCrypto', None) is not None and getattr(self, "encrypt", True):
+                FileHeader.flags |= Header.ENCRYPTED | Header.STREAM
+                Chunks = self.slazhe_crypto.encrypt_stream(Chunks, self.slazhe_crypto_password, Chunk)
+
+            Size: int = self.backend.write_stream(File, FileHeader, Chunks, getattr(self, 'fsync', 'batch'))
         except Exception as e:
+            Log.Error(f"Unable to write {File}: {e}")
             return False
 
-        else:
-            try:
-                IOFile.write(CompressedData)
-                IOFile.flush()
-            except Exception as e:
-                return False
-            finally:
-                IOFile.close()
-            return True
+        # Compression, encryption and writing are interleaved here
+        StorageMetrics.stage("save.stream", Size, perf_counter() - Stage)
+        StorageMetrics.write(File, Size, perf_counter() - Start)
+
+        MissingFiles.discard(File)
+        DeltaLog.discard(self.backend, File)
+        ObjectCache.invalidate(File)
+
+        return True
 
 # Version Globale: v00.00.00.pl
-# Version du fichier: v00.00.00.03
+# Version du fichier: v00.00.00.0l
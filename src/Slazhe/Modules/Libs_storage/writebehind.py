@@ -0,0 +1,189 @@
+from Slazhe import Logger
+
+Log = Logger(__package__)
+
+from typing     import Callable, Optional
+from threading  import Condition, Thread
+
+import atexit
+import time, os
+
+class WriteBehind:
+    """
+    Coalesces the saves of a same path made within a short window.
+
+    Each path keeps only its latest pending job; the job runs once the window
+    opened by the first save has elapsed, on a background thread. Jobs of the
+    same path never run concurrently and flush() is a barrier that runs the
+    pending jobs on the caller's thread.
+
+    It also batches the fsyncs that make the writes durable (fsync = 'batch'):
+    the files written and the directories they were renamed in are synced on
+    the background thread, each once per group of writes, instead of by the
+    save itself.
+    """
+
+    _pending: dict[str, tuple[float, Callable[[], bool]]] = {}
+    _running: set[str] = set()
+    _files: set[str] = set()
+    _directories: set[str] = set()
+    _condition: Condition = Condition()
+    _thread: Optional[Thread] = None
+
+    _coalesced: int = 0
+
+    @classmethod
+    def schedule(cls, path: str, window: float, job: Callable[[], bool]) -> None:
+        with cls._condition:
+            if path in cls._pending:
+                cls._coalesced += 1
+                cls._pending[path] = (cls._pending[path][0], job)
+            else:
+                cls._pending[path] = (time.monotonic() + window, job)
+
+            cls._wake()
+
+    @classmethod
+    def sync_file(cls, path: str) -> None:
+        """Ask for a deferred fsync of a file, then of its directory."""
+        with cls._condition:
+            cls._files.add(path)
+            cls._directories.add(os.path.dirname(path))
+            cls._wake()
+
+    @staticmethod
+    def fsync_file(path: str) -> None:
+        # Windows only flushes a handle opened for writing
+        try:
+            fd: int = os.open(path, os.O_RDWR if os.name == 'nt' else os.O_RDONLY)
+        except OSError:
+            return
+
+        try:
+            os.fsync(fd)
+        except OSError as e:
+            Log.Warn(f"Unable to fsync {path}: {e}")
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def fsync_directory(path: str) -> None:
+        # Windows can't open a directory, NTFS journals the rename on its own
+        if os.name == 'nt':
+            return
+
+        try:
+            fd: int = os.open(path, os.O_RDONLY)
+        except OSError:
+            return
+
+        try:
+            os.fsync(fd)
+        except OSError as e:
+            Log.Warn(f"Unable to fsync {path}: {e}")
+        finally:
+            os.close(fd)
+
+    @classmethod
+    def _wake(cls) -> None:
+        if cls._thread is None or not cls._thread.is_alive():
+            cls._thread = Thread(target = cls._loop, name = "Slazhe-WriteBehind", daemon = True)
+            cls._thread.start()
+
+        cls._condition.notify_all()
+
+    @classmethod
+    def _sync(cls) -> None:
+        with cls._condition:
+            files: set[str] = cls._files
+            directories: set[str] = cls._directories
+            cls._files = set()
+            cls._directories = set()
+
+        # The content first, then the renames that point to it
+        for file in files:
+            cls.fsync_file(file)
+
+        for directory in directories:
+            cls.fsync_directory(directory)
+
+    @classmethod
+    def pending(cls, path: str) -> bool:
+        with cls._condition:
+            return path in cls._pending or path in cls._running
+
+    @classmethod
+    def flush(cls, path: Optional[str] = None) -> bool:
+        """Write the pending jobs (of one path or all of them) now, returns False if one failed."""
+        success: bool = True
+        ran: bool = False
+
+        with cls._condition:
+            paths: list[str] = [path] if path is not None else list(cls._pending)
+
+        for item in paths:
+            with cls._condition:
+                while item in cls._running:
+                    cls._condition.wait()
+
+                if item not in cls._pending:
+                    continue
+
+                _, job = cls._pending.pop(item)
+                cls._running.add(item)
+
+            success = cls._run(item, job) and success
+            ran = True
+
+        # A single path with nothing to write leaves the fsyncs to the background thread
+        if path is None or ran:
+            cls._sync()
+
+        return success
+
+    @classmethod
+    def stats(cls) -> dict[str, int]:
+        with cls._condition:
+            return {"pending": len(cls._pending), "coalesced": cls._coalesced}
+
+    @classmethod
+    def _run(cls, path: str, job: Callable[[], bool]) -> bool:
+        try:
+            result: bool = bool(job())
+        except Exception as e:
+            Log.Error(f"Deferred write of {path} failed: {e}")
+            return False
+        finally:
+            with cls._condition:
+                cls._running.discard(path)
+                cls._condition.notify_all()
+
+        if not result:
+            Log.Error(f"Deferred write of {path} failed.")
+
+        return result
+
+    @classmethod
+    def _loop(cls) -> None:
+        while True:
+            with cls._condition:
+                now: float = time.monotonic()
+                due: list[str] = [path for path, (deadline, _) in cls._pending.items() if deadline <= now and path not in cls._running]
+
+                if not due and not cls._files and not cls._directories:
+                    deadlines: list[float] = [deadline for path, (deadline, _) in cls._pending.items() if path not in cls._running]
+                    cls._condition.wait(max(0.0, min(deadlines) - now) if deadlines else None)
+                    continue
+
+                jobs: list[tuple[str, Callable[[], bool]]] = [(path, cls._pending.pop(path)[1]) for path in due]
+                cls._running.update(due)
+
+            for path, job in jobs:
+                cls._run(path, job)
+
+            cls._sync()
+
+atexit.register(WriteBehind.flush)
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.04
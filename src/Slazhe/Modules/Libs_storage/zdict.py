@@ -0,0 +1,323 @@
+from Slazhe import Logger
+
+Log = Logger(__package__)
+
+from typing     import Optional
+from threading  import Lock
+from collections import Counter
+from .header    import Header
+from .aio       import StorageAsync
+
+import os, struct, zlib
+
+class ZDicts:
+    """
+    Preset zlib dictionaries (zdict) of the storages, one set per storage path.
+
+    Small files share most of their bytes (keys, ids, structure), a dictionary
+    trained on the files of a namespace lets zlib reference them instead of
+    spelling them out again in every file. Dictionaries are stored next to
+    the files (<path>/.zdict/<id>.zd) and never removed: a file keeps the id
+    of the one it was compressed with in its header.
+
+    Storages sharing a path with different keys can't read each other's
+    dictionaries, each key (scope) has its own current one.
+    """
+
+    Folder: str     = ".zdict"
+    Current: str    = "current.zd"
+
+    Size: int       = 16 * 1024     # zlib only looks 32 KiB back
+    Gram: int       = 8
+    Samples: int    = 256           # Files read to train a dictionary
+    TrainMin: int   = 16            # Files a namespace needs before it gets a dictionary
+    Backoff: int    = 10            # A failed training waits TrainMin saves, doubled by every failure (up to 2**Backoff times)
+
+    _dicts: dict[tuple[str, int], bytes] = {}
+    _current: dict[tuple[str, int], int] = {}   # 0: no dictionary yet
+    _retry: dict[tuple[str, int], int] = {}
+    _failures: dict[tuple[str, int], int] = {}
+    _training: set[tuple[str, int]] = set()
+    _lock: Lock = Lock()
+
+    @classmethod
+    def path(cls, root: str, id: int) -> str:
+        return os.path.join(root, cls.Folder, f"{id:08x}.zd")
+
+    @classmethod
+    def pointer(cls, root: str, scope: int = 0) -> str:
+        return os.path.join(root, cls.Folder, f"current-{scope:08x}.zd" if scope else cls.Current)
+
+    @classmethod
+    def get(cls, root: str, id: int) -> Optional[bytes]:
+        with cls._lock:
+            return cls._dicts.get((root, id))
+
+    @classmethod
+    def put(cls, root: str, id: int, zdict: bytes) -> None:
+        with cls._lock:
+            cls._dicts[(root, id)] = zdict
+
+    @classmethod
+    def current(cls, root: str, scope: int = 0) -> Optional[int]:
+        """Id of the dictionary new files of root use, 0 for none, None when unknown yet."""
+        with cls._lock:
+            return cls._current.get((root, scope))
+
+    @classmethod
+    def set_current(cls, root: str, id: int, scope: int = 0) -> None:
+        with cls._lock:
+            cls._current[(root, scope)] = id
+
+    @classmethod
+    def due(cls, root: str, scope: int = 0) -> bool:
+        """
+        True when a namespace without a dictionary should try to train one:
+        the first time, then once the wait of its last failure is over. It
+        is then training until trained() is called.
+        """
+        with cls._lock:
+            if (root, scope) in cls._training:
+                return False
+
+            countdown: int = cls._retry.get((root, scope), 0)
+
+            if countdown > 0:
+                cls._retry[(root, scope)] = countdown - 1
+                return False
+
+            cls._training.add((root, scope))
+            return True
+
+    @classmethod
+    def trained(cls, root: str, scope: int, success: bool) -> None:
+        """End of the training due() allowed, a failure doubles the wait before the next one."""
+        with cls._lock:
+            cls._training.discard((root, scope))
+
+            if success:
+                cls._failures.pop((root, scope), None)
+                cls._retry.pop((root, scope), None)
+                return
+
+            failures: int = cls._failures.get((root, scope), 0) + 1
+            cls._failures[(root, scope)] = failures
+            cls._retry[(root, scope)] = cls.TrainMin << min(failures - 1, cls.Backoff)
+
+    @classmethod
+    def forget(cls, root: Optional[str] = None) -> None:
+        with cls._lock:
+            for key in [key for key in cls._dicts if root is None or key[0] == root]:
+                del cls._dicts[key]
+
+            for key in [key for key in cls._current if root is None or key[0] == root]:
+                del cls._current[key]
+
+            for key in [key for key in cls._retry if root is None or key[0] == root]:
+                del cls._retry[key]
+
+            for key in [key for key in cls._failures if root is None or key[0] == root]:
+                del cls._failures[key]
+
+    @staticmethod
+    def ident(zdict: bytes) -> int:
+        # 0 is "no dictionary" in the header
+        return zlib.crc32(zdict) or 1
+
+    @classmethod
+    def train(cls, samples: list[bytes], size: int = Size) -> bytes:
+        """
+        Builds a dictionary out of the samples that share the most with the others.
+
+        Each sample is scored by how many other samples contain its n-grams,
+        the best ones are kept until size is reached, skipping those the
+        dictionary already covers. The best sample ends up last, closest to
+        the data zlib compresses.
+        """
+        samples = [sample[:size // 4] for sample in samples if len(sample) >= cls.Gram]
+
+        grams: list[set[bytes]] = [{sample[i:i + cls.Gram] for i in range(len(sample) - cls.Gram + 1)} for sample in samples]
+        frequency: Counter = Counter()
+        for sample_grams in grams:
+            frequency.update(sample_grams)
+
+        scores: list[tuple[float, int]] = sorted(
+            ((sum(frequency[gram] - 1 for gram in sample_grams) / len(samples[i]), i) for i, sample_grams in enumerate(grams)),
+            reverse = True
+        )
+
+        chosen: list[bytes] = []
+        covered: set[bytes] = set()
+        total: int = 0
+
+        for score, i in scores:
+            if score <= 0 or total >= size:
+                break
+
+            shared: set[bytes] = {gram for gram in grams[i] if frequency[gram] > 1}
+            if not shared or len(shared - covered) < len(shared) // 10:
+                continue
+
+            chosen.append(samples[i])
+            covered |= shared
+            total += len(samples[i])
+
+        return b"".join(reversed(chosen))[-size:]
+
+class StorageDictionary:
+    def dictionary(self, id: Optional[int] = None) -> Optional[tuple[int, bytes]]:
+        """The dictionary id of this storage path, the current one without an id. None if there is none."""
+        root: str = os.path.abspath(self.path)
+
+        if id is None:
+            scope: int = self.__scope()
+            id = ZDicts.current(root, scope)
+
+            if id is None:
+                id = self.__load_current(root, scope)
+
+                if id or getattr(self, 'zdict', False):
+                    ZDicts.set_current(root, id, scope)
+
+            # A namespace without a dictionary gets one once it has enough files to learn from. It is
+            # trained on the storage threads (it reads and decrypts up to Samples files), saves go without meanwhile
+            if not id and getattr(self, 'zdict', False) and ZDicts.due(root, scope):
+                self.__train_later(root, scope)
+
+            if not id:
+                return None
+
+        zdict: Optional[bytes] = ZDicts.get(root, id)
+
+        if zdict is None:
+            zdict = self.__load(root, id)
+
+            if zdict is None:
+                return None
+
+            ZDicts.put(root, id, zdict)
+
+        return id, zdict
+
+    def train_dictionary(self, size: int = ZDicts.Size, files: Optional[list[str]] = None) -> Optional[int]:
+        """
+        Trains a dictionary on the files of this storage path (or on files)
+        and makes it the one new files are compressed with.
+        Returns its id, None if there isn't enough to learn from.
+        """
+        root: str = os.path.abspath(self.path)
+
+        if files is None:
+            Files: list[str] = [File for File in self.backend.names() if File.endswith(".slze")]
+        else:
+            Files: list[str] = [os.path.abspath(f'{self.path}/{file}') for file in files]
+
+        if len(Files) < ZDicts.TrainMin:
+            return None
+
+        samples: list[bytes] = []
+        for File in Files[:ZDicts.Samples]:
+            sample: Optional[bytes] = self.sample(os.path.relpath(File, root))
+
+            if sample:
+                samples.append(sample)
+
+        zdict: bytes = ZDicts.train(samples, size)
+        if len(zdict) < ZDicts.Gram:
+            return None
+
+        id: int = ZDicts.ident(zdict)
+
+        try:
+            self.__store(root, id, zdict)
+        except OSError as e:
+            Log.Error(f"Unable to store the dictionary of {root}: {e}")
+            return None
+
+        ZDicts.put(root, id, zdict)
+        ZDicts.set_current(root, id, self.__scope())
+
+        Log.Info(f"Dictionary {id:08x} trained on {len(samples)} files of {root} ({len(zdict)} bytes).")
+        return id
+
+    def __train_later(self, root: str, scope: int) -> None:
+        def job() -> None:
+            success: bool = False
+
+            try:
+                success = self.train_dictionary() is not None
+            except Exception as e:
+                Log.Error(f"Unable to train the dictionary of {root}: {e}")
+            finally:
+                ZDicts.trained(root, scope, success)
+
+        try:
+            StorageAsync.executor().submit(job)
+        except RuntimeError:
+            # The pool is shutting down with the process
+            ZDicts.trained(root, scope, False)
+
+    def __encrypted(self) -> bool:
+        return getattr(getattr(self, 'slazhe_crypto', None), 'SCrypto', None) is not None and getattr(self, "encrypt", True)
+
+    def __scope(self) -> int:
+        if not self.__encrypted():
+            return 0
+
+        return zlib.crc32(repr(tuple(self.slazhe_crypto_password)).encode()) or 1
+
+    def __store(self, root: str, id: int, zdict: bytes) -> None:
+        # Made of the files themselves, it is encrypted like them
+        FileHeader: Header = Header(Header.RAW, Header.NONE)
+        Body: bytes = zdict
+
+        if self.__encrypted():
+            Body = self.slazhe_crypto.secure_encrypt(Body, self.slazhe_crypto_password)
+
+            if not Body:
+                raise OSError("unable to encrypt it")
+
+            FileHeader.flags |= Header.ENCRYPTED
+
+        self.backend.write(ZDicts.path(root, id), FileHeader.pack(Body), getattr(self, 'fsync', 'batch'))
+        self.backend.write(ZDicts.pointer(root, self.__scope()), struct.pack("<I", id), getattr(self, 'fsync', 'batch'))
+
+    def __load(self, root: str, id: int) -> Optional[bytes]:
+        try:
+            Read = self.backend.read(ZDicts.path(root, id))
+
+            if Read is None:
+                return None
+
+            FileHeader: Optional[Header] = Header.unpack(Read[0])
+            Body: bytes = Read[0][FileHeader.size:]
+
+            if not FileHeader.check(Body):
+                raise ValueError("checksum mismatch")
+
+            if FileHeader.flags & Header.ENCRYPTED:
+                Body = self.slazhe_crypto.secure_decrypt(Body, self.slazhe_crypto_password)
+
+        except Exception as e:
+            Log.Error(f"Unable to read the dictionary {id:08x} of {root}: {e}")
+            return None
+
+        if ZDicts.ident(Body) != id:
+            Log.Error(f"The dictionary {id:08x} of {root} doesn't match its id.")
+            return None
+
+        return Body
+
+    def __load_current(self, root: str, scope: int) -> int:
+        try:
+            Read = self.backend.read(ZDicts.pointer(root, scope))
+        except OSError:
+            return 0
+
+        if Read is None or len(Read[0]) != 4:
+            return 0
+
+        return struct.unpack("<I", Read[0])[0]
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.02
@@ -1,3 +1,7 @@
 from .Libs_storage.main import Storage
+from .Libs_storage.backends import Backends
+from .Libs_storage.compression import Compressions
+from .Libs_storage.metrics import StorageMetrics
+from .Libs_storage.migrate import migrate_storage, slazhe_namespaces
 # Version Globale: v00.00.00.pl
-# Version du fichier: v00.00.00.01
+# Version du fichier: v00.00.00.04
@@ -1,4 +1,5 @@
 from .Libs_Crypto.main import Crypto as SlazheCrypto
+from .Libs_Crypto.backends import CryptoBackends
 
 # Version Globale: v00.00.00.pl
-# Version du fichier: v00.00.00.01
+# Version du fichier: v00.00.00.02
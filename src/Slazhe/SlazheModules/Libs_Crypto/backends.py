@@ -0,0 +1,523 @@
+from Slazhe import Logger
+
+Log = Logger(__package__)
+
+from ctypes import CDLL, c_char_p, c_int, POINTER, byref, c_uint, c_ubyte, c_void_p, cast, Array, _Pointer
+from typing import Optional, Union, Any
+from .keycache import KeyCache
+
+import os, hashlib
+
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    from cryptography.exceptions import InvalidTag
+except ImportError:
+    Cipher = None
+
+SCryptoTypes = {
+    'GetSecureKey': {
+        'return': None,
+        'args': [c_char_p, POINTER(c_int), POINTER(c_int)]
+    },
+    'SecureEncrypt': {
+        'return': c_int,
+        'args': [POINTER(c_ubyte), c_uint, POINTER(c_int), c_uint, POINTER(c_ubyte), c_uint, c_uint, POINTER(c_ubyte), c_uint, POINTER(c_ubyte)]
+    },
+    'SecureDecrypt': {
+        'return': c_int,
+        'args': [POINTER(c_ubyte), c_uint, POINTER(c_int), c_uint, POINTER(c_ubyte), c_uint, c_uint, POINTER(c_ubyte), c_uint, POINTER(c_ubyte)]
+    }
+}
+
+class SCryptoTyping:
+    def GetSecureKey(self, A: c_char_p, B: c_int, C: c_int)                                                                                 -> None:pass
+    def SecureEncrypt(self, A: c_ubyte, B: c_uint, C: c_int, D: c_uint, E: c_ubyte, F: c_uint, G: c_uint, H: c_ubyte, I: c_uint, J: c_ubyte) -> c_int:pass
+    def SecureDecrypt(self, A: c_ubyte, B: c_uint, C: c_int, D: c_uint, E: c_ubyte, F: c_uint, G: c_uint, H: c_ubyte, I: c_uint, J: c_ubyte)-> c_int:pass
+
+# Buffers the backends read (bytes, bytearray, memoryview)
+Buffer = Union[bytes, bytearray, memoryview]
+
+# AES block, the most PKCS#7 padding adds
+BlockSize: int = 16
+
+def c_input(data: Buffer, offset: int = 0) -> Union[Array, _Pointer]:
+    """
+    data[offset:] as a c_ubyte pointer for the DLL, which only reads it.
+
+    bytes are passed by address (no copy), writable buffers are shared with
+    from_buffer. Only read-only non-bytes buffers get copied, once.
+    """
+    if isinstance(data, bytes):
+        return cast(c_void_p(cast(c_char_p(data), c_void_p).value + offset), POINTER(c_ubyte))
+
+    view: memoryview = memoryview(data).cast('B')
+
+    if view.readonly:
+        return (c_ubyte * (view.nbytes - offset)).from_buffer_copy(view, offset)
+
+    return (c_ubyte * (view.nbytes - offset)).from_buffer(view, offset)
+
+def c_output(buffer: bytearray, offset: int, size: int) -> Array:
+    """size bytes of buffer from offset, for the DLL to write into."""
+    return (c_ubyte * size).from_buffer(buffer, offset)
+
+class DataKey(list):
+    """
+    A key drawn at random for one stream and kept wrapped in its header. It
+    is as strong as the derived keys are, a single PBKDF2 iteration turns it
+    into the cipher key.
+    """
+
+class CryptoBackend:
+    """
+    What Crypto encrypts with.
+
+    Every backend writes salt + iv + ciphertext (Params sizes), encrypt gives
+    b'' when it fails and decrypt raises. Backends that can't run here raise
+    OSError when built, CryptoBackends then tries the next one. context (the
+    file the data goes to) lets a backend keep one salt per file. Data
+    written by a backend is only read by that backend.
+    """
+
+    name: str
+
+    # How the frames of a CryptoStream are sealed, written in its header, and the ones it reads
+    Stream: int = 0
+    Streams: tuple[int, ...] = (0,)
+
+    def __init__(self, Params: dict[str, int], Keys: Optional[KeyCache] = None, **Options) -> None:
+        self.Params: dict[str, int] = Params
+
+        # Shared with Crypto (its _keys), which drops the keys of a password on logout
+        self.keys: KeyCache = Keys if Keys is not None else KeyCache()
+
+    def encrypt(self, data: Buffer, password: list[int], context: Optional[str] = None) -> bytes:
+        raise NotImplementedError
+
+    def decrypt(self, data: Buffer, password: list[int], context: Optional[str] = None) -> bytes:
+        raise NotImplementedError
+
+    def secure_key(self, FileName: str) -> list[int]:
+        """The key of FileName on this machine."""
+        raise NotImplementedError
+
+    def derive(self, password: list[int], salt: bytes) -> bytearray:
+        """
+        The cipher key of password and salt (see _derive), cached by both and
+        Params in the group of password.
+        """
+        KeyId: bytes = self.keys.id("key", self.name, password, salt, sorted(self.Params.items()))
+        Key: Optional[bytearray] = self.keys.get(KeyId)
+
+        if Key is None:
+            Key = self._derive(password, salt)
+            self.keys.put(KeyId, Key, self.keys.group(password))
+
+        return Key
+
+    def _derive(self, password: list[int], salt: bytes) -> bytearray:
+        raise NotImplementedError
+
+    def new_stream_key(self, password: list[int], salt: bytes) -> tuple[Any, bytes]:
+        """The key of a new stream and its wrapped copy for the header (see stream_key), b'' when the salt is enough."""
+        return self.stream_key(password, salt, self.Stream, b""), b""
+
+    def stream_key(self, password: list[int], salt: bytes, mode: int, wrapped: bytes) -> Any:
+        """What seal and unseal get for every frame of a stream written in mode, found once per stream."""
+        return password
+
+    def seal(self, key: Any, nonce: bytes, data: Buffer, aad: bytes) -> bytes:
+        """
+        One frame of a stream. By default a whole encrypt() of aad + data,
+        unseal checks aad is still in front: a frame can't be moved to
+        another place or another stream.
+        """
+        sealed: bytes = self.encrypt(aad + bytes(data), key)
+
+        if not sealed:
+            raise RuntimeError("Encryption failed.")
+
+        return sealed
+
+    def unseal(self, key: Any, nonce: bytes, data: Buffer, aad: bytes) -> bytes:
+        plaintext: bytes = self.decrypt(data, key)
+
+        if plaintext[:len(aad)] != aad:
+            raise RuntimeError("Decryption failed: the frame doesn't belong here.")
+
+        return plaintext[len(aad):]
+
+class DLLBackend(CryptoBackend):
+    """
+    SlazheCrypto.dll (Windows), through ctypes.
+
+    The DLL derives the key (PBKDF2 over Iterations) inside every
+    SecureEncrypt / SecureDecrypt call and exports nothing taking a derived
+    key: only what GetSecureKey gives is cached for it. A stream pays that
+    derivation once, its frames are sealed under a DataKey (mode 2, streams
+    written before under the password itself are mode 0).
+    """
+
+    name: str = "dll"
+
+    Stream: int = 2
+    Streams: tuple[int, ...] = (0, 2)
+
+    def __init__(self, Params: dict[str, int], Path: Optional[str] = None, **Options) -> None:
+        super().__init__(Params, **Options)
+
+        try:
+            self.SCrypto: SCryptoTyping = CDLL(Path or os.path.join(os.path.dirname(__file__), "DLL", "SlazheCrypto.dll"))
+        except Exception as e:
+            raise OSError(f"unable to load SlazheCrypto: {e}") from e
+
+        for Func in SCryptoTypes:
+            try:
+                Element = getattr(self.SCrypto, Func)
+            except AttributeError:
+                continue
+
+            else:
+                Element.restype     = SCryptoTypes[Func]['return']
+                Element.argtypes    = SCryptoTypes[Func]['args']
+
+    def decrypt(self, encrypted_data: Buffer, password: list[int], Iterations: Optional[int] = None, context: Optional[str] = None) -> bytes:
+        salt_len = self.Params['SaltSize']
+        iv_len = self.Params['IvSize']
+
+        data_len = memoryview(encrypted_data).nbytes
+
+        if data_len < (salt_len + iv_len):
+            raise ValueError("Invalid encrypted data format.")
+
+        ciphertext_len  = data_len - salt_len - iv_len
+
+        # salt + iv + ciphertext are read in place. The plaintext is never longer than the ciphertext,
+        # the DLL is still given a block more, like encrypt, it may write a whole block before unpadding
+        plaintext       = bytearray(ciphertext_len + BlockSize)
+        password_array  = (c_int * len(password))(*password)
+
+        result = self.SCrypto.SecureDecrypt(
+            c_input(encrypted_data, salt_len + iv_len), ciphertext_len,
+            password_array, len(password),
+            c_input(encrypted_data), salt_len,
+            Iterations or self.Params['Iterations'],
+            c_input(encrypted_data, salt_len), iv_len,
+            c_output(plaintext, 0, ciphertext_len + BlockSize)
+        )
+
+        if result < 0:
+            raise RuntimeError(f"Decryption failed with error code: {result}")
+
+        return bytes(memoryview(plaintext)[:result])
+
+    def encrypt(self, PlainText: Buffer, password: list[int], Iterations: Optional[int] = None, context: Optional[str] = None) -> bytes:
+        # The DLL draws a salt in every call, context is of no use to it
+        PlainText_len   = memoryview(PlainText).nbytes
+        salt_len        = self.Params.get('SaltSize', 16)
+        iv_len          = self.Params.get('IvSize', 16)
+
+        # The DLL writes the salt, the iv and the ciphertext (padding adds a block at most) straight into the output
+        output          = bytearray(salt_len + iv_len + PlainText_len + BlockSize)
+        password_array  = (c_int * len(password))(*password)
+
+        result          = self.SCrypto.SecureEncrypt(
+            c_input(PlainText), PlainText_len,
+            password_array, len(password),
+            c_output(output, 0, salt_len), salt_len,
+            Iterations or self.Params['Iterations'],
+            c_output(output, salt_len, iv_len), iv_len,
+            c_output(output, salt_len + iv_len, PlainText_len + BlockSize)
+        )
+
+        if result < 0:
+            return b''
+
+        return bytes(memoryview(output)[:salt_len + iv_len + result])
+
+    def secure_key(self, FileName: str) -> list[int]:
+        Output = (c_int * 128)()
+        OutputLen = c_int()
+        self.SCrypto.GetSecureKey(FileName.encode("UTF-8"), Output, byref(OutputLen))
+
+        return list(Output[:OutputLen.value])
+
+    def new_stream_key(self, password: list[int], salt: bytes) -> tuple[Any, bytes]:
+        Key: DataKey = DataKey(os.urandom(self.Params['KeySize']))
+        Wrapped: bytes = self.encrypt(bytes(Key), password)
+
+        if not Wrapped:
+            raise RuntimeError("Encryption failed.")
+
+        return Key, Wrapped
+
+    def stream_key(self, password: list[int], salt: bytes, mode: int, wrapped: bytes) -> Any:
+        if mode == 0:
+            return password
+
+        return DataKey(self.decrypt(wrapped, password))
+
+    def seal(self, key: Any, nonce: bytes, data: Buffer, aad: bytes) -> bytes:
+        sealed: bytes = self.encrypt(aad + bytes(data), key, 1 if isinstance(key, DataKey) else None)
+
+        if not sealed:
+            raise RuntimeError("Encryption failed.")
+
+        return sealed
+
+    def unseal(self, key: Any, nonce: bytes, data: Buffer, aad: bytes) -> bytes:
+        plaintext: bytes = self.decrypt(data, key, 1 if isinstance(key, DataKey) else None)
+
+        if plaintext[:len(aad)] != aad:
+            raise RuntimeError("Decryption failed: the frame doesn't belong here.")
+
+        return plaintext[len(aad):]
+
+class PythonBackend(CryptoBackend):
+    """
+    AES-CBC with PKCS#7 padding (the cryptography package) under a
+    PBKDF2-HMAC key (hashlib), laid out like the DLL: salt + iv + ciphertext.
+
+    The DLL doesn't document its key derivation. PBKDF2 over SHA3-512 (the
+    digest it imports) with the password ints taken as bytes is our reading
+    of it, unconfirmed (CrossBackendTest checks it where the DLL loads). The
+    files are not interchangeable with the DLL's anyway: its keys hash the
+    Windows hardware ids, here the machine is SLAZHE_CRYPTO_SECRET, else its
+    machine-id, else a secret drawn once and kept in SecretFile.
+
+    PBKDF2 costs about as much as encrypting a few MiB: the derived keys are
+    cached (see derive). A file (context) keeps its salt, the one it was
+    written or read with, while its key is cached: saving it again derives
+    nothing. Without a context every call draws its own salt. Every call
+    draws its own iv.
+    """
+
+    name: str   = "python"
+    Digest: str = "sha3_512"
+
+    # Streams are AES-GCM, keyed once per stream: a frame costs no PBKDF2 and is authenticated
+    Stream: int = 1
+    Streams: tuple[int, ...] = (1,)
+
+    MachineIds: list[str] = ["/etc/machine-id", "/var/lib/dbus/machine-id"]
+    SecretFile: str = os.path.join("var", "crypto.secret")
+
+    def __init__(self, Params: dict[str, int], **Options) -> None:
+        if Cipher is None:
+            raise OSError("the cryptography package is not installed")
+
+        super().__init__(Params, **Options)
+        self.secret: bytes = self.machine_secret()
+
+    def encrypt(self, PlainText: Buffer, password: list[int], context: Optional[str] = None) -> bytes:
+        view: memoryview = memoryview(PlainText).cast('B')
+        salt: bytes = self.__salt(password, context)
+        iv: bytes   = os.urandom(self.Params['IvSize'])
+
+        whole: int  = view.nbytes - view.nbytes % BlockSize
+        pad: int    = BlockSize - view.nbytes % BlockSize
+
+        try:
+            encryptor = Cipher(algorithms.AES(self.derive(password, salt)), modes.CBC(iv)).encryptor()
+
+            output: bytearray = bytearray(salt + iv)
+            output += encryptor.update(view[:whole])
+            output += encryptor.update(bytes(view[whole:]) + bytes([pad]) * pad)
+            output += encryptor.finalize()
+        except ValueError:
+            return b''
+
+        return bytes(output)
+
+    def decrypt(self, encrypted_data: Buffer, password: list[int], context: Optional[str] = None) -> bytes:
+        view: memoryview = memoryview(encrypted_data).cast('B')
+        salt_len: int = self.Params['SaltSize']
+        iv_len: int   = self.Params['IvSize']
+
+        ciphertext_len: int = view.nbytes - salt_len - iv_len
+
+        if ciphertext_len <= 0 or ciphertext_len % BlockSize:
+            raise ValueError("Invalid encrypted data format.")
+
+        salt: bytes = bytes(view[:salt_len])
+        iv: bytes   = bytes(view[salt_len:salt_len + iv_len])
+
+        decryptor = Cipher(algorithms.AES(self.derive(password, salt)), modes.CBC(iv)).decryptor()
+        plaintext: bytes = decryptor.update(view[salt_len + iv_len:]) + decryptor.finalize()
+
+        pad: int = plaintext[-1]
+        if not 0 < pad <= BlockSize or plaintext[-pad:] != bytes([pad]) * pad:
+            raise RuntimeError("Decryption failed: bad padding, wrong key or corrupted data.")
+
+        # Its key is cached now, the file is written again with the same salt
+        if context is not None:
+            self.keys.put(self.__salt_id(password, context), salt, self.keys.group(password))
+
+        return plaintext[:-pad]
+
+    def secure_key(self, FileName: str) -> list[int]:
+        # 128 ints like the DLL: the hex digest of the machine and the file name
+        return list(hashlib.sha512(self.secret + b"\0" + FileName.encode("UTF-8")).hexdigest().encode())
+
+    def stream_key(self, password: list[int], salt: bytes, mode: int, wrapped: bytes) -> Any:
+        return AESGCM(self.derive(password, salt))
+
+    def seal(self, key: Any, nonce: bytes, data: Buffer, aad: bytes) -> bytes:
+        return key.encrypt(nonce, data, aad)
+
+    def unseal(self, key: Any, nonce: bytes, data: Buffer, aad: bytes) -> bytes:
+        try:
+            return key.decrypt(nonce, data, aad)
+        except InvalidTag:
+            raise RuntimeError("Decryption failed: wrong key, corrupted or misplaced frame.") from None
+
+    def _derive(self, password: list[int], salt: bytes) -> bytearray:
+        return bytearray(hashlib.pbkdf2_hmac(self.Digest, bytes(x & 0xFF for x in password), salt, self.Params['Iterations'], self.Params['KeySize']))
+
+    def __salt_id(self, password: list[int], context: str) -> bytes:
+        return self.keys.id("salt", password, context, self.Params['SaltSize'])
+
+    def __salt(self, password: list[int], context: Optional[str]) -> bytes:
+        if context is None:
+            return os.urandom(self.Params['SaltSize'])
+
+        # A salt per file and not per call, the key derived from it is then found in the cache
+        SaltId: bytes = self.__salt_id(password, context)
+        Salt: Optional[bytes] = self.keys.get(SaltId)
+
+        if Salt is None:
+            Salt = os.urandom(self.Params['SaltSize'])
+            self.keys.put(SaltId, Salt, self.keys.group(password))
+
+        return Salt
+
+    @classmethod
+    def machine_secret(cls) -> bytes:
+        Secret: Optional[str] = os.environ.get("SLAZHE_CRYPTO_SECRET")
+        if Secret:
+            return Secret.encode("UTF-8")
+
+        for File in cls.MachineIds:
+            try:
+                with open(File, "rb") as IOFile:
+                    MachineId: bytes = IOFile.read().strip()
+            except OSError:
+                continue
+
+            if MachineId:
+                return MachineId
+
+        # Containers often have neither, their host name changes with every deploy: the secret is drawn once and kept with the data
+        return cls.stored_secret()
+
+    @classmethod
+    def stored_secret(cls) -> bytes:
+        """The secret of SecretFile, drawn the first time (readable by its owner only). OSError when it can't be kept."""
+        try:
+            with open(cls.SecretFile, "rb") as IOFile:
+                Secret: bytes = IOFile.read().strip()
+
+            if not Secret:
+                raise OSError(f"{cls.SecretFile} is empty")
+
+            return Secret
+
+        except FileNotFoundError:
+            pass
+
+        Secret: bytes = os.urandom(32).hex().encode()
+        TempFile: str = f'{cls.SecretFile}.{os.getpid()}.tmp'
+
+        os.makedirs(os.path.dirname(os.path.abspath(cls.SecretFile)), exist_ok = True)
+
+        # Written aside then linked: another process never reads it half written, and never replaces it
+        try:
+            Descriptor: int = os.open(TempFile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+
+            try:
+                os.write(Descriptor, Secret)
+                os.fsync(Descriptor)
+            finally:
+                os.close(Descriptor)
+
+            os.link(TempFile, cls.SecretFile)
+
+        except FileExistsError:
+            # Drawn by another process meanwhile
+            return cls.stored_secret()
+
+        finally:
+            try:
+                os.remove(TempFile)
+            except OSError:
+                pass
+
+        Log.Warn(f"No machine-id found, the crypto keys derive from the secret drawn in {os.path.abspath(cls.SecretFile)}: keep it with the data, or set SLAZHE_CRYPTO_SECRET.")
+        return Secret
+
+class CryptoBackends:
+    _backends: dict[str, type[CryptoBackend]] = {}
+
+    # Backend Crypto loads at startup: "auto" takes the first of Order that runs here, "none" stores data as is
+    Default: str = os.environ.get("SLAZHE_CRYPTO_BACKEND", "auto")
+    Order: list[str] = ["dll", "python"]
+
+    @classmethod
+    def register(cls, backend: type[CryptoBackend]) -> None:
+        cls._backends[backend.name] = backend
+
+    @classmethod
+    def get(cls, name: str) -> type[CryptoBackend]:
+        if name not in cls._backends:
+            raise ValueError(f"Unknown crypto backend {name!r}, available: {', '.join(cls._backends)}")
+
+        return cls._backends[name]
+
+    @classmethod
+    def names(cls) -> list[str]:
+        return list(cls._backends)
+
+    @classmethod
+    def load(cls, name: Optional[str], Params: dict[str, int], **Options) -> Optional[CryptoBackend]:
+        """The backend name (Default when not given) built with Params, None when none could load."""
+        name = name or cls.Default
+
+        if name == "none":
+            Log.Warn("Crypto backend disabled, the storages are written unencrypted.")
+            return None
+
+        Errors: list[str] = []
+
+        for candidate in (cls.Order if name == "auto" else [name]):
+            try:
+                backend: CryptoBackend = cls.get(candidate)(dict(Params), **Options)
+            except (OSError, ValueError) as e:
+                Log.Debug(f"Crypto backend {candidate} unavailable: {e}")
+                Errors.append(f"{candidate}: {e}")
+                continue
+
+            Log.Info(f"Crypto backend: {backend.name}.")
+            return backend
+
+        Log.Error(f"No crypto backend could be loaded ({'; '.join(Errors) or name}), the storages are written unencrypted.")
+        return None
+
+    @classmethod
+    def available(cls, Params: dict[str, int], **Options) -> dict[str, CryptoBackend]:
+        """Every backend that runs here, by name (to compare them)."""
+        backends: dict[str, CryptoBackend] = {}
+
+        for name, backend in cls._backends.items():
+            try:
+                backends[name] = backend(dict(Params), **Options)
+            except OSError:
+                continue
+
+        return backends
+
+CryptoBackends.register(DLLBackend)
+CryptoBackends.register(PythonBackend)
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.08
@@ -0,0 +1,92 @@
+from typing import Optional, Any
+from threading import Lock
+from collections import OrderedDict
+
+import os, time, hmac, hashlib
+
+class KeyCache:
+    """
+    Bounded LRU of keys, kept in memory only and for TTL seconds.
+
+    Entries are found by an HMAC of what identifies them (see id) under a key
+    drawn for this process, never by the password itself. An entry can be put
+    in the group of the password it comes from (see group): forget drops the
+    whole group, every key derived from a password at once. A key leaving the
+    cache is wiped when it can be (lists and bytearrays): get and put copy
+    it, a key in use is never the one being wiped.
+    """
+
+    def __init__(self, Size: int = 256, TTL: float = 600.0) -> None:
+        self.Size: int  = Size
+        self.TTL: float = TTL
+
+        self._keys: OrderedDict[bytes, tuple[float, Any, Optional[bytes]]] = OrderedDict()
+        self._secret: bytes = os.urandom(32)
+        self._lock: Lock    = Lock()
+
+    def id(self, *Parts: Any) -> bytes:
+        """Identifier of the key made from Parts (password, salt, parameters, ...)."""
+        return hmac.new(self._secret, repr(Parts).encode("UTF-8"), hashlib.sha256).digest()
+
+    def group(self, password: Any) -> bytes:
+        """Group of the entries that come from password."""
+        return self.id("group", password)
+
+    def get(self, KeyId: bytes) -> Optional[Any]:
+        with self._lock:
+            Cached: Optional[tuple[float, Any, Optional[bytes]]] = self._keys.get(KeyId)
+
+            if Cached is None or Cached[0] <= time.monotonic():
+                return None
+
+            self._keys.move_to_end(KeyId)
+            return Cached[1][:]
+
+    def put(self, KeyId: bytes, Key: Any, Group: Optional[bytes] = None) -> None:
+        with self._lock:
+            self._keys[KeyId] = (time.monotonic() + self.TTL, Key[:], Group)
+            self._keys.move_to_end(KeyId)
+
+            while len(self._keys) > self.Size:
+                self.wipe(self._keys.popitem(last = False)[1][1])
+
+    def pop(self, KeyId: bytes) -> None:
+        with self._lock:
+            Cached: Optional[tuple[float, Any, Optional[bytes]]] = self._keys.pop(KeyId, None)
+
+        if Cached is not None:
+            self.wipe(Cached[1])
+
+    def forget(self, Group: bytes) -> int:
+        """Drop every entry of Group, returns how many there were."""
+        with self._lock:
+            KeyIds: list[bytes] = [KeyId for KeyId, Cached in self._keys.items() if Cached[2] == Group]
+
+            for KeyId in KeyIds:
+                self.wipe(self._keys.pop(KeyId)[1])
+
+        return len(KeyIds)
+
+    def clear(self) -> None:
+        with self._lock:
+            for Expires, Key, Group in self._keys.values():
+                self.wipe(Key)
+
+            self._keys.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._keys)
+
+    @staticmethod
+    def wipe(Key: Any) -> None:
+        # Best effort, the ints (or an immutable copy) may live on elsewhere
+        if isinstance(Key, list):
+            for i in range(len(Key)):
+                Key[i] = 0
+
+        elif isinstance(Key, bytearray):
+            Key[:] = bytes(len(Key))
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.02
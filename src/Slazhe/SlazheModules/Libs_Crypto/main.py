@@ -1,32 +1,35 @@
-from ctypes import CDLL, c_char_p, c_int, POINTER, byref, c_uint, c_ubyte
-from typing import Self, Optional
+from .backends import CryptoBackend, CryptoBackends, Buffer
+from .keycache import KeyCache
+from .stream import CryptoStream
+from typing import Self, Optional, Iterable, Iterator, Callable, Union, Any
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor, Future
 
 import os
 
-SCryptoTypes = {
-    'GetSecureKey': {
-        'return': None,
-        'args': [c_char_p, POINTER(c_int), POINTER(c_int)]
-    },
-    'SecureEncrypt': {
-        'return': c_int,
-        'args': [POINTER(c_ubyte), c_uint, POINTER(c_int), c_uint, POINTER(c_ubyte), c_uint, c_uint, POINTER(c_ubyte), c_uint, POINTER(c_ubyte)]
-    },
-    'SecureDecrypt': {
-        'return': c_int,
-        'args': [POINTER(c_ubyte), c_uint, POINTER(c_int), c_uint, POINTER(c_ubyte), c_uint, c_uint, POINTER(c_ubyte), c_uint, POINTER(c_ubyte)]
-    }
-}
-
-class SCryptoTyping:
-    def GetSecureKey(self, A: c_char_p, B: c_int, C: c_int)                                                                                 -> None:pass
-    def SecureEncrypt(self, A: c_ubyte, B: c_uint, C: c_int, D: c_uint, E: c_ubyte, F: c_uint, G: c_uint, H: c_ubyte, I: c_uint, J: c_ubyte) -> c_int:pass
-    def SecureDecrypt(self, A: c_ubyte, B: c_uint, C: c_int, D: c_uint, E: c_ubyte, F: c_uint, G: c_uint, H: c_ubyte, I: c_uint, J: c_ubyte)-> c_int:pass
+def default_workers() -> int:
+    """SLAZHE_CRYPTO_WORKERS, else the cpu count (8 at most)."""
+    # Read at import, before the logger is set up: a value that isn't a number of threads is ignored
+    try:
+        Workers: int = int(os.environ.get("SLAZHE_CRYPTO_WORKERS", 0))
+    except ValueError:
+        Workers: int = 0
+
+    return Workers if Workers > 0 else min(8, os.cpu_count() or 1)
 
 class Crypto:
     instance: Self          = None
     _is_initialized: bool    = False
 
+    # Keys given by get_secure_password and those the backend derives from them, in memory only (see KeyCache)
+    _keys: KeyCache = KeyCache(Size = 1024, TTL = 600.0)
+
+    # Threads of encrypt_many / decrypt_many, the DLL and the cryptography package release the GIL
+    Workers: int = default_workers()
+
+    _pool: Optional[ThreadPoolExecutor] = None
+    _pool_lock: Lock = Lock()
+
     def __new__(cls, new_instance: Optional[bool] = False):
         if new_instance or cls.instance is None:
             self = super().__new__(cls)
@@ -44,14 +47,7 @@ class Crypto:
         
         return self.instance._is_initialized
 
-    def config(self, Path: str = None, **Options) -> None:
-        try:
-            self.SCrypto: SCryptoTyping = CDLL(Path or os.path.join(os.path.dirname(__file__), "DLL", "SlazheCrypto.dll"))
-        except Exception as e:
-            self.SCrypto = None
-
-            return
-
+    def config(self, Path: str = None, Backend: Optional[str] = None, **Options) -> None:
         self.Params: dict[str, int] = {
             'SaltSize': Options.get('SaltSize', 16),
             'KeySize': Options.get('KeySize', 32),
@@ -59,107 +55,162 @@ class Crypto:
             'Iterations': Options.get('Iterations', 10000)
         }
 
-        for Func in SCryptoTypes:
-            try:
-                Element = getattr(self.SCrypto, Func)
-            except AttributeError:
-                continue
+        # The backend in use (CryptoBackends.Default, SLAZHE_CRYPTO_BACKEND), None leaves the data as is
+        self.SCrypto: Optional[CryptoBackend] = CryptoBackends.load(Backend, self.Params, Path = Path, Keys = self._keys)
 
-            else:
-                Element.restype     = SCryptoTypes[Func]['return']
-                Element.argtypes    = SCryptoTypes[Func]['args']
+        if self.SCrypto is None:
+            return
 
         self._is_initialized = True
 
-    def secure_decrypt(self, encrypted_data: bytes, password: list[int]) -> bytes:
+    @property
+    def backend(self) -> Optional[str]:
+        """Name of the backend in use, None without one."""
+        return getattr(getattr(self, 'SCrypto', None), 'name', None)
+
+    def secure_decrypt(self, encrypted_data: Buffer, password: list[int], context: Optional[str] = None) -> bytes:
         if self.SCrypto is None:
             return encrypted_data
 
-        salt_len = self.Params['SaltSize']
-        iv_len = self.Params['IvSize']
+        return self.SCrypto.decrypt(encrypted_data, password, context = context)
 
-        if len(encrypted_data) < (salt_len + iv_len):
-            raise ValueError("Invalid encrypted data format.")
+    def secure_encrypt(self, PlainTextData: Buffer, password: list[int], context: Optional[str] = None) -> bytes:
+        """Encrypts PlainTextData, context (the file it goes to) keeps the salt of that file, see the backend."""
+        if self.SCrypto is None:
+            return PlainTextData
+
+        return self.SCrypto.encrypt(PlainTextData, password, context = context)
+
+    def encrypt_many(self, items: Iterable[Buffer], password: Union[list[int], list[list[int]]], workers: Optional[int] = None, return_exceptions: bool = False) -> list[Union[bytes, Exception]]:
+        """
+        secure_encrypt of every item, on the worker pool. password is one key
+        for all of them or one key per item. The results keep the order of
+        items. Once every item is done, the first error is raised, or with
+        return_exceptions each error stands in place of its result.
+        """
+        return self.__many(self.secure_encrypt, items, password, workers, return_exceptions)
+
+    def decrypt_many(self, items: Iterable[Buffer], password: Union[list[int], list[list[int]]], workers: Optional[int] = None, return_exceptions: bool = False) -> list[Union[bytes, Exception]]:
+        """secure_decrypt of every item, like encrypt_many."""
+        return self.__many(self.secure_decrypt, items, password, workers, return_exceptions)
+
+    def encrypt_stream(self, chunks: Iterable[Buffer], password: list[int], chunk: Optional[int] = None, workers: Optional[int] = None) -> Iterator[bytes]:
+        """
+        secure_encrypt chunk by chunk (see CryptoStream), for the payloads too
+        large to hold twice. With workers > 1, that many frames are sealed at
+        once on the worker pool.
+        """
+        if self.SCrypto is None:
+            return iter(chunks)
 
-        salt        = encrypted_data[:salt_len]
-        iv          = encrypted_data[salt_len:salt_len + iv_len]
-        ciphertext  = encrypted_data[salt_len + iv_len:]
+        workers = workers or 1
 
-        ciphertext_len  = len(ciphertext)
-        salt_len        = len(salt)
-        iv_len          = len(iv)
+        if workers <= 1:
+            return CryptoStream.encrypt(self.SCrypto, chunks, password, chunk)
 
-        if iv_len != self.Params['IvSize']:
-            raise ValueError("IV size does not match expected size.")
+        return CryptoStream.encrypt(self.SCrypto, chunks, password, chunk, workers, lambda func, items: self.__map(func, items, workers))
 
-        if salt_len != self.Params['SaltSize']:
-            raise ValueError("Salt size does not match expected size.")
+    def decrypt_stream(self, chunks: Iterable[Buffer], password: list[int]) -> Iterator[bytes]:
+        if self.SCrypto is None:
+            return iter(chunks)
 
-        ciphertext_array= (c_ubyte * ciphertext_len)(*ciphertext)
-        salt_array      = (c_ubyte * salt_len)(*salt)
-        iv_array        = (c_ubyte * iv_len)(*iv)
+        return CryptoStream.decrypt(self.SCrypto, chunks, password)
 
-        plaintext       = (c_ubyte * (ciphertext_len * 4))()
-        password_array  = (c_int * len(password))(*password)
+    def get_secure_password(self, FileName: str) -> list[int]:
+        if self.SCrypto is None:
+            import os
 
+            return [x for x in os.urandom(64)]           
 
-        result = self.SCrypto.SecureDecrypt(
-            ciphertext_array, ciphertext_len,
-            password_array, len(password),
-            salt_array, salt_len,
-            self.Params['Iterations'],
-            iv_array, iv_len,
-            plaintext
-        )
+        KeyId: bytes = self.__key_id(FileName)
+        Key: Optional[list[int]] = self._keys.get(KeyId)
 
-        if result < 0:
-            raise RuntimeError(f"Decryption failed with error code: {result}")
+        if Key is None:
+            Key = self.SCrypto.secure_key(FileName)
+            self._keys.put(KeyId, Key, self._keys.group(Key))
 
-        return bytes(plaintext[:result])
-    
-    def secure_encrypt(self, PlainTextData: bytes, password: list[int]) -> bytes:
-        PlainText = PlainTextData
+        return list(Key)
 
+    def forget_key(self, FileName: str) -> None:
+        """Drop the key of FileName (a user's password on logout) and every key the backend derived from it."""
         if self.SCrypto is None:
-            return PlainText
-
-        PlainText_len   = len(PlainText)
-        salt_len        = self.Params.get('SaltSize', 16)
-        iv_len          = self.Params.get('IvSize', 16)
-
-        plaintext_array = (c_ubyte * PlainText_len)(*PlainText)
-        salt            = (c_ubyte * salt_len)()
-        iv              = (c_ubyte * iv_len)()
-
-        ciphertext      = (c_ubyte * (PlainText_len * 4))()
-        password_array  = (c_int * len(password))(*password)
-
-        result          = self.SCrypto.SecureEncrypt(
-            plaintext_array, PlainText_len,
-            password_array, len(password),
-            salt, salt_len,
-            self.Params['Iterations'],
-            iv, iv_len,
-            ciphertext
-        )
-
-        if result < 0:
-            return b''
-        
-        return bytes(salt) + bytes(iv) + bytes(ciphertext[:result])
+            return
 
-    def get_secure_password(self, FileName: str) -> list[int]:
+        Key: Optional[list[int]] = self._keys.get(self.__key_id(FileName))
+
+        # Gone from the cache, what was derived from it may still be there
+        if Key is None:
+            Key = self.SCrypto.secure_key(FileName)
+
+        self._keys.forget(self._keys.group(Key))
+        KeyCache.wipe(Key)
+
+    @classmethod
+    def wipe_keys(cls) -> None:
+        """Drop every cached key (and those the backend derived)."""
+        cls._keys.clear()
+
+        # A backend built on its own keeps its own cache
+        Keys: Optional[KeyCache] = getattr(getattr(cls.instance, 'SCrypto', None), 'keys', None)
+
+        if Keys is not None and Keys is not cls._keys:
+            Keys.clear()
+
+    def __many(self, func: Callable[[Buffer, list[int]], bytes], items: Iterable[Buffer], password: Union[list[int], list[list[int]]], workers: Optional[int], return_exceptions: bool) -> list[Union[bytes, Exception]]:
+        items = list(items)
+
+        # One key per item, or the same one for all
+        if password and isinstance(password[0], list):
+            passwords: list[list[int]] = list(password)
+        else:
+            passwords: list[list[int]] = [password] * len(items)
+
+        if len(passwords) != len(items):
+            raise ValueError(f"{len(passwords)} passwords for {len(items)} items.")
+
+        def call(item: tuple[Buffer, list[int]]) -> Union[bytes, Exception]:
+            try:
+                return func(*item)
+            except Exception as e:
+                return e
+
+        # Without a backend the data is given back as is, there is nothing to spread
         if self.SCrypto is None:
-            import os
+            workers = 1
 
-            return [x for x in os.urandom(64)]           
+        results: list[Union[bytes, Exception]] = self.__map(call, list(zip(items, passwords)), workers or self.Workers)
 
-        Output = (c_int * 128)()
-        OutputLen = c_int()
-        self.SCrypto.GetSecureKey(FileName.encode("UTF-8"), Output, byref(OutputLen))
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+
+        return results
+
+    def __map(self, func: Callable[[Any], Any], items: list[Any], workers: int) -> list[Any]:
+        # A single item or worker isn't worth the round trip through the pool
+        if workers <= 1 or len(items) <= 1:
+            return [func(item) for item in items]
+
+        if workers != self.Workers:
+            with ThreadPoolExecutor(max_workers = workers, thread_name_prefix = "Slazhe-Crypto") as executor:
+                return list(executor.map(func, items))
+
+        futures: list[Future] = [self.__pool().submit(func, item) for item in items]
+        return [future.result() for future in futures]
+
+    @classmethod
+    def __pool(cls) -> ThreadPoolExecutor:
+        with cls._pool_lock:
+            if cls._pool is None:
+                cls._pool = ThreadPoolExecutor(max_workers = cls.Workers, thread_name_prefix = "Slazhe-Crypto")
+
+            return cls._pool
+
+    def __key_id(self, FileName: str) -> bytes:
+        # Backends don't give the same key for a file
+        return self._keys.id(FileName, self.backend, sorted(getattr(self, 'Params', {}).items()))
 
-        return list(Output[:OutputLen.value])
-    
     @classmethod
     def GSP(cls, FileName: str) -> list[int]:
         if not cls.instance:
@@ -168,4 +219,4 @@ class Crypto:
         return cls.instance.get_secure_password(str(FileName))
 
 # Version Globale: v00.00.00.pl
-# Version du fichier: v00.00.00.0b
+# Version du fichier: v00.00.00.0l
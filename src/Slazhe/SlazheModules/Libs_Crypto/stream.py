@@ -0,0 +1,166 @@
+from .backends import CryptoBackend, Buffer
+from typing import Iterable, Iterator, Optional, Any, Callable
+
+import os, struct
+
+class CryptoStream:
+    """
+    Chunked encryption, for payloads too large to encrypt in one call.
+
+        header: magic(4) version(1) mode(1) chunk(4) salt(SaltSize) nonce(8)
+                wrapped key length(2) wrapped key    (version 2 on)
+        frame:  length(4) flags(1) sealed chunk
+
+    The salt and the nonce are drawn per stream, the key is derived once per
+    stream (see CryptoBackend.new_stream_key), a backend that can't derive it
+    on its own draws it and keeps it wrapped in the header. Frame n is sealed
+    with the nonce + n and authenticates the stream header, n and its flags:
+    frames can't be reordered, dropped or moved to another stream, and a
+    stream cut short is caught by the missing FINAL frame. Plaintext goes in
+    and out chunk by chunk, memory doesn't grow with the payload.
+    """
+
+    MAGIC: bytes    = b"SLZC"
+    VERSION: int    = 2
+    Chunk: int      = 1 << 20
+
+    # Frame flags
+    FINAL: int      = 1 << 0
+
+    __head: struct.Struct   = struct.Struct("<4sBBI")
+    __frame: struct.Struct  = struct.Struct("<IB")
+    __aad: struct.Struct    = struct.Struct("<QB")
+    __wrapped: struct.Struct = struct.Struct("<H")
+
+    NonceSize: int  = 8
+    # What sealing may add to a chunk, bigger frames are corrupted ones
+    Overhead: int   = 4096
+
+    @classmethod
+    def encrypt(cls, backend: CryptoBackend, chunks: Iterable[Buffer], password: list[int], chunk: Optional[int] = None, window: int = 1, map: Optional[Callable] = None) -> Iterator[bytes]:
+        """
+        Encrypts chunks (of any size) as a stream, yields the header then one
+        frame per chunk bytes of plaintext. With a map (an ordered parallel
+        map), window frames are sealed at once: memory holds window chunks.
+        """
+        chunk = chunk or cls.Chunk
+        window = window if map is not None else 1
+
+        salt: bytes     = os.urandom(backend.Params['SaltSize'])
+        nonce: bytes    = os.urandom(cls.NonceSize)
+
+        key, wrapped    = backend.new_stream_key(password, salt)
+        head: bytes     = cls.__head.pack(cls.MAGIC, cls.VERSION, backend.Stream, chunk) + salt + nonce + cls.__wrapped.pack(len(wrapped)) + wrapped
+
+        yield head
+
+        counter: int = 0
+        pending: bytearray = bytearray()
+
+        def seal(frame: tuple[int, bytes, int]) -> bytes:
+            return cls.__seal(backend, key, head, nonce, *frame)
+
+        for data in chunks:
+            pending += data
+
+            # One chunk is held back, the last frame has to be flagged FINAL. Backends get copies,
+            # a view they'd keep (the DLL's ctypes arrays) would stop pending from shrinking
+            while len(pending) > chunk * window:
+                frames: list[tuple[int, bytes, int]] = [(counter + i, bytes(pending[i * chunk:(i + 1) * chunk]), 0) for i in range(window)]
+
+                yield from (map(seal, frames) if window > 1 else [seal(frames[0])])
+
+                del pending[:chunk * window]
+                counter += window
+
+        # What is left, window frames at most, the last one FINAL
+        frames = [(counter + i, bytes(pending[i * chunk:(i + 1) * chunk]), 0) for i in range(max(1, -(-len(pending) // chunk)))]
+        frames[-1] = (frames[-1][0], frames[-1][1], cls.FINAL)
+
+        yield from (map(seal, frames) if len(frames) > 1 else [seal(frames[0])])
+
+    @classmethod
+    def decrypt(cls, backend: CryptoBackend, chunks: Iterable[Buffer], password: list[int]) -> Iterator[bytes]:
+        """Decrypts a stream given in chunks (of any size), yields the plaintext frame by frame."""
+        blocks: Iterator[Buffer] = iter(chunks)
+        pending: bytearray = bytearray()
+
+        def fill(size: int) -> bool:
+            while len(pending) < size:
+                block: Optional[Buffer] = next(blocks, None)
+
+                if block is None:
+                    return False
+
+                pending.extend(block)
+
+            return True
+
+        size: int = cls.__head.size + backend.Params['SaltSize'] + cls.NonceSize
+
+        if not fill(size):
+            raise ValueError("Invalid encrypted stream: truncated header.")
+
+        magic, version, mode, chunk = cls.__head.unpack_from(pending)
+
+        if magic != cls.MAGIC or version > cls.VERSION:
+            raise ValueError("Invalid encrypted stream.")
+
+        if mode not in backend.Streams:
+            raise ValueError(f"The stream was written by another crypto backend (mode {mode}, {backend.name} reads {', '.join(map(str, backend.Streams))}).")
+
+        salt: bytes     = bytes(pending[cls.__head.size:cls.__head.size + backend.Params['SaltSize']])
+        nonce: bytes    = bytes(pending[size - cls.NonceSize:size])
+        wrapped: bytes  = b""
+
+        if version >= 2:
+            if not fill(size + cls.__wrapped.size):
+                raise ValueError("Invalid encrypted stream: truncated header.")
+
+            length: int = cls.__wrapped.unpack_from(pending, size)[0]
+            size += cls.__wrapped.size + length
+
+            if not fill(size):
+                raise ValueError("Invalid encrypted stream: truncated header.")
+
+            wrapped = bytes(pending[size - length:size])
+
+        head: bytes     = bytes(pending[:size])
+        key: Any        = backend.stream_key(password, salt, mode, wrapped)
+
+        del pending[:size]
+        counter: int = 0
+
+        while True:
+            if not fill(cls.__frame.size):
+                raise ValueError("Invalid encrypted stream: truncated, the last frame is missing.")
+
+            length, flags = cls.__frame.unpack_from(pending)
+
+            if length > chunk + cls.Overhead or not fill(cls.__frame.size + length):
+                raise ValueError("Invalid encrypted stream: corrupted or truncated frame.")
+
+            frame: bytes = bytes(pending[cls.__frame.size:cls.__frame.size + length])
+            del pending[:cls.__frame.size + length]
+
+            yield backend.unseal(key, cls.__nonce(nonce, counter), frame, head + cls.__aad.pack(counter, flags))
+            counter += 1
+
+            if flags & cls.FINAL:
+                break
+
+        if pending or next(blocks, None):
+            raise ValueError("Invalid encrypted stream: data after the last frame.")
+
+    @classmethod
+    def __seal(cls, backend: CryptoBackend, key: Any, head: bytes, nonce: bytes, counter: int, data: Buffer, flags: int) -> bytes:
+        sealed: bytes = backend.seal(key, cls.__nonce(nonce, counter), data, head + cls.__aad.pack(counter, flags))
+        return cls.__frame.pack(len(sealed), flags) + sealed
+
+    @staticmethod
+    def __nonce(nonce: bytes, counter: int) -> bytes:
+        # 96 bits for GCM. Past 4G frames (4 PiB with 1 MiB chunks) pack raises rather than reuse a nonce
+        return nonce + struct.pack(">I", counter)
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.03
@@ -0,0 +1,2 @@
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.01
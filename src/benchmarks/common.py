@@ -0,0 +1,87 @@
+"""
+Helpers shared by the offline benchmarks.
+
+Run a benchmark from the ``src`` folder, for example ``python -m benchmarks.prefixes``.
+"""
+from typing import Any, Optional
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+# The benchmarks chdir into a scratch folder, keep the package importable.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def setup(folder: Optional[str] = None) -> str:
+    """Move into a scratch folder and initialise the logger and SlazheCrypto like main.py does."""
+    folder = folder or tempfile.mkdtemp(prefix = "slazhe-bench-")
+    os.makedirs(folder, exist_ok = True)
+    os.chdir(folder)
+
+    from Slazhe import LoggerConfig, LogLevels
+
+    LoggerConfig.init(FileFormat = 'Log %Y-%m-%d.log', Folder = os.path.join(folder, 'Logs') + os.sep, Level = LogLevels.CRITICAL)
+
+    from Slazhe.SlazheModules import importer
+
+    if getattr(importer, "SlazheCrypto", False):
+        importer.SlazheCrypto().config()
+
+    return folder
+
+def percentile(values: list[float], percent: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+
+    return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
+
+def parser(description: str) -> argparse.ArgumentParser:
+    args = argparse.ArgumentParser(description = description)
+    args.add_argument("--folder", help = "Scratch folder (a temporary one by default).")
+    args.add_argument("--save", help = "Write the results to this JSON file.")
+    args.add_argument("--baseline", help = "Compare against a JSON file written by --save and fail on regressions.")
+    args.add_argument("--tolerance", type = float, default = 0.25, help = "Allowed slowdown against the baseline (0.25 = +25%%).")
+    return args
+
+def print_table(title: str, columns: list[str], rows: list[list[Any]]) -> None:
+    cells = [[str(c) for c in columns]] + [[f"{c:.2f}" if isinstance(c, float) else str(c) for c in row] for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(columns))]
+
+    print(f"\n{title}")
+    for index, row in enumerate(cells):
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+        if index == 0:
+            print("  ".join("-" * width for width in widths))
+
+def compare(results: dict[str, dict[str, float]], args: argparse.Namespace, metrics: tuple[str, ...]) -> int:
+    """Save and/or check the results against a baseline, returns the process exit code."""
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent = 2)
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline) as file:
+        baseline: dict[str, dict[str, float]] = json.load(file)
+
+    regressions: list[str] = []
+    for name, values in results.items():
+        for metric in metrics:
+            before: float = baseline.get(name, {}).get(metric)
+            if not before or metric not in values:
+                continue
+
+            if values[metric] > before * (1 + args.tolerance):
+                regressions.append(f"{name} {metric}: {before:.2f} -> {values[metric]:.2f}")
+
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file = sys.stderr)
+
+    return 1 if regressions else 0
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.01
@@ -0,0 +1,148 @@
+"""
+Offline benchmark of the crypto backends (``secure_encrypt``/``secure_decrypt``).
+
+Every backend that runs here (``--backends`` to pick) is timed on the same
+payloads, to compare them. For the DLL, "before" is the previous marshalling,
+one Python int per byte into the ctypes arrays, a 4x output buffer and a byte
+by byte slice of it, "after" the current one (buffers passed in place, output
+sized exactly). Without the DLL (Linux) only that marshalling is timed.
+
+    python -m benchmarks.crypto --sizes 1024 65536 1048576 --backends python
+"""
+from .common import setup, parser, print_table, compare
+
+from ctypes import c_int, c_ubyte
+from typing import Any, Callable
+
+import os
+import time
+
+def legacy_encrypt(crypto: Any, data: bytes, password: list[int]) -> bytes:
+    """The previous bridge, crypto being the DLL backend."""
+    salt_len, iv_len = crypto.Params['SaltSize'], crypto.Params['IvSize']
+
+    plaintext_array = (c_ubyte * len(data))(*data)
+    salt            = (c_ubyte * salt_len)()
+    iv              = (c_ubyte * iv_len)()
+    ciphertext      = (c_ubyte * (len(data) * 4))()
+    password_array  = (c_int * len(password))(*password)
+
+    result = crypto.SCrypto.SecureEncrypt(plaintext_array, len(data), password_array, len(password), salt, salt_len, crypto.Params['Iterations'], iv, iv_len, ciphertext)
+    return bytes(salt) + bytes(iv) + bytes(ciphertext[:result])
+
+def legacy_decrypt(crypto: Any, data: bytes, password: list[int]) -> bytes:
+    salt_len, iv_len = crypto.Params['SaltSize'], crypto.Params['IvSize']
+    salt, iv, ciphertext = data[:salt_len], data[salt_len:salt_len + iv_len], data[salt_len + iv_len:]
+
+    ciphertext_array = (c_ubyte * len(ciphertext))(*ciphertext)
+    salt_array       = (c_ubyte * salt_len)(*salt)
+    iv_array         = (c_ubyte * iv_len)(*iv)
+    plaintext        = (c_ubyte * (len(ciphertext) * 4))()
+    password_array   = (c_int * len(password))(*password)
+
+    result = crypto.SCrypto.SecureDecrypt(ciphertext_array, len(ciphertext), password_array, len(password), salt_array, salt_len, crypto.Params['Iterations'], iv_array, iv_len, plaintext)
+    return bytes(plaintext[:result])
+
+def legacy_marshal(data: bytes) -> bytes:
+    """What the previous bridge did around the DLL call, for one direction."""
+    array  = (c_ubyte * len(data))(*data)
+    output = (c_ubyte * (len(data) * 4))()
+    return bytes(output[:len(array)])
+
+def marshal(bridge: Any, data: bytes) -> bytes:
+    """The same with the current helpers (bridge being Libs_Crypto.backends)."""
+    bridge.c_input(data)
+    output = bytearray(len(data) + bridge.BlockSize)
+    bridge.c_output(output, 0, len(output))
+    return bytes(memoryview(output)[:len(data)])
+
+def throughput(func: Callable[[], Any], size: int, budget: float) -> tuple[float, float]:
+    """MB/s and microseconds per call of func, repeated for about budget seconds."""
+    calls: int = 0
+    start: float = time.perf_counter()
+
+    while True:
+        func()
+        calls += 1
+
+        elapsed: float = time.perf_counter() - start
+        if elapsed >= budget:
+            break
+
+    return size * calls / elapsed / 1e6, elapsed / calls * 1e6
+
+def main() -> int:
+    args = parser("Benchmark the crypto backends.")
+    args.add_argument("--sizes",  type = int, nargs = "+", default = [1024, 65536, 1 << 20, 8 << 20])
+    args.add_argument("--budget", type = float, default = 0.5, help = "Seconds spent per measure.")
+    args.add_argument("--backends", nargs = "+", help = "Backends to compare (every one that runs here by default).")
+    args = args.parse_args()
+
+    setup(args.folder)
+
+    from Slazhe.SlazheModules import importer
+    from Slazhe.SlazheModules.Libs_Crypto import backends as bridge
+
+    crypto: Any = importer.SlazheCrypto() if getattr(importer, "SlazheCrypto", False) else None
+    password: list[int] = list(range(64))
+
+    available: dict[str, Any] = bridge.CryptoBackends.available(getattr(crypto, "Params", {'SaltSize': 16, 'KeySize': 32, 'IvSize': 16, 'Iterations': 10000}))
+    backends: dict[str, Any] = {name: backend for name, backend in available.items() if not args.backends or name in args.backends}
+
+    bridge_results: dict[str, dict[str, float]] = {}
+    backend_results: dict[str, dict[str, float]] = {}
+
+    for size in args.sizes:
+        data: bytes = os.urandom(size)
+
+        for name, backend in backends.items():
+            encrypted: bytes = backend.encrypt(data, password)
+
+            for operation, func in (("encrypt", lambda: backend.encrypt(data, password)), ("decrypt", lambda: backend.decrypt(encrypted, password))):
+                mbps, us = throughput(func, size, args.budget)
+                backend_results[f"{operation}-{name}-{size}"] = {"mbps": mbps, "us": us}
+
+        if "dll" in backends:
+            dll: Any = backends["dll"]
+            encrypted: bytes = dll.encrypt(data, password)
+            cases: dict[str, tuple[Callable, Callable]] = {
+                "encrypt": (lambda: legacy_encrypt(dll, data, password), lambda: dll.encrypt(data, password)),
+                "decrypt": (lambda: legacy_decrypt(dll, encrypted, password), lambda: dll.decrypt(encrypted, password))
+            }
+        else:
+            cases = {"marshal": (lambda: legacy_marshal(data), lambda: marshal(bridge, data))}
+
+        for name, (before, after) in cases.items():
+            before_mbps, before_us = throughput(before, size, args.budget)
+            after_mbps, after_us   = throughput(after, size, args.budget)
+
+            bridge_results[f"{name}-{size}"] = {
+                "before_mbps": before_mbps, "after_mbps": after_mbps,
+                "before_us": before_us, "after_us": after_us
+            }
+
+    if backend_results:
+        print_table(
+            f"Crypto backends throughput (MB/s of plaintext, in use: {getattr(crypto, 'backend', None)})",
+            ["case", "backend", "size", "MB/s", "us"],
+            [[key.split("-")[0], key.split("-")[1], key.split("-")[2], r["mbps"], r["us"]] for key, r in backend_results.items()]
+        )
+    else:
+        print("No crypto backend runs here (SlazheCrypto DLL or the cryptography package).")
+
+    if "marshal" in next(iter(bridge_results), ""):
+        print("SlazheCrypto DLL not available, only the marshalling around it is measured.")
+
+    print_table(
+        "SlazheCrypto bridge throughput (MB/s of plaintext)",
+        ["case", "before MB/s", "after MB/s", "before us", "after us", "speedup"],
+        [[name, r["before_mbps"], r["after_mbps"], r["before_us"], r["after_us"], r["before_us"] / r["after_us"]] for name, r in bridge_results.items()]
+    )
+
+    return compare(bridge_results | backend_results, args, ("after_us", "us"))
+
+if __name__ == "__main__":
+    raise SystemExit(main())
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.02
@@ -0,0 +1,191 @@
+"""
+Offline benchmark of the per message prefix path.
+
+Synthetic messages go through ``Prefixes.run`` and through the full prefix
+command path (prefix resolution, command lookup, then the ``decorator_bot``
+coroutine registered by ``callcommands``). No Discord connection is made.
+
+    python -m benchmarks.prefixes --guilds 100 10000 --users 1000 50000 --prefixes 1 32
+"""
+from .common import setup, percentile, parser, print_table, compare
+
+from types  import SimpleNamespace
+from typing import Any, Callable, Optional
+
+import asyncio
+import itertools
+import random
+import time
+import tracemalloc
+
+class Recorder:
+    """Stands in for commands.Bot, keeps the callbacks callcommands registers."""
+
+    def __init__(self) -> None:
+        self.commands: dict[str, Callable] = {}
+        self.tree = SimpleNamespace(command = lambda **info: lambda func: func)
+
+    def command(self, **info: Any) -> Callable:
+        def decorator(func: Callable) -> Callable:
+            self.commands[info["name"]] = func
+            return func
+        return decorator
+
+def bench_cog() -> Any:
+    from Slazhe.Discord import Cog, command, Context
+
+    class Bench(Cog):
+        @command(name = "bench", description = "Benchmark", typing = False)
+        async def bench(self, ctx: Context, value: str) -> None:
+            pass
+
+    return Bench()
+
+def message(guild: Optional[int], user: int, content: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        guild   = SimpleNamespace(id = guild) if guild else None,
+        author  = SimpleNamespace(id = user),
+        content = content
+    )
+
+def populate(bot_uuid: str, guilds: int, users: int, prefixes: int, rng: random.Random) -> list[str]:
+    """Fill the prefix store of a bot, returns every prefix used."""
+    from Slazhe.Modules.Libs_Bots.Libs.store import PrefixStore
+
+    pool: list[str] = [f"{c}{n}" if n else c for n in range(prefixes) for c in "!?$."][:max(prefixes, 1) * 4]
+    store = PrefixStore(f"var/Slazhe-Bots/{bot_uuid}/Prefixes/")
+
+    def scope(key) -> tuple:
+        return key, {
+            f"{key[0]}-{key[1]}-{index}": {"prefix": prefix, "active": True, "created_by": "bench", "create_at": "bench"}
+            for index, prefix in enumerate(rng.sample(pool, min(prefixes, len(pool))))
+        }
+
+    items = [scope(("client", ""))]
+    items.extend(scope(("guild", str(guild))) for guild in range(1, guilds + 1))
+    items.extend(scope(("user", str(user))) for user in range(1, users + 1))
+
+    store.save_many(items)
+    store.set_meta("migrated", "bench")
+    store.close()
+
+    return pool
+
+def workload(guilds: int, users: int, pool: list[str], count: int, rng: random.Random) -> list[SimpleNamespace]:
+    """Messages from a population four times larger than the one with custom prefixes."""
+    messages: list[SimpleNamespace] = []
+
+    for _ in range(count):
+        guild: Optional[int] = rng.randint(1, guilds * 4) if rng.random() < 0.9 else None
+        user: int = rng.randint(1, users * 4)
+        content: str = f"{rng.choice(pool)}bench value" if rng.random() < 0.3 else "just chatting"
+        messages.append(message(guild, user, content))
+
+    return messages
+
+async def timed(func: Callable, messages: list[SimpleNamespace]) -> list[float]:
+    timings: list[float] = []
+
+    for msg in messages:
+        start: int = time.perf_counter_ns()
+        await func(msg)
+        timings.append((time.perf_counter_ns() - start) / 1000)
+
+    timings.sort()
+    return timings
+
+async def allocated(func: Callable, messages: list[SimpleNamespace]) -> tuple[float, float]:
+    """Mean peak bytes allocated while handling a message, and mean blocks still alive after it."""
+    import sys
+
+    peaks: int = 0
+    tracemalloc.start()
+    try:
+        blocks: int = sys.getallocatedblocks()
+        for msg in messages:
+            tracemalloc.reset_peak()
+            before: int = tracemalloc.get_traced_memory()[0]
+            await func(msg)
+            peaks += tracemalloc.get_traced_memory()[1] - before
+        blocks = sys.getallocatedblocks() - blocks
+    finally:
+        tracemalloc.stop()
+
+    return peaks / len(messages), blocks / len(messages)
+
+async def scenario(guilds: int, users: int, prefixes: int, count: int, seed: int) -> dict[str, dict[str, float]]:
+    from Slazhe.Modules.Libs_Bots.Prefixes import Prefixes
+    from Slazhe.Discord.Bin.callcommands import callcommands
+
+    rng = random.Random(seed)
+    bot_uuid: str = f"bench-{guilds}-{users}-{prefixes}"
+
+    pool: list[str] = populate(bot_uuid, guilds, users, prefixes, rng)
+    messages: list[SimpleNamespace] = workload(guilds, users, pool, count, rng)
+
+    Client = SimpleNamespace(uuid = bot_uuid)
+    Recorded = Recorder()
+
+    for command in bench_cog().any_commands().values():
+        callcommands().decorator(Recorded, command)
+
+    async def command_path(msg: SimpleNamespace) -> None:
+        prefix: list[str] = await bot_prefixes.run(Recorded, msg)
+        if not prefix:
+            return
+
+        name, *args = msg.content[len(prefix[0]):].split()
+        callback: Callable = Recorded.commands.get(name)
+        if callback is not None:
+            await callback(SimpleNamespace(guild = msg.guild, message = msg), *args)
+
+    results: dict[str, dict[str, float]] = {}
+
+    bot_prefixes = Prefixes(Client)
+    paths: dict[str, Callable] = {
+        "run cold": lambda msg: bot_prefixes.run(Recorded, msg),
+        "run warm": lambda msg: bot_prefixes.run(Recorded, msg),
+        "command":  command_path,
+    }
+
+    for name, func in paths.items():
+        timings: list[float] = await timed(func, messages)
+        peak, blocks = await allocated(func, messages[:min(len(messages), 2000)])
+
+        results[f"{name} g={guilds} u={users} p={prefixes}"] = {
+            "p50_us":       percentile(timings, 50),
+            "p99_us":       percentile(timings, 99),
+            "peak_bytes":   peak,
+            "live_blocks":  blocks,
+        }
+
+    return results
+
+def main() -> int:
+    args = parser("Benchmark Prefixes.run and the prefix command path.")
+    args.add_argument("--guilds",   type = int, nargs = "+", default = [100, 10000])
+    args.add_argument("--users",    type = int, nargs = "+", default = [1000, 20000])
+    args.add_argument("--prefixes", type = int, nargs = "+", default = [1, 32])
+    args.add_argument("--messages", type = int, default = 20000)
+    args.add_argument("--seed",     type = int, default = 0)
+    args = args.parse_args()
+
+    setup(args.folder)
+
+    results: dict[str, dict[str, float]] = {}
+    for guilds, users, prefixes in itertools.product(args.guilds, args.users, args.prefixes):
+        results.update(asyncio.run(scenario(guilds, users, prefixes, args.messages, args.seed)))
+
+    print_table(
+        f"Prefix resolution, {args.messages} messages per scenario (latency in microseconds)",
+        ["scenario", "p50", "p99", "peak B/msg", "live blocks/msg"],
+        [[name, r["p50_us"], r["p99_us"], r["peak_bytes"], r["live_blocks"]] for name, r in results.items()]
+    )
+
+    return compare(results, args, ("p50_us", "p99_us", "peak_bytes"))
+
+if __name__ == "__main__":
+    raise SystemExit(main())
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.01
@@ -69,7 +69,11 @@ if getattr(importer, 'GlobalVars', None):
     GlobalVars.set_variable("importer", importer)
     GlobalVars.set_variable("module_importer", module_importer)
 
-if not os.path.exists("var/slazhe-users/users.slze") and getattr(module_importer, "root_account", None):
+# SLAZHE_STORAGE_BACKEND=sqlite moves the .slze files left on disk into the databases
+if getattr(module_importer, "migrate_storage", None) and module_importer.Backends.Default != "file":
+    module_importer.migrate_storage(module_importer.slazhe_namespaces(), module_importer.Backends.Default, remove = True)
+
+if getattr(module_importer, "root_account", None) and not module_importer.Storage("var/slazhe-users", "login.py").has("users.slze"):
     Log.Info("Creation du compte root.")
     module_importer.root_account()
 
@@ -85,4 +89,4 @@ if getattr(module_importer, 'MainCli', None):
     MainCli = module_importer.MainCli()
 
 # Version Globale: v00.00.00.pl
-# Version du fichier: v00.00.00.1l
+# Version du fichier: v00.00.00.1m
@@ -0,0 +1,303 @@
+"""
+Tests of the crypto backends, run from src/:
+
+    python -m unittest discover tests
+"""
+import os, sys, tempfile, unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Slazhe import LoggerConfig, LogLevels
+from Slazhe.SlazheModules import importer as SlazheImporter
+from Slazhe.SlazheModules.Libs_Crypto.keycache import KeyCache
+from Slazhe.SlazheModules.Libs_Crypto.backends import DLLBackend, CryptoBackend, PythonBackend
+from Slazhe.SlazheModules.Libs_Crypto.stream import CryptoStream
+
+class CryptoTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.TemporaryDirectory()
+        LoggerConfig.init(Folder = f"{self.folder.name}/Logs/", Level = LogLevels.WARNING)
+
+        self.crypto = SlazheImporter.SlazheCrypto()
+        self.crypto.config()
+
+        if self.crypto.SCrypto is None:
+            self.skipTest("no crypto backend runs here")
+
+        self.key: list[int] = self.crypto.get_secure_password("test")
+
+    def tearDown(self) -> None:
+        self.folder.cleanup()
+
+class KeyCacheTest(unittest.TestCase):
+    def test_keys_expire(self) -> None:
+        cache: KeyCache = KeyCache(Size = 4, TTL = 10.0)
+        cache.put(b"a", [1, 2])
+
+        with mock.patch("time.monotonic", return_value = 1e12):
+            self.assertIsNone(cache.get(b"a"))
+
+        self.assertEqual(cache.get(b"a"), [1, 2])
+
+    def test_evicted_keys_are_wiped(self) -> None:
+        cache: KeyCache = KeyCache(Size = 2)
+        key: bytearray = bytearray(b"secret")
+
+        cache.put(b"a", key)
+        # The cache has its own copy, a key in use isn't wiped under its user
+        stored: bytearray = cache._keys[b"a"][1]
+        self.assertIsNot(stored, key)
+
+        cache.put(b"b", [1])
+        cache.put(b"c", [2])
+
+        self.assertIsNone(cache.get(b"a"))
+        self.assertEqual(stored, bytes(6))
+        self.assertEqual(key, b"secret")
+
+    def test_forget_a_group(self) -> None:
+        cache: KeyCache = KeyCache()
+        user, other = cache.group([1, 2, 3]), cache.group([4, 5, 6])
+
+        cache.put(b"key", [1], user)
+        cache.put(b"salt", b"salt", user)
+        cache.put(b"other", [2], other)
+
+        self.assertEqual(cache.forget(user), 2)
+        self.assertIsNone(cache.get(b"key"))
+        self.assertEqual(cache.get(b"other"), [2])
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+class DeriveTest(CryptoTest):
+    def setUp(self) -> None:
+        super().setUp()
+
+        # The DLL derives its keys itself, in every call
+        if self.crypto.backend == "dll":
+            self.skipTest("the backend doesn't derive its keys")
+
+        # The cache is shared by the whole process
+        self.crypto.wipe_keys()
+        self.key = self.crypto.get_secure_password("test")
+
+    def test_derived_once(self) -> None:
+        backend = type(self.crypto.SCrypto)
+
+        with mock.patch.object(backend, "_derive", autospec = True, side_effect = backend._derive) as derive:
+            encrypted: bytes = self.crypto.secure_encrypt(b"data", self.key)
+
+            for i in range(3):
+                self.assertEqual(self.crypto.secure_decrypt(encrypted, self.key), b"data")
+
+            self.assertEqual(derive.call_count, 1)
+
+    def test_logout_forgets_the_derived_keys(self) -> None:
+        backend = type(self.crypto.SCrypto)
+        encrypted: bytes = self.crypto.secure_encrypt(b"data", self.key)
+        other: bytes = self.crypto.secure_encrypt(b"other", self.crypto.get_secure_password("other"))
+
+        self.crypto.forget_key("test")
+
+        with mock.patch.object(backend, "_derive", autospec = True, side_effect = backend._derive) as derive:
+            self.assertEqual(self.crypto.secure_decrypt(encrypted, self.crypto.get_secure_password("test")), b"data")
+            self.assertEqual(derive.call_count, 1)
+
+            # Another user's keys are still there
+            self.assertEqual(self.crypto.secure_decrypt(other, self.crypto.get_secure_password("other")), b"other")
+            self.assertEqual(derive.call_count, 1)
+
+    def salt(self, encrypted: bytes) -> bytes:
+        return encrypted[:self.crypto.Params['SaltSize']]
+
+    def test_a_salt_per_file(self) -> None:
+        first: bytes = self.crypto.secure_encrypt(b"data", self.key, "a.slze")
+        again: bytes = self.crypto.secure_encrypt(b"data", self.key, "a.slze")
+        other: bytes = self.crypto.secure_encrypt(b"data", self.key, "b.slze")
+
+        self.assertEqual(self.salt(first), self.salt(again))
+        self.assertNotEqual(self.salt(first), self.salt(other))
+        # Without a file, every call draws its own
+        self.assertNotEqual(self.salt(self.crypto.secure_encrypt(b"data", self.key)), self.salt(self.crypto.secure_encrypt(b"data", self.key)))
+
+    def test_file_read_keeps_its_salt(self) -> None:
+        backend = type(self.crypto.SCrypto)
+        encrypted: bytes = self.crypto.secure_encrypt(b"data", self.key, "a.slze")
+
+        # As after a restart: the file is read, then written again without deriving another key
+        self.crypto.wipe_keys()
+
+        with mock.patch.object(backend, "_derive", autospec = True, side_effect = backend._derive) as derive:
+            self.assertEqual(self.crypto.secure_decrypt(encrypted, self.key, "a.slze"), b"data")
+            self.assertEqual(self.salt(self.crypto.secure_encrypt(b"new", self.key, "a.slze")), self.salt(encrypted))
+            self.assertEqual(derive.call_count, 1)
+
+class CrossBackendTest(unittest.TestCase):
+    """
+    Known answers of the python backend: salt 00..0f, iv 10..1f, password
+    1..64, Params of Crypto. The DLL is checked against them where it loads,
+    files of one backend are not read by the other (see PythonBackend).
+    """
+
+    Params: dict[str, int] = {'SaltSize': 16, 'KeySize': 32, 'IvSize': 16, 'Iterations': 10000}
+    Password: list[int] = list(range(1, 65))
+
+    Vectors: list[tuple[bytes, str]] = [
+        (b"Slazhe", "000102030405060708090a0b0c0d0e0f101112131415161718191a1b1c1d1e1f6585caa87a6603dd10169ec14ffabb1b"),
+        (b"known answer vector, two blocks", "000102030405060708090a0b0c0d0e0f101112131415161718191a1b1c1d1e1f8bdc56ce6865124b52240aabb07b6373750b87b2adb6f0d26f412d278e510eed"),
+    ]
+
+    def backend(self, backend: type[CryptoBackend]) -> CryptoBackend:
+        try:
+            with mock.patch.dict(os.environ, {"SLAZHE_CRYPTO_SECRET": "test"}):
+                return backend(dict(self.Params))
+        except OSError as e:
+            self.skipTest(f"no {backend.name} backend here: {e}")
+
+    def test_python_vectors(self) -> None:
+        backend: CryptoBackend = self.backend(PythonBackend)
+
+        for plaintext, vector in self.Vectors:
+            with mock.patch("os.urandom", side_effect = [bytes(range(16)), bytes(range(16, 32))]):
+                self.assertEqual(backend.encrypt(plaintext, self.Password).hex(), vector)
+
+            self.assertEqual(backend.decrypt(bytes.fromhex(vector), self.Password), plaintext)
+
+    def test_dll_vectors(self) -> None:
+        backend: CryptoBackend = self.backend(DLLBackend)
+
+        for plaintext, vector in self.Vectors:
+            self.assertEqual(backend.decrypt(bytes.fromhex(vector), self.Password), plaintext)
+
+class StreamTest(CryptoTest):
+    def encrypt(self, data: bytes, chunk: int = 1000, workers: int = 1) -> list[bytes]:
+        return list(self.crypto.encrypt_stream([data[i:i + 777] for i in range(0, len(data), 777)] or [b""], self.key, chunk, workers))
+
+    def decrypt(self, frames: list[bytes]) -> bytes:
+        return b"".join(self.crypto.decrypt_stream(frames, self.key))
+
+    def test_round_trip(self) -> None:
+        for size in (0, 1, 999, 1000, 1001, 5000):
+            data: bytes = os.urandom(size)
+
+            self.assertEqual(self.decrypt(self.encrypt(data)), data)
+            self.assertEqual(self.decrypt(self.encrypt(data, workers = 3)), data)
+            # Cut anywhere, the chunks given to decrypt don't have to be frames
+            joined: bytes = b"".join(self.encrypt(data))
+            self.assertEqual(self.decrypt([joined[i:i + 13] for i in range(0, len(joined), 13)]), data)
+
+    def test_tampered_streams(self) -> None:
+        frames: list[bytes] = self.encrypt(os.urandom(3500))
+        head, body = frames[0], frames[1:]
+
+        for broken in ([head] + body[:-1], [head] + [body[1], body[0]] + body[2:], frames + [b"more"], [head[:10]], [head] + self.encrypt(b"other")[1:]):
+            with self.assertRaises((ValueError, RuntimeError)):
+                self.decrypt(broken)
+
+    def test_other_mode(self) -> None:
+        head: bytearray = bytearray(self.encrypt(b"data")[0])
+        head[5] = 99
+
+        with self.assertRaises(ValueError):
+            self.decrypt([bytes(head)])
+
+class FakeDLL(DLLBackend):
+    """DLLBackend without the DLL: a cipher that tells which iterations it was called with."""
+
+    def __init__(self, Params: dict[str, int]) -> None:
+        CryptoBackend.__init__(self, Params)
+        self.calls: list[int] = []
+
+    def encrypt(self, PlainText, password, Iterations = None) -> bytes:
+        self.calls.append(Iterations or self.Params['Iterations'])
+        return bytes(x & 0xFF for x in password) + bytes(PlainText)
+
+    def decrypt(self, encrypted_data, password, Iterations = None) -> bytes:
+        self.calls.append(Iterations or self.Params['Iterations'])
+        Key: bytes = bytes(x & 0xFF for x in password)
+
+        if bytes(encrypted_data[:len(Key)]) != Key:
+            raise RuntimeError("Decryption failed.")
+
+        return bytes(encrypted_data[len(Key):])
+
+class DLLStreamTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.backend: FakeDLL = FakeDLL({'SaltSize': 16, 'KeySize': 32, 'Iterations': 100000})
+        self.password: list[int] = list(range(64))
+
+    def test_one_derivation_per_stream(self) -> None:
+        data: bytes = os.urandom(10000)
+        frames: list[bytes] = list(CryptoStream.encrypt(self.backend, [data], self.password, 1000))
+
+        # The key is wrapped once with the password, the 10 frames pay one iteration each
+        self.assertEqual(self.backend.calls, [100000] + [1] * 10)
+
+        self.backend.calls.clear()
+        self.assertEqual(b"".join(CryptoStream.decrypt(self.backend, frames, self.password)), data)
+        self.assertEqual(self.backend.calls, [100000] + [1] * 10)
+
+        with self.assertRaises(RuntimeError):
+            list(CryptoStream.decrypt(self.backend, frames, list(range(1, 65))))
+
+    def test_password_streams_still_read(self) -> None:
+        # Mode 0: what the DLL wrote before, every frame sealed under the password
+        with mock.patch.object(FakeDLL, "Stream", 0), mock.patch.object(FakeDLL, "new_stream_key", CryptoBackend.new_stream_key):
+            frames: list[bytes] = list(CryptoStream.encrypt(self.backend, [b"old data"], self.password))
+
+        self.assertEqual(b"".join(CryptoStream.decrypt(self.backend, frames, self.password)), b"old data")
+
+class DLLBufferTest(unittest.TestCase):
+    def test_decrypt_has_room_for_a_block(self) -> None:
+        backend: DLLBackend = DLLBackend.__new__(DLLBackend)
+        CryptoBackend.__init__(backend, {'SaltSize': 16, 'KeySize': 32, 'IvSize': 16, 'Iterations': 1})
+
+        sizes: list[int] = []
+
+        def decrypt(*args) -> int:
+            sizes.append(len(args[-1]))
+            args[-1][:4] = b"data"
+            return 4
+
+        backend.SCrypto = mock.Mock()
+        backend.SCrypto.SecureDecrypt.side_effect = decrypt
+
+        self.assertEqual(backend.decrypt(bytes(16 + 16 + 32), [1, 2, 3]), b"data")
+        self.assertEqual(sizes, [32 + 16])
+
+class ManyTest(CryptoTest):
+    def test_results_keep_the_order(self) -> None:
+        items: list[bytes] = [bytes([i]) * (i * 100) for i in range(20)]
+        encrypted: list[bytes] = self.crypto.encrypt_many(items, self.key, workers = 4)
+
+        self.assertEqual(self.crypto.decrypt_many(encrypted, self.key, workers = 4), items)
+
+    def test_one_key_per_item(self) -> None:
+        keys: list[list[int]] = [self.crypto.get_secure_password(f"test-{i}") for i in range(4)]
+        encrypted: list[bytes] = self.crypto.encrypt_many([b"a", b"b", b"c", b"d"], keys, workers = 2)
+
+        self.assertEqual(self.crypto.decrypt_many(encrypted, keys, workers = 2), [b"a", b"b", b"c", b"d"])
+
+        with self.assertRaises(ValueError):
+            self.crypto.decrypt_many(encrypted, keys[:3])
+
+    def test_errors(self) -> None:
+        encrypted: list[bytes] = self.crypto.encrypt_many([b"a", b"b"], self.key)
+        items: list[bytes] = [encrypted[0], b"not encrypted", encrypted[1]]
+
+        with self.assertRaises(Exception):
+            self.crypto.decrypt_many(items, self.key, workers = 2)
+
+        results: list = self.crypto.decrypt_many(items, self.key, workers = 2, return_exceptions = True)
+
+        self.assertEqual(results[0], b"a")
+        self.assertIsInstance(results[1], Exception)
+        self.assertEqual(results[2], b"b")
+
+if __name__ == "__main__":
+    unittest.main()
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.05
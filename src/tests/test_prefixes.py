@@ -0,0 +1,175 @@
+"""
+Tests of the prefixes of the bots, run from src/:
+
+    python -m unittest discover tests
+"""
+import os, sys, json, asyncio, tempfile, unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Slazhe import LoggerConfig, LogLevels
+from Slazhe.SlazheModules import importer as SlazheImporter
+from Slazhe.Modules import importer
+from Slazhe.Modules.Libs_storage.CustomTypes import to_extended
+from Slazhe.Modules.Libs_storage.codecs import native
+from Slazhe.Modules.Libs_Bots import Prefixes as PrefixesModule
+from Slazhe.Modules.Libs_Bots.Prefixes import Prefixes
+from Slazhe.Modules.Libs_Bots.Libs.matcher import PrefixMatcher
+from Slazhe.Modules.Libs_Bots.Libs.store import PrefixStore
+
+def message(content: str, guild: int = 0, user: int = 1) -> SimpleNamespace:
+    return SimpleNamespace(guild = SimpleNamespace(id = guild) if guild else None, author = SimpleNamespace(id = user), content = content)
+
+class PrefixMatcherTest(unittest.TestCase):
+    def test_longest_prefix(self) -> None:
+        matcher: PrefixMatcher = PrefixMatcher(["!", "!!", "?"], ["!!!", "slazhe "])
+
+        self.assertEqual(matcher.match("!!!help"), "!!!")
+        self.assertEqual(matcher.match("!!help"), "!!")
+        self.assertEqual(matcher.match("!help"), "!")
+        self.assertEqual(matcher.match("slazhe help"), "slazhe ")
+        self.assertIsNone(matcher.match("slazhehelp"))
+        self.assertIsNone(matcher.match("help"))
+        self.assertIsNone(matcher.match(""))
+
+    def test_empty_prefixes_are_ignored(self) -> None:
+        self.assertIsNone(PrefixMatcher(["", "!"], [""]).match("help"))
+
+class PrefixesTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cwd: str = os.getcwd()
+        self.folder = tempfile.TemporaryDirectory()
+
+        # The prefixes live under var/ of the working folder
+        os.chdir(self.folder.name)
+        LoggerConfig.init(Folder = f"{self.folder.name}/Logs/", Level = LogLevels.WARNING)
+        SlazheImporter.SlazheCrypto().config()
+
+        self.client = SimpleNamespace(uuid = "test")
+        self.path: str = "var/Slazhe-Bots/test/Prefixes/"
+        self.opened: list[Prefixes] = []
+
+    def tearDown(self) -> None:
+        for prefixes in self.opened:
+            prefixes.close()
+
+        importer.Storage.release(os.path.abspath(self.path))
+        os.chdir(self.cwd)
+        self.folder.cleanup()
+
+    def prefixes(self) -> Prefixes:
+        self.opened.append(Prefixes(self.client))
+        return self.opened[-1]
+
+    def run_message(self, prefixes: Prefixes, msg: SimpleNamespace) -> list[str]:
+        return asyncio.run(prefixes.run(None, msg))
+
+class PrefixCacheTest(PrefixesTest):
+    def test_scopes(self) -> None:
+        prefixes: Prefixes = self.prefixes()
+
+        self.assertTrue(prefixes.client_add_prefix("!"))
+        self.assertTrue(prefixes.guild_add_prefix("10", "!!"))
+        self.assertTrue(prefixes.user_add_prefix("5", "$$$"))
+
+        self.assertEqual(self.run_message(prefixes, message("!!help", guild = 10)), ["!!"])
+        self.assertEqual(self.run_message(prefixes, message("!!help", guild = 11)), ["!"])
+        self.assertEqual(self.run_message(prefixes, message("$$$help", guild = 10, user = 5)), ["$$$"])
+        self.assertEqual(self.run_message(prefixes, message("$$$help", guild = 10, user = 6)), [])
+
+    def test_writes_go_through_the_cache(self) -> None:
+        prefixes: Prefixes = self.prefixes()
+        prefixes.guild_add_prefix("10", "?")
+
+        self.assertEqual(self.run_message(prefixes, message("?help", guild = 10)), ["?"])
+
+        prefixes.guild_disable_prefix("10", "?")
+        self.assertEqual(self.run_message(prefixes, message("?help", guild = 10)), [])
+
+        prefixes.guild_enable_prefix("10", "?")
+        self.assertEqual(self.run_message(prefixes, message("?help", guild = 10)), ["?"])
+
+        # A client prefix reaches the guilds already compiled
+        prefixes.client_add_prefix("??")
+        self.assertEqual(self.run_message(prefixes, message("??help", guild = 10)), ["??"])
+
+        prefixes.guild_del_prefix("10", "?")
+        self.assertEqual(self.run_message(prefixes, message("?help", guild = 10)), [])
+        self.assertEqual(prefixes.guild_get_prefix("10"), [])
+
+    def test_cached_scopes_skip_the_store(self) -> None:
+        prefixes: Prefixes = self.prefixes()
+        prefixes.guild_add_prefix("10", "?")
+        self.run_message(prefixes, message("?help", guild = 10))
+
+        with mock.patch.object(PrefixStore, "load", autospec = True, side_effect = PrefixStore.load) as load:
+            for i in range(10):
+                self.assertEqual(self.run_message(prefixes, message("?help", guild = 10)), ["?"])
+                # Guilds without prefixes aren't looked up either
+                self.assertEqual(self.run_message(prefixes, message("?help", guild = 100 + i)), [])
+
+            self.assertEqual(load.call_count, 0)
+
+class PrefixStoreTest(PrefixesTest):
+    def legacy(self, file: str, prefixes: dict) -> None:
+        # The layout before the store: one json file per scope, written by the Prefixes storage
+        storage = importer.Storage(self.path, PrefixesModule.__file__, lambda data: json.dumps(native(data)), None, backend = "file")
+        storage.save(to_extended(prefixes), file)
+        importer.Storage.release(storage.path)
+
+    def test_migration(self) -> None:
+        entry = lambda prefix: {"prefix": prefix, "active": True, "created_by": "test", "create_at": "test"}
+
+        self.legacy("client-prefixes.slze", {"a": entry("!")})
+        self.legacy("Guilds/10.slze", {"b": entry("?"), "c": {**entry("??"), "active": False}})
+        self.legacy("Users/5.slze", {"d": entry("$")})
+
+        prefixes: Prefixes = self.prefixes()
+
+        self.assertEqual(prefixes.client_get_prefix(), ["!"])
+        self.assertEqual(prefixes.guild_get_prefix("10"), ["?"])
+        self.assertEqual(prefixes.user_get_prefix("5"), ["$"])
+
+        # The legacy files are put aside, the next start doesn't migrate again
+        self.assertTrue(os.path.exists(f"{self.path}client-prefixes.slze.migrated"))
+        self.assertTrue(os.path.exists(f"{self.path}Guilds.migrated"))
+        self.assertFalse(os.path.exists(f"{self.path}Guilds"))
+
+        prefixes.guild_add_prefix("10", "!!")
+        prefixes.close()
+        self.opened.remove(prefixes)
+
+        self.assertEqual(sorted(self.prefixes().guild_get_prefix("10")), ["!!", "?"])
+
+    def test_save_many_is_one_transaction(self) -> None:
+        store: PrefixStore = PrefixStore(self.path, "other.db")
+
+        try:
+            self.assertTrue(store.save_many([(("guild", "1"), {"a": {"prefix": "!", "active": True}})]))
+            self.assertFalse(store.save_many([(("guild", "1"), {}), (("guild", "2"), {"b": {"prefix": None}})]))
+
+            # The failed batch left the first key as it was
+            self.assertEqual(store.load(("guild", "1"))["a"]["prefix"], "!")
+            self.assertEqual(store.keys(), {("guild", "1")})
+        finally:
+            store.close()
+
+class PrefixBenchmarkTest(PrefixesTest):
+    def test_scenario_runs(self) -> None:
+        from benchmarks import prefixes as benchmark
+
+        results: dict = asyncio.run(benchmark.scenario(guilds = 5, users = 5, prefixes = 2, count = 50, seed = 0))
+
+        self.assertEqual(len(results), 3)
+
+        for result in results.values():
+            self.assertGreater(result["p50_us"], 0)
+            self.assertGreaterEqual(result["p99_us"], result["p50_us"])
+
+if __name__ == "__main__":
+    unittest.main()
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.04
@@ -0,0 +1,993 @@
+"""
+Regression tests of the storage, run from src/:
+
+    python -m unittest discover tests
+"""
+import io, os, sys, copy, json, time, zlib, shutil, pickle, struct, asyncio, sqlite3, tempfile, threading, unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Slazhe import LoggerConfig, LogLevels
+from Slazhe.SlazheModules import importer as SlazheImporter
+from Slazhe.Modules import importer
+from Slazhe.Modules.Libs_storage.CustomTypes import to_extended, is_dirty
+from Slazhe.Modules.Libs_storage.backends import Backends, FileBackend, PackedBackend, SQLiteBackend
+from Slazhe.Modules.Libs_storage.migrate import migrate_storage
+from Slazhe.Modules.Libs_storage.packed import Pack
+from Slazhe.Modules.Libs_storage.cache import MissingFiles, ObjectCache
+from Slazhe.Modules.Libs_storage.header import Header
+from Slazhe.Modules.Libs_storage.codecs import Codecs
+from Slazhe.Modules.Libs_storage.compression import Compressions
+from Slazhe.Modules.Libs_storage.metrics import StorageMetrics
+from Slazhe.Modules.Libs_storage.writebehind import WriteBehind
+
+class StorageTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.TemporaryDirectory()
+        LoggerConfig.init(Folder = f"{self.folder.name}/Logs/", Level = LogLevels.WARNING)
+        SlazheImporter.SlazheCrypto().config()
+
+        self.storage = importer.Storage(f"{self.folder.name}/var/", "test", None, None, codec = "json", encrypt = True)
+
+    def tearDown(self) -> None:
+        importer.Storage.release(self.storage.path)
+        self.folder.cleanup()
+
+class SaveTest(StorageTest):
+    def test_unchanged_object_is_skipped(self) -> None:
+        self.storage.save(to_extended({"name": "a"}), "user.slze", "old")
+
+        data = self.storage.open("user.slze", {}, "old")
+        skipped: int = importer.Storage.SkippedWrites
+
+        self.assertTrue(self.storage.save(data, "user.slze", "old"))
+        self.assertEqual(importer.Storage.SkippedWrites, skipped + 1)
+
+    def test_new_password_is_written(self) -> None:
+        self.storage.save(to_extended({"name": "a"}), "user.slze", "old")
+
+        # Unchanged, but the password is another one: the file has to be written again under it
+        data = self.storage.open("user.slze", {}, "old")
+        skipped: int = importer.Storage.SkippedWrites
+
+        self.assertTrue(self.storage.save(data, "user.slze", "new"))
+        self.assertEqual(importer.Storage.SkippedWrites, skipped)
+        self.assertEqual(self.storage.open("user.slze", {}, "new"), {"name": "a"})
+
+        # Written under the new one, it is clean for it now
+        self.assertTrue(self.storage.save(data, "user.slze", "new"))
+        self.assertEqual(importer.Storage.SkippedWrites, skipped + 1)
+
+    def test_untracked_changes_are_written(self) -> None:
+        self.storage.save(to_extended({"user": {"name": "a"}, "count": 0}), "user.slze")
+
+        # Copies go through the tracking, the raw payload doesn't: the content digest catches it
+        changes: list = [
+            lambda data: dict(data)["user"].update(name = "b"),
+            lambda data: {**data}["user"].update(name = "c"),
+            lambda data: copy.copy(data)["user"].update(name = "d"),
+            lambda data: data.value.update(count = 1),
+            lambda data: data.value["user"].update(name = "e")
+        ]
+
+        for change in changes:
+            data = self.storage.open("user.slze")
+            change(data)
+            skipped: int = importer.Storage.SkippedWrites
+
+            self.assertTrue(self.storage.save(data))
+            self.assertEqual(importer.Storage.SkippedWrites, skipped)
+            self.assertEqual(self.storage.open("user.slze"), data)
+
+    def test_reference_kept_after_save(self) -> None:
+        data = self.storage.open("user.slze", {})
+        data["user"] = {"name": "a"}
+        user = data["user"]
+
+        self.assertTrue(self.storage.save(data))
+
+        # Still the object the file holds, but it is clean since the save
+        user["name"] = "b"
+        self.assertTrue(self.storage.save(data))
+        self.assertEqual(self.storage.open("user.slze")["user"]["name"], "b")
+
+class HeaderTest(StorageTest):
+    def setUp(self) -> None:
+        super().setUp()
+        self.file: str = f"{self.storage.path}user.slze"
+
+    def write(self, data: bytes) -> None:
+        os.makedirs(self.storage.path, exist_ok = True)
+
+        with open(self.file, 'wb') as IOFile:
+            IOFile.write(data)
+
+    def header(self) -> Header:
+        with open(self.file, 'rb') as IOFile:
+            return Header.unpack(IOFile.read())
+
+    def test_written_header(self) -> None:
+        self.storage.compression = "zlib"
+        self.storage.save(to_extended({"name": "a" * 100}), "user.slze")
+
+        header: Header = self.header()
+        self.assertEqual(header.version, 2)
+        self.assertEqual(header.serializer, Codecs.get("json").id)
+        self.assertEqual(header.compression, Header.ZLIB)
+        self.assertEqual(bool(header.flags & Header.ENCRYPTED), self.storage.slazhe_crypto.SCrypto is not None)
+
+    def test_v1_file(self) -> None:
+        body: bytes = pickle.dumps({"name": "a"})
+        self.write(struct.pack("<4sBBBBI", Header.MAGIC, 1, Header.PICKLE, Header.NONE, 0, zlib.crc32(body)) + body)
+
+        self.assertEqual(self.storage.open("user.slze", {}), {"name": "a"})
+
+    def test_legacy_file(self) -> None:
+        # Before the header: pickled, zlib, then encrypted with the storage key
+        data: bytes = zlib.compress(pickle.dumps({"name": "a"}))
+        self.write(self.storage.slazhe_crypto.secure_encrypt(data, self.storage.slazhe_crypto_password))
+
+        data = self.storage.open("user.slze", {})
+        self.assertEqual(data, {"name": "a"})
+        self.assertIsNone(self.header())
+
+        # Written again with a header
+        data["name"] = "b"
+        self.assertTrue(self.storage.save(data, "user.slze"))
+        self.assertEqual(self.header().version, 2)
+        self.assertEqual(self.storage.open("user.slze", {}), {"name": "b"})
+
+    def test_corrupted_body(self) -> None:
+        self.storage.save(to_extended({"name": "a"}), "user.slze")
+
+        with open(self.file, 'r+b') as IOFile:
+            IOFile.seek(-1, os.SEEK_END)
+            last: int = IOFile.read(1)[0]
+            IOFile.seek(-1, os.SEEK_END)
+            IOFile.write(bytes([last ^ 0xFF]))
+
+        self.assertEqual(self.storage.open("user.slze", {"default": True}), {"default": True})
+
+    def test_unknown_version(self) -> None:
+        self.assertIsNone(Header.unpack(struct.pack("<4sBBBBII", Header.MAGIC, 3, 0, 0, 0, 0, 0)))
+        self.assertIsNone(Header.unpack(b"SLZ"))
+
+class CodecTest(StorageTest):
+    def document(self) -> dict:
+        return {"users": {str(i): {"id": i, "tags": [f"t{j}" for j in range(i % 5)], "ok": i % 2 == 0, "score": i / 3} for i in range(2000)}, "list": list(range(1000)), "empty": {}}
+
+    def test_round_trip(self) -> None:
+        data = to_extended(self.document())
+
+        for name in Codecs.names():
+            with self.subTest(codec = name):
+                codec = Codecs.get(name)
+                self.assertIs(Codecs.get(codec.id), codec)
+
+                self.assertEqual(codec.decode(codec.encode(data)), self.document())
+
+                file: io.BytesIO = io.BytesIO()
+                codec.dump(data, file)
+                file.seek(0)
+                self.assertEqual(codec.load(file), self.document())
+
+    def test_json_dump_is_encode(self) -> None:
+        codec = Codecs.get("json")
+        data = to_extended(self.document())
+        # Tracked objects put in a plain container are written as what they wrap
+        data["users"]["0"]["nested"] = to_extended({"a": [1, 2]})
+
+        for orjson in (None, sys.modules.get("orjson")):
+            for items, buffer in ((256, 1 << 16), (3, 64)):
+                with self.subTest(orjson = orjson is not None, items = items, buffer = buffer), \
+                     mock.patch("Slazhe.Modules.Libs_storage.codecs.orjson", orjson), \
+                     mock.patch.object(type(codec), "Items", items), mock.patch.object(type(codec), "Buffer", buffer):
+                    file: io.BytesIO = io.BytesIO()
+                    codec.dump(data, file)
+
+                    self.assertEqual(file.getvalue(), codec.encode(data))
+
+    def test_unknown_codec(self) -> None:
+        with self.assertRaises(ValueError):
+            Codecs.get("unknown")
+
+    def test_codec_switch(self) -> None:
+        # The header names the codec of each file, the storage reads both
+        self.storage.codec = Codecs.get("pickle")
+        self.storage.save(to_extended({"name": "a"}), "old.slze")
+
+        self.storage.codec = Codecs.get("json")
+        self.storage.save(to_extended({"name": "b"}), "new.slze")
+
+        self.assertEqual(self.storage.open("old.slze"), {"name": "a"})
+        self.assertEqual(self.storage.open("new.slze"), {"name": "b"})
+
+class CompressionTest(StorageTest):
+    text: bytes = b"".join(b'{"id": %d, "name": "user %d", "language": "fr"}, ' % (i, i) for i in range(5000))
+
+    def test_round_trip(self) -> None:
+        for name in Compressions.names():
+            with self.subTest(compression = name):
+                compressor = Compressions.get(name)
+                compressed: bytes = Compressions.compress(compressor, self.text)
+
+                self.assertEqual(Compressions.decompress(compressor.id, compressed), self.text)
+
+                # A chunk at a time both ways, in blocks of at most size bytes
+                chunks: list[bytes] = [compressed[i:i + 1000] for i in range(0, len(compressed), 1000)]
+                blocks: list[bytes] = list(Compressions.stream(name, chunks, size = 4096))
+
+                self.assertEqual(b"".join(blocks), self.text)
+                self.assertTrue(all(len(block) <= 4096 for block in blocks))
+
+                streamed: bytes = b"".join(Compressions.compress_stream(compressor, [self.text[i:i + 1000] for i in range(0, len(self.text), 1000)]))
+                self.assertEqual(compressor.decompress(streamed), self.text)
+
+    def test_truncated_stream(self) -> None:
+        for name in ("zlib", "lzma", "bz2"):
+            with self.subTest(compression = name):
+                compressed: bytes = Compressions.get(name).compress(self.text)
+
+                with self.assertRaises(ValueError):
+                    b"".join(Compressions.stream(name, [compressed[:len(compressed) // 2]]))
+
+    def test_levels(self) -> None:
+        zlib_ = Compressions.get("zlib")
+
+        # Level 0 only stores the data
+        self.assertGreater(len(zlib_.compress(self.text, 0)), len(self.text))
+        self.assertLess(len(zlib_.compress(self.text, 1)), len(self.text))
+        self.assertEqual(zlib_.decompress(zlib_.compress(self.text, 0)), self.text)
+
+    def test_zdict(self) -> None:
+        zdict: bytes = self.text[:4096]
+        data: bytes = b'{"id": 123456, "name": "user 123456", "language": "fr"}, '
+
+        zlib_ = Compressions.get("zlib")
+        self.assertLess(len(zlib_.compress(data, zdict = zdict)), len(zlib_.compress(data)))
+        self.assertEqual(zlib_.decompress(zlib_.compress(data, zdict = zdict), zdict), data)
+
+        # The others ignore it
+        for name in ("none", "lzma", "bz2"):
+            compressor = Compressions.get(name)
+            self.assertEqual(compressor.decompress(compressor.compress(data, zdict = zdict), zdict), data)
+
+    def test_unknown_compression(self) -> None:
+        with self.assertRaises(ValueError):
+            Compressions.get("zstd")
+
+    def test_adaptive_selection(self) -> None:
+        # The cheapest candidate reaching the target wins
+        compressor, result = Compressions.adaptive(self.text, 0.5)
+        self.assertEqual(compressor.name, "zlib")
+        self.assertEqual(compressor.decompress(result), self.text)
+
+        # High entropy payloads aren't tried
+        noise: bytes = os.urandom(4096)
+        self.assertGreater(Compressions.entropy(noise), Compressions.Entropy)
+        self.assertEqual(Compressions.adaptive(noise)[0].name, "none")
+
+        # Nothing reaches the target, the best ratio is kept
+        compressor, result = Compressions.adaptive(self.text, 0.0001)
+        self.assertNotEqual(compressor.name, "none")
+        self.assertLess(len(result), len(self.text))
+
+    def test_choice_is_remembered(self) -> None:
+        key: str = f"{self.folder.name}/user.slze"
+        Compressions.adaptive(self.text, 0.5, key = key)
+
+        with mock.patch.object(Compressions, "_Compressions__trial", side_effect = AssertionError("tried again")):
+            self.assertEqual(Compressions.adaptive(self.text, 0.5, key = key)[0].name, "zlib")
+            self.assertEqual(Compressions.choose(self.text, 0.5, key = key)[0].name, "zlib")
+
+        # Revisited once it stops meeting the target
+        self.assertEqual(Compressions.adaptive(os.urandom(4096), 0.5, key = key)[0].name, "none")
+        self.assertEqual(Compressions.choose(os.urandom(4096), 0.5, key = key)[0].name, "none")
+
+    def test_stats(self) -> None:
+        calls: int = Compressions.stats().get("bz2", {}).get("compress", {}).get("calls", 0)
+        Compressions.compress(Compressions.get("bz2"), self.text)
+
+        stats: dict = Compressions.stats()["bz2"]["compress"]
+        self.assertEqual(stats["calls"], calls + 1)
+        self.assertLess(stats["ratio"], 1)
+
+    def test_storage_compression(self) -> None:
+        data = to_extended({"users": [{"id": i, "name": f"user {i}"} for i in range(200)]})
+
+        for compression, expected in (("zlib", Header.ZLIB), ("lzma", Header.LZMA), ("bz2", Header.BZ2), ("adaptive", Header.ZLIB), ("none", Header.NONE)):
+            with self.subTest(compression = compression):
+                self.storage.compression = compression
+                self.storage.save(data, f"{compression}.slze")
+
+                with open(f"{self.storage.path}{compression}.slze", 'rb') as IOFile:
+                    self.assertEqual(Header.unpack(IOFile.read()).compression, expected)
+
+                ObjectCache.clear()
+                self.assertEqual(self.storage.open(f"{compression}.slze"), data)
+
+    def test_compress_min(self) -> None:
+        self.storage.compression = "zlib"
+        self.storage.compress_min = 1 << 20
+        self.storage.save(to_extended({"name": "a" * 100}), "user.slze")
+
+        with open(f"{self.storage.path}user.slze", 'rb') as IOFile:
+            self.assertEqual(Header.unpack(IOFile.read()).compression, Header.NONE)
+
+        ObjectCache.clear()
+        self.assertEqual(self.storage.open("user.slze"), {"name": "a" * 100})
+
+class MetricsTest(StorageTest):
+    def setUp(self) -> None:
+        super().setUp()
+        StorageMetrics.reset()
+
+    def tearDown(self) -> None:
+        StorageMetrics.reset()
+        super().tearDown()
+
+    def files(self) -> dict:
+        return {os.path.basename(File): values for File, values in StorageMetrics.hot(100)}
+
+    def test_reads_and_writes(self) -> None:
+        self.storage.compression = "zlib"
+        self.storage.save(to_extended({"name": "a" * 100}), "user.slze")
+        written: int = os.path.getsize(f"{self.storage.path}user.slze")
+
+        ObjectCache.clear()
+        self.storage.open("user.slze", {})
+        self.storage.open("user.slze", {})
+
+        user: dict = self.files()["user.slze"]
+        self.assertEqual((user["reads"], user["cache_hits"], user["writes"]), (2, 1, 1))
+        self.assertEqual(user["bytes_read"], written)
+        self.assertGreater(user["bytes_written"], 0)
+        self.assertGreater(user["seconds"], 0)
+
+        # Streamed saves are counted too
+        self.storage.save(to_extended({"name": "b" * (importer.Storage.StreamEncryptMin + 1)}), "big.slze")
+        big: dict = self.files()["big.slze"]
+        self.assertEqual(big["writes"], 1)
+        self.assertGreater(big["bytes_written"], 0)
+
+    def test_hot_files_first(self) -> None:
+        for i in range(3):
+            self.storage.save(to_extended({"id": i}), f"users/{i}.slze")
+
+        for _ in range(5):
+            self.storage.open("users/1.slze", {})
+
+        self.assertEqual([os.path.basename(File) for File, values in StorageMetrics.hot(2)], ["1.slze", "0.slze"])
+
+    def test_stages(self) -> None:
+        self.storage.compression = "zlib"
+        self.storage.save(to_extended({"name": "a" * 100}), "user.slze")
+        ObjectCache.clear()
+        self.storage.open("user.slze", {})
+
+        stages: dict = dict(StorageMetrics.slowest(100))
+
+        for stage in ("save.compress", "open.disk", "open.decompress"):
+            self.assertIn(stage, stages)
+            self.assertGreaterEqual(stages[stage]["calls"], 1)
+            self.assertGreaterEqual(stages[stage]["slowest"], stages[stage]["average"])
+
+        StorageMetrics.stage("test", 10, 2.0)
+        StorageMetrics.stage("test", 20, 1.0)
+        self.assertEqual(StorageMetrics.slowest(1), [("test", {"calls": 2, "bytes": 30, "seconds": 3.0, "average": 1.5, "slowest": 2.0})])
+
+    def test_tracked_files_are_bounded(self) -> None:
+        with mock.patch.object(StorageMetrics, "Paths", 4):
+            for _ in range(3):
+                StorageMetrics.read("hot", 1, 0.0)
+
+            for i in range(10):
+                StorageMetrics.read(f"cold-{i}", 1, 0.0)
+
+            self.assertLessEqual(len(StorageMetrics.hot(100)), 4)
+            self.assertEqual(StorageMetrics.hot(1)[0][0], "hot")
+
+    def test_disabled(self) -> None:
+        with mock.patch.object(StorageMetrics, "Enabled", False):
+            self.storage.save(to_extended({"name": "a"}), "user.slze")
+            self.storage.open("user.slze", {})
+
+        self.assertEqual(StorageMetrics.hot(), [])
+        self.assertEqual(StorageMetrics.slowest(), [])
+
+    def test_dump(self) -> None:
+        self.storage.save(to_extended({"name": "a"}), "user.slze")
+
+        file: str = f"{self.folder.name}/metrics/storage.json"
+        snapshot: dict = StorageMetrics.dump(file)
+
+        with open(file, encoding = "utf-8") as IOFile:
+            self.assertEqual(json.load(IOFile), snapshot)
+
+        self.assertIn(os.path.abspath(f"{self.storage.path}user.slze"), snapshot["files"])
+        self.assertLessEqual(snapshot["since"], snapshot["at"])
+
+        StorageMetrics.reset()
+        self.assertEqual(StorageMetrics.dump()["files"], {})
+
+class ObjectCacheTest(StorageTest):
+    def test_shared_by_the_storages(self) -> None:
+        self.storage.save(to_extended({"name": "a"}), "user.slze")
+        ObjectCache.invalidate(os.path.abspath(f"{self.storage.path}user.slze"))
+
+        other = importer.Storage(self.storage.path, "test", None, None, codec = "json", encrypt = True)
+        self.storage.open("user.slze")
+
+        hits: int = ObjectCache.stats()["hits"]
+        self.assertEqual(other.open("user.slze"), {"name": "a"})
+        self.assertEqual(ObjectCache.stats()["hits"], hits + 1)
+
+    def test_changed_file_is_read_again(self) -> None:
+        self.storage.save(to_extended({"name": "a"}), "user.slze")
+        self.storage.open("user.slze")
+
+        # Written by another process: another mtime and size
+        other = importer.Storage(self.storage.path, "test", None, None, codec = "json", encrypt = True)
+
+        with mock.patch.object(ObjectCache, "invalidate"):
+            other.save(to_extended({"name": "bb"}), "user.slze")
+
+        self.assertEqual(self.storage.open("user.slze"), {"name": "bb"})
+
+    def test_changes_stay_out_of_the_cache(self) -> None:
+        self.storage.save(to_extended({"user": {"name": "a"}}), "user.slze")
+
+        data = self.storage.open("user.slze")
+        data["user"]["name"] = "b"
+
+        self.assertEqual(self.storage.open("user.slze"), {"user": {"name": "a"}})
+
+    def test_eviction(self) -> None:
+        with mock.patch.object(ObjectCache, "Entries", 2), mock.patch.object(ObjectCache, "Limit", 100):
+            ObjectCache.clear()
+
+            ObjectCache.put(("a", 1), "a", 10)
+            ObjectCache.put(("b", 1), "b", 10)
+            ObjectCache.get(("a", 1))
+            ObjectCache.put(("c", 1), "c", 10)
+
+            # The least recently used goes first
+            self.assertEqual(ObjectCache.get(("b", 1)), (False, None))
+            self.assertEqual(ObjectCache.get(("a", 1)), (True, "a"))
+
+            self.assertFalse(ObjectCache.put(("d", 1), "d", 101))
+            ObjectCache.put(("d", 1), "d", 95)
+            self.assertEqual(ObjectCache.stats()["entries"], 1)
+
+            ObjectCache.clear()
+
+class DictionaryTest(StorageTest):
+    def document(self, i: int) -> dict:
+        return {"id": i, "name": f"user {i}", "settings": {"language": "fr", "theme": "dark", "notifications": True}, "created_by": "slazhe"}
+
+    def test_trained_dictionary(self) -> None:
+        self.storage.compression = "zlib"
+
+        for i in range(20):
+            self.storage.save(to_extended(self.document(i)), f"users/{i}.slze")
+
+        id: int = self.storage.train_dictionary()
+        self.assertIsNotNone(id)
+
+        self.storage.save(to_extended(self.document(100)), "plain.slze")
+        self.storage.zdict = True
+        self.storage.save(to_extended(self.document(100)), "new.slze")
+
+        with open(f"{self.storage.path}new.slze", 'rb') as IOFile:
+            self.assertEqual(Header.unpack(IOFile.read()).zdict, id)
+
+        self.assertLess(os.path.getsize(f"{self.storage.path}new.slze"), os.path.getsize(f"{self.storage.path}plain.slze"))
+
+        # Read back from its file (encrypted like the storage) once the process forgot it
+        importer.Storage.release(self.storage.path)
+        ObjectCache.clear()
+
+        other = importer.Storage(self.storage.path, "test", None, None, codec = "json", encrypt = True)
+        self.assertEqual(other.open("new.slze"), self.document(100))
+
+    def test_missing_dictionary(self) -> None:
+        self.storage.compression = "zlib"
+
+        for i in range(20):
+            self.storage.save(to_extended(self.document(i)), f"users/{i}.slze")
+
+        self.storage.train_dictionary()
+        self.storage.zdict = True
+        self.storage.save(to_extended(self.document(100)), "new.slze")
+
+        importer.Storage.release(self.storage.path)
+        ObjectCache.clear()
+        shutil.rmtree(f"{self.storage.path}.zdict")
+
+        self.assertEqual(self.storage.open("new.slze", {"default": True}), {"default": True})
+
+    def test_not_enough_files(self) -> None:
+        self.storage.save(to_extended(self.document(0)), "users/0.slze")
+        self.assertIsNone(self.storage.train_dictionary())
+
+class AsyncTest(StorageTest):
+    def test_round_trip(self) -> None:
+        async def main() -> dict:
+            self.assertTrue(await self.storage.asave(to_extended({"name": "a"}), "user.slze"))
+            return await self.storage.aopen("user.slze", {})
+
+        self.assertEqual(asyncio.run(main()), {"name": "a"})
+
+    def test_loop_is_not_blocked(self) -> None:
+        threads: list[str] = []
+        save = self.storage.save
+
+        def slow_save(*args) -> bool:
+            threads.append(threading.current_thread().name)
+            time.sleep(0.2)
+            return save(*args)
+
+        async def main() -> int:
+            ticks: list[int] = [0]
+
+            async def ticker() -> None:
+                while True:
+                    ticks[0] += 1
+                    await asyncio.sleep(0.01)
+
+            task = asyncio.create_task(ticker())
+            self.assertTrue(await self.storage.asave(to_extended({"name": "a"}), "user.slze"))
+            task.cancel()
+
+            return ticks[0]
+
+        with mock.patch.object(self.storage, "save", side_effect = slow_save):
+            self.assertGreater(asyncio.run(main()), 5)
+
+        self.assertTrue(threads[0].startswith("Slazhe-Storage"))
+
+    def test_set_workers(self) -> None:
+        workers: int = importer.Storage.Workers
+
+        try:
+            importer.Storage.set_workers(2)
+            self.assertEqual(importer.Storage.executor()._max_workers, 2)
+            self.assertEqual(asyncio.run(self.storage.run_in_executor(sum, [1, 2])), 3)
+        finally:
+            importer.Storage.set_workers(workers)
+
+class WriteBehindTest(StorageTest):
+    def setUp(self) -> None:
+        super().setUp()
+        self.storage.write_behind = 60.0
+        self.file: str = os.path.abspath(f"{self.storage.path}user.slze")
+
+    def tearDown(self) -> None:
+        WriteBehind.flush()
+        super().tearDown()
+
+    def test_saves_are_coalesced(self) -> None:
+        coalesced: int = WriteBehind._coalesced
+        data = to_extended({"count": 0})
+
+        for i in range(1, 6):
+            data["count"] = i
+            self.assertTrue(self.storage.save(data, "user.slze"))
+
+        self.assertEqual(WriteBehind._coalesced, coalesced + 4)
+        self.assertTrue(WriteBehind.pending(self.file))
+        self.assertFalse(os.path.exists(self.file))
+
+        with mock.patch.object(FileBackend, "write", autospec = True, side_effect = FileBackend.write) as write:
+            self.assertTrue(self.storage.flush("user.slze"))
+            self.assertEqual(write.call_count, 1)
+
+        self.assertEqual(self.storage.open("user.slze"), {"count": 5})
+
+    def test_read_flushes(self) -> None:
+        self.storage.save(to_extended({"count": 1}), "user.slze")
+
+        self.assertEqual(self.storage.open("user.slze"), {"count": 1})
+        self.assertFalse(WriteBehind.pending(self.file))
+        self.assertTrue(os.path.exists(self.file))
+
+    def test_written_after_the_window(self) -> None:
+        self.storage.write_behind = 0.05
+        self.storage.save(to_extended({"count": 1}), "user.slze")
+
+        for i in range(100):
+            if not WriteBehind.pending(self.file):
+                break
+
+            time.sleep(0.02)
+
+        self.assertTrue(os.path.exists(self.file))
+
+class AtomicWriteTest(StorageTest):
+    def setUp(self) -> None:
+        super().setUp()
+
+        self.backend = FileBackend(f"{self.folder.name}/files/")
+        self.file: str = os.path.abspath(f"{self.folder.name}/files/user.slze")
+
+        # Nothing left for the background thread, it only syncs what these tests queue
+        WriteBehind.flush()
+
+    def test_replaced_whole(self) -> None:
+        self.backend.write(self.file, b"old", 'none')
+        self.backend.write(self.file, b"new", 'none')
+
+        self.assertEqual(self.backend.read(self.file)[0], b"new")
+        self.assertEqual(os.listdir(os.path.dirname(self.file)), ["user.slze"])
+
+    def test_failed_write_keeps_the_file(self) -> None:
+        self.backend.write(self.file, b"old", 'none')
+
+        with mock.patch("os.replace", side_effect = OSError("disk full")):
+            with self.assertRaises(OSError):
+                self.backend.write(self.file, b"new", 'none')
+
+        self.assertEqual(self.backend.read(self.file)[0], b"old")
+        self.assertEqual(os.listdir(os.path.dirname(self.file)), ["user.slze"])
+
+    def test_fsync_policies(self) -> None:
+        with mock.patch.object(WriteBehind, "_wake"), mock.patch("os.fsync") as fsync:
+            self.backend.write(self.file, b"data", 'none')
+            self.assertEqual(fsync.call_count, 0)
+            self.assertNotIn(self.file, WriteBehind._files)
+
+            # Deferred to the next batch, the file then its directory
+            self.backend.write(self.file, b"data", 'batch')
+            self.backend.append(self.file, b"more", 'batch')
+            self.assertEqual(fsync.call_count, 0)
+            self.assertIn(self.file, WriteBehind._files)
+
+            WriteBehind.flush()
+            self.assertEqual(fsync.call_count, 1 if os.name == 'nt' else 2)
+            self.assertNotIn(self.file, WriteBehind._files)
+
+            fsync.reset_mock()
+            self.backend.write(self.file, b"data", 'always')
+            self.assertGreaterEqual(fsync.call_count, 1)
+            self.assertNotIn(self.file, WriteBehind._files)
+
+class ExtendedTypesTest(StorageTest):
+    def setUp(self) -> None:
+        super().setUp()
+        self.storage.save({"user": {"name": "a"}, "bots": [{"id": 1}, {"id": 2}]}, "user.slze")
+
+    def test_open_does_not_copy(self) -> None:
+        first = self.storage.open("user.slze")
+        second = self.storage.open("user.slze")
+
+        # Both wrap the payload the cache keeps
+        self.assertIs(first.value, second.value)
+
+        first["user"]["name"] = "b"
+        for bot in first["bots"]:
+            bot["id"] += 10
+
+        # Copied on write: neither the other object nor the cache see it before the save
+        self.assertEqual(second, {"user": {"name": "a"}, "bots": [{"id": 1}, {"id": 2}]})
+        self.assertEqual(self.storage.open("user.slze")["user"]["name"], "a")
+
+        self.assertTrue(self.storage.save(first))
+        self.assertEqual(self.storage.open("user.slze"), {"user": {"name": "b"}, "bots": [{"id": 11}, {"id": 12}]})
+
+    def test_nested_object_keeps_its_identity(self) -> None:
+        data = self.storage.open("user.slze")
+        settings: dict = {}
+
+        data["settings"] = settings
+        data["settings"]["theme"] = "dark"
+        # The object put in the file is still the one the file holds
+        settings["lang"] = "fr"
+
+        self.assertTrue(self.storage.save(data))
+        self.assertEqual(self.storage.open("user.slze")["settings"], {"theme": "dark", "lang": "fr"})
+
+    def test_default_is_not_modified(self) -> None:
+        default: dict = {"count": 0}
+
+        data = self.storage.open("missing.slze", default)
+        data["count"] += 1
+
+        self.assertEqual(default, {"count": 0})
+        self.assertTrue(is_dirty(data))
+
+class DeltaLogTest(StorageTest):
+    def test_patches_are_replayed(self) -> None:
+        self.storage.save(to_extended({"user": {"name": "a"}, "count": 0}), "user.slze")
+
+        self.assertTrue(self.storage.patch("user.slze", ["user", "name"], "b"))
+        self.assertTrue(self.storage.patch("user.slze", "count", 2))
+        self.assertTrue(self.storage.delete_key("user.slze", ["user", "name"]))
+
+        self.assertEqual(self.storage.open("user.slze"), {"user": {}, "count": 2})
+
+    def test_append_does_not_read_the_log(self) -> None:
+        self.storage.save(to_extended({"count": 0}), "user.slze")
+        self.storage.patch("user.slze", "count", 1)
+
+        with mock.patch.object(FileBackend, "read", autospec = True, side_effect = FileBackend.read) as read:
+            for i in range(2, 20):
+                self.assertTrue(self.storage.patch("user.slze", "count", i))
+
+            self.assertFalse([call for call in read.call_args_list if call.args[1].endswith(".delta")])
+
+        self.assertEqual(self.storage.open("user.slze"), {"count": 19})
+
+    def test_log_changed_underneath(self) -> None:
+        self.storage.save(to_extended({"count": 0}), "user.slze")
+        self.storage.patch("user.slze", "count", 1)
+
+        # A torn record left at the end of the log by something else is cut by the next append
+        with open(f"{self.storage.path}user.slze.delta", 'ab') as IOFile:
+            IOFile.write(b"torn")
+
+        self.assertTrue(self.storage.patch("user.slze", "count", 2))
+        self.assertEqual(self.storage.open("user.slze"), {"count": 2})
+
+    def test_compacted_past_the_limit(self) -> None:
+        self.storage.save(to_extended({"count": 0}), "user.slze")
+
+        with mock.patch("Slazhe.Modules.Libs_storage.delta.DeltaLog.Limit", 0):
+            for i in range(1, 5):
+                self.assertTrue(self.storage.patch("user.slze", "count", i))
+
+        self.assertEqual(self.storage.open("user.slze"), {"count": 4})
+        self.assertFalse(os.path.exists(f"{self.storage.path}user.slze.delta"))
+
+class BackendTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.TemporaryDirectory()
+        LoggerConfig.init(Folder = f"{self.folder.name}/Logs/", Level = LogLevels.WARNING)
+        SlazheImporter.SlazheCrypto().config()
+
+    def tearDown(self) -> None:
+        importer.Storage.release(self.folder.name)
+        self.folder.cleanup()
+
+    def test_contract(self) -> None:
+        for name in ("file", "sqlite", "packed"):
+            with self.subTest(backend = name):
+                root: str = f"{self.folder.name}/{name}"
+                backend = Backends.get(name)(root)
+                file: str = os.path.join(root, "sub", "a.slze")
+
+                self.assertIsNone(backend.read(file))
+                self.assertIsNone(backend.stat(file))
+                self.assertFalse(backend.exists(file))
+
+                backend.write(file, b"hello")
+                self.assertEqual(backend.read(file)[0], b"hello")
+                self.assertEqual(backend.head(file, 2), b"he")
+                self.assertEqual(backend.stat(file)[1], 5)
+
+                self.assertEqual(backend.append(file, b" world"), 11)
+                self.assertEqual(backend.read(file)[0], b"hello world")
+                self.assertEqual(backend.names(), [os.path.abspath(file)])
+
+                staged: str = f"{self.folder.name}/staged-{name}"
+                with open(staged, 'wb') as IOFile:
+                    IOFile.write(b"staged")
+
+                backend.write_file(file, staged)
+                self.assertEqual(backend.read(file)[0], b"staged")
+                self.assertFalse(os.path.exists(staged))
+
+                backend.delete(file)
+                self.assertIsNone(backend.read(file))
+                self.assertEqual(backend.names(), [])
+
+    def test_storage_on_sqlite(self) -> None:
+        storage = importer.Storage(f"{self.folder.name}/var/", "test", None, None, codec = "json", encrypt = True, backend = "sqlite")
+
+        storage.save(to_extended({"name": "a", "count": 0}), "users/a.slze")
+        storage.patch("users/a.slze", "count", 1)
+
+        self.assertEqual(storage.open("users/a.slze"), {"name": "a", "count": 1})
+        # Rows, not files
+        self.assertIn("storage.db", os.listdir(storage.path))
+        self.assertFalse(os.path.exists(f"{storage.path}users"))
+
+    def test_migration(self) -> None:
+        path: str = f"{self.folder.name}/var/"
+        storage = importer.Storage(path, "test", None, None, codec = "json", encrypt = True, backend = "file")
+
+        for i in range(10):
+            storage.save(to_extended({"id": i}), f"users/{i}.slze")
+
+        self.assertEqual(migrate_storage([path], "sqlite", remove = True), {path: 10})
+        self.assertFalse(os.path.exists(f"{path}users/0.slze"))
+
+        storage = importer.Storage(path, "test", None, None, codec = "json", encrypt = True, backend = "sqlite")
+        self.assertEqual([storage.open(f"users/{i}.slze") for i in range(10)], [{"id": i} for i in range(10)])
+
+class PackTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.TemporaryDirectory()
+        LoggerConfig.init(Folder = f"{self.folder.name}/Logs/", Level = LogLevels.WARNING)
+
+        self.pack: Pack = Pack(f"{self.folder.name}/segments")
+
+    def tearDown(self) -> None:
+        self.pack.close()
+        self.folder.cleanup()
+
+    def test_compaction(self) -> None:
+        for i in range(100):
+            self.pack.put(f"file-{i}", bytes([i]) * 1000)
+
+        for i in range(0, 100, 2):
+            self.pack.delete(f"file-{i}")
+
+        copy = Pack._Pack__copy
+
+        # Another thread writes while the blobs are copied: the lock is free, its writes are carried over
+        def copying(pack, *args):
+            Index = copy(pack, *args)
+
+            writer = threading.Thread(target = lambda: (pack.put("file-1", b"new"), pack.delete("file-3"), pack.put("late", b"late")))
+            writer.start()
+            writer.join(5)
+
+            self.assertFalse(writer.is_alive())
+            return Index
+
+        with mock.patch.object(Pack, "_Pack__copy", copying):
+            self.pack.compact()
+
+        expected: dict[str, bytes] = {f"file-{i}": bytes([i]) * 1000 for i in range(5, 100, 2)}
+        expected.update({"file-1": b"new", "late": b"late"})
+
+        reopened: Pack = Pack(f"{self.folder.name}/segments")
+
+        for pack in (self.pack, reopened):
+            self.assertEqual(sorted(pack.names()), sorted(expected))
+            self.assertEqual({name: pack.get(name)[0] for name in pack.names()}, expected)
+
+        reopened.close()
+
+        self.assertEqual(len(os.listdir(f"{self.folder.name}/segments")), 1)
+
+    def test_closed_pack_is_opened_again(self) -> None:
+        backend: PackedBackend = PackedBackend(f"{self.folder.name}/var")
+        backend.write(f"{self.folder.name}/var/a.slze", b"data")
+
+        PackedBackend.close(f"{self.folder.name}/var")
+
+        self.assertEqual(backend.read(f"{self.folder.name}/var/a.slze")[0], b"data")
+        PackedBackend.close(f"{self.folder.name}/var")
+
+class LargePayloadTest(unittest.TestCase):
+    """Payloads past StreamEncryptMin and StreamMin, compressed, encrypted and streamed both ways on every backend."""
+
+    def setUp(self) -> None:
+        self.folder = tempfile.TemporaryDirectory()
+        LoggerConfig.init(Folder = f"{self.folder.name}/Logs/", Level = LogLevels.WARNING)
+        SlazheImporter.SlazheCrypto().config()
+
+        self.data: dict = {"users": [{"id": i, "name": f"user {i}", "bio": os.urandom(20).hex()} for i in range(20000)]}
+
+    def tearDown(self) -> None:
+        self.folder.cleanup()
+
+    def test_round_trip(self) -> None:
+        for backend in ("file", "sqlite", "packed"):
+            for codec in ("json", "pickle"):
+                for compression in ("none", "zlib", "lzma", "bz2", "adaptive"):
+                    for password in (None, "password"):
+                        with self.subTest(backend = backend, codec = codec, compression = compression, password = password):
+                            path: str = f"{self.folder.name}/var/{backend}-{codec}-{compression}-{password}/"
+                            storage = importer.Storage(path, "test", None, None, codec = codec, compression = compression, encrypt = True, backend = backend)
+
+                            try:
+                                self.assertTrue(storage.save(to_extended(self.data), "big.slze", password))
+                                self.assertGreater(storage.backend.stat(os.path.abspath(f"{path}big.slze"))[1], 0)
+
+                                # Read back from the backend, not from the cache
+                                ObjectCache.clear()
+                                self.assertEqual(storage.open("big.slze", {}, password), self.data)
+                            finally:
+                                importer.Storage.release(path)
+
+    def test_encoded_past_the_limits(self) -> None:
+        for codec in ("json", "pickle"):
+            with self.subTest(codec = codec):
+                self.assertGreater(len(Codecs.get(codec).encode(to_extended(self.data))), max(importer.Storage.StreamEncryptMin, importer.Storage.StreamMin))
+
+    def test_mapped_read(self) -> None:
+        path: str = f"{self.folder.name}/var/"
+        storage = importer.Storage(path, "test", None, None, codec = "json", compression = "none", encrypt = True, backend = "file")
+
+        try:
+            storage.save(to_extended(self.data), "big.slze")
+            ObjectCache.clear()
+
+            with mock.patch.object(FileBackend, "map", autospec = True, side_effect = FileBackend.map) as mapped:
+                self.assertEqual(storage.open("big.slze", {}), self.data)
+                self.assertEqual(mapped.call_count, 1)
+
+            # Small files are read whole
+            storage.save(to_extended({"name": "a"}), "small.slze")
+            ObjectCache.clear()
+
+            with mock.patch.object(FileBackend, "map", autospec = True, side_effect = FileBackend.map) as mapped:
+                self.assertEqual(storage.open("small.slze", {}), {"name": "a"})
+                self.assertEqual(mapped.call_count, 0)
+        finally:
+            importer.Storage.release(path)
+
+class MissingFilesTest(StorageTest):
+    def test_created_by_another_process(self) -> None:
+        self.assertEqual(self.storage.open("user.slze", {}), {})
+
+        # Written behind the storage's back
+        other = importer.Storage(self.storage.path, "test", None, None, codec = "json", encrypt = True)
+        other.save(to_extended({"name": "a"}), "user.slze")
+        MissingFiles.add(os.path.abspath(f"{self.storage.path}user.slze"))
+
+        self.assertEqual(self.storage.open("user.slze", {}), {})
+
+        with mock.patch("time.monotonic", return_value = 1e12):
+            self.assertEqual(self.storage.open("user.slze", {}), {"name": "a"})
+
+    def test_forget_a_folder(self) -> None:
+        MissingFiles.add(os.path.abspath(f"{self.storage.path}a.slze"))
+        MissingFiles.add(os.path.abspath(f"{self.storage.path}sub/b.slze"))
+        MissingFiles.add(os.path.abspath(f"{self.storage.path[:-1]}-other/c.slze"))
+
+        MissingFiles.forget(self.storage.path)
+
+        self.assertFalse(MissingFiles.has(os.path.abspath(f"{self.storage.path}a.slze")))
+        self.assertFalse(MissingFiles.has(os.path.abspath(f"{self.storage.path}sub/b.slze")))
+        self.assertTrue(MissingFiles.has(os.path.abspath(f"{self.storage.path[:-1]}-other/c.slze")))
+
+    def test_restore_finds_the_files(self) -> None:
+        source = importer.Storage(f"{self.folder.name}/source/", "test", None, None, codec = "json", encrypt = True)
+        source.save(to_extended({"name": "a"}), "user.slze")
+        source.export(f"{self.folder.name}/backup.slzb")
+
+        self.assertEqual(self.storage.open("user.slze", {}), {})
+        self.assertEqual(self.storage.restore(f"{self.folder.name}/backup.slzb"), 1)
+        self.assertEqual(self.storage.open("user.slze", {}), {"name": "a"})
+
+        importer.Storage.release(source.path)
+
+class BackupTest(StorageTest):
+    def test_restore(self) -> None:
+        self.storage.save(to_extended({"name": "a"}), "user.slze")
+
+        # A database in WAL mode, with writes not checkpointed yet
+        database: str = f"{self.storage.path}prefixes.db"
+        connection: sqlite3.Connection = sqlite3.connect(database)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("CREATE TABLE prefixes (guild INTEGER, prefix TEXT)")
+        connection.execute("INSERT INTO prefixes VALUES (1, '!')")
+        connection.commit()
+
+        archive: str = f"{self.folder.name}/backup.slzb"
+        self.assertEqual(self.storage.export(archive, "secret"), 2)
+
+        connection.execute("UPDATE prefixes SET prefix = '?'")
+        connection.commit()
+        connection.close()
+        self.storage.save(to_extended({"name": "b"}), "user.slze")
+
+        self.assertEqual(self.storage.restore(archive, "wrong"), -1)
+        self.assertEqual(self.storage.open("user.slze", {}), {"name": "b"})
+
+        self.assertEqual(self.storage.restore(archive, "secret"), 2)
+        self.assertEqual(self.storage.open("user.slze", {}), {"name": "a"})
+
+        connection = sqlite3.connect(database)
+        self.assertEqual(connection.execute("SELECT prefix FROM prefixes").fetchall(), [("!",)])
+        connection.close()
+
+if __name__ == "__main__":
+    unittest.main()
+
+# Version Globale: v00.00.00.pl
+# Version du fichier: v00.00.00.0i